@@ -1,72 +1,554 @@
 #!/usr/bin/env python
-import os, datetime, shutil, argparse
-from Scripts import utils, run, downloader, plist
+import os, sys, time, json, shutil, argparse, tempfile, binascii, hashlib, importlib
+from Scripts.timing import timer, timed
 
-class RGB:
+class _LazyModule(object):
+    # Stands in for one of our helper modules and only imports it on first
+    # attribute access - keeps --help and cached runs from paying for ssl,
+    # urllib, etc. up front
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+utils, run, downloader, plist, backup, edid, store, sources, bundle = [
+    _LazyModule("Scripts."+x) for x in ("utils","run","downloader","plist","backup","edid","store","sources","bundle")
+]
+
+class RGBError(Exception):
+    pass
+
+class RGB(object):
     def __init__(self):
-        self.u = utils.Utils("ForceRGB")
-        self.d = downloader.Downloader()
-        self.r = run.Run()
         self.url = "https://gist.githubusercontent.com/adaugherity/7435890/raw/3403436446665aec2b5cf423ea4a5af63125e5af/patch-edid.rb"
         self.scripts = "Scripts"
-        if self.r.run({"args":["sw_vers","-productVersion"]})[0].strip() < "10.15":
-            self.dest = "/System/Library/Displays/Contents/Resources/Overrides"
-        else:
-            self.dest = "/Library/Displays/Contents/Resources/Overrides"
+        self.offline = False
+        # Per-command timeout in seconds, and a time.time() deadline for
+        # every command - both passed along to Run
+        self.timeout = self.deadline = None
+        # Fixture paths to record commands to, or replay them from - see Run
+        self.record = self.replay = None
+        # Where to look for the patch script, in order - see Scripts/sources.py.
+        # The pick is cached in the artifact store for resolve_ttl seconds.
+        self.mirrors = ["gist"]
+        self.resolve_timeout = 5
+        self.resolve_ttl = 3600
+        # Shared downloader.RateLimiter for every download, if any
+        self.limiter = None
+        self._u = self._d = self._r = self._b = self._store = self._dest = None
+
+    # Helpers are created on first use, so paths that never touch the network
+    # or the UI never build an SSL context or probe sw_vers
+
+    @property
+    def u(self):
+        if self._u is None:
+            self._u = utils.Utils("ForceRGB")
+        return self._u
+
+    @property
+    def d(self):
+        if self._d is None:
+            self._d = downloader.Downloader(limiter=self.limiter)
+        return self._d
+
+    @property
+    def r(self):
+        if self._r is None:
+            self._r = run.Run(timeout=self.timeout, deadline=self.deadline)
+            if self.replay:
+                self._r.replay(self.replay)
+            elif self.record:
+                self._r.record(self.record)
+        return self._r
 
-    def _get_latest_url(self):
-        # Queries https://gist.github.com/adaugherity/7435890 directly and parses for
-        # the latest revision
+    @property
+    def b(self):
+        if self._b is None:
+            self._b = backup.BackupStore(os.path.join(os.path.dirname(os.path.realpath(__file__)), "Backups"))
+        return self._b
+
+    @property
+    def store(self):
+        if self._store is None:
+            self._store = store.ArtifactStore(os.path.join(os.path.dirname(os.path.realpath(__file__)), "Store"))
+        return self._store
+
+    @property
+    def dest(self):
+        if self._dest is None:
+            if self.r.run({"args":["sw_vers","-productVersion"]})[0].strip() < "10.15":
+                self._dest = "/System/Library/Displays/Contents/Resources/Overrides"
+            else:
+                self._dest = "/Library/Displays/Contents/Resources/Overrides"
+        return self._dest
+
+    @dest.setter
+    def dest(self, value):
+        self._dest = value
+
+    def _resolver(self):
+        # Probes get their own socket timeout, but share the rate limits and
+        # (if it's been built) the SSL context with the main downloader
+        d = downloader.Downloader(timeout=self.resolve_timeout, limiter=self.limiter)
+        if self._d is not None:
+            d.ssl_context = self._d._ssl_context
+        return sources.Resolver(
+            self.mirrors,
+            timeout=self.resolve_timeout,
+            ttl=self.resolve_ttl,
+            cache_path=os.path.join(self.store.root, "resolved.json"),
+            d=d
+        )
+
+    @timed("rgb.get_latest_url")
+    def _get_latest_url(self, resolver=None):
+        # Asks the configured mirrors for the latest revision of the script
         print("Locating the latest revision of the patch edid script...")
-        source_url = "https://gist.github.com/adaugherity/7435890"
-        latest_url = revision = None
-        try:
-            source_html = self.d.get_string(source_url,progress=False)
-            revision_primed = False
-            for line in source_html.split("\n"):
-                if '<a href="/adaugherity/7435890/raw/' in line:
-                    latest_url = "https://gist.githubusercontent.com{}".format(line.split('"')[1].split('"')[0])
-                elif line.strip() == "Revisions":
-                    revision_primed = True
-                elif revision_primed and 'class="Counter">' in line:
-                    revision = line.split('class="Counter">')[1].split("<")[0]
-                    revision_primed = False
-                if latest_url and revision:
-                    break # Got what we needed, bail
-        except:
-            pass
-        if latest_url:
-            print(" - Located {}{}".format(
-                os.path.basename(latest_url),
-                "" if not revision else " revision {}".format(revision)
+        resolved = (resolver or self._resolver()).resolve()
+        if resolved:
+            print(" - Located {} from {}{}".format(
+                os.path.basename(resolved["url"]),
+                resolved["source"],
+                "" if not resolved.get("revision") else " revision {}".format(resolved["revision"])
             ))
-            return latest_url
+            return resolved["url"]
         print(" - Not located, using the last known revision...")
         return self.url
 
-    def _get_timestamp(self):
-        return "-{:%Y-%m-%d %H.%M.%S}".format(datetime.datetime.now())
-
     def _download(self, url, dest):
         print("Downloading {}...".format(os.path.basename(url)))
-        self.d.stream_to_file(url, os.path.join(dest,os.path.basename(url)), False)
+        target = os.path.join(dest,os.path.basename(self.url))
+        if not "://" in url:
+            # A local or shared mirror
+            try:
+                shutil.copyfile(url, target)
+            except (IOError, OSError) as e:
+                print(" - Could not copy {}: {}".format(url,e))
+            return
+        self.d.stream_to_file(url, target, False)
 
+    @timed("rgb.check_script")
     def _check_script(self):
         s_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), self.scripts)
         s_name = os.path.basename(self.url)
         if not os.path.exists(os.path.join(s_path,s_name)):
-            # Try to download
-            latest_url = self._get_latest_url()
-            self._download(latest_url, s_path)
+            # Check the artifact store before reaching out to the network
+            stored = self.store.path(s_name)
+            if stored:
+                print("Using stored {} version {}...".format(s_name,self.store.current(s_name)))
+                shutil.copyfile(stored, os.path.join(s_path,s_name))
+            elif self.offline:
+                print("{} is not in the artifact store and we're offline.".format(s_name))
+            else:
+                # Try to download - and keep a copy for the next cold start
+                resolver = self._resolver()
+                latest_url = self._get_latest_url(resolver)
+                self._download(latest_url, s_path)
+                if os.path.exists(os.path.join(s_path,s_name)):
+                    self._store_script(os.path.join(s_path,s_name), latest_url)
+                else:
+                    # Don't keep pointing at a mirror we couldn't fetch from
+                    resolver.invalidate()
         if os.path.exists(os.path.join(s_path,s_name)):
             return os.path.join(s_path,s_name)
         return None
 
+    def _store_script(self, path, url=None):
+        # Versions are the gist revision from raw urls when we have one, and
+        # the content hash otherwise
+        version = None
+        if url and "/raw/" in url:
+            version = url.split("/raw/")[1].split("/")[0] or None
+        try:
+            return self.store.add(os.path.basename(path), path, version=version, source=url)
+        except Exception as e:
+            print(" - Could not add {} to the artifact store: {}".format(os.path.basename(path),e))
+
+    def _template(self):
+        # Returns the override template from the artifact store, if any
+        path = self.store.path("override-template.plist")
+        if not path:
+            return None
+        try:
+            with open(path,"rb") as f:
+                return plist.load(f)
+        except Exception as e:
+            raise RGBError("Failed to load the override template: {}".format(e))
+
+    def seed_store(self, path):
+        # Adds a patch script, an override template plist, or the contents of
+        # another artifact store
+        if os.path.isdir(path):
+            print("Seeded {:,} artifact version(s) from {}".format(self.store.seed(path),path))
+            return
+        if not os.path.isfile(path):
+            print("{} does not exist.".format(path))
+            exit(1)
+        if path.lower().endswith(".plist"):
+            try:
+                with open(path,"rb") as f:
+                    if not isinstance(plist.load(f),dict):
+                        raise ValueError("Root is not a dictionary")
+            except Exception:
+                print("{} is not a valid override template.".format(path))
+                exit(1)
+            version = self.store.add("override-template.plist",path,source=path)
+            print("Stored override-template.plist version {}".format(version))
+            return
+        version = self.store.add(os.path.basename(self.url),path,source=path)
+        print("Stored {} version {}".format(os.path.basename(self.url),version))
+
+    def _failure(self, out):
+        if getattr(out, "timed_out", False):
+            return "Timed out"
+        if getattr(out, "cancelled", False):
+            return "Cancelled"
+        return out[1].strip() or "Command returned {}".format(out[2])
+
     def _check_out(self, out, prefix=" - "):
         if out[2] != 0:
-            print("{}Failed: {}".format(prefix,out[1]))
+            print("{}Failed: {}".format(prefix,self._failure(out)))
+            exit(1)
+
+    def _require(self, out):
+        # Raising counterpart to _check_out for the non-interactive paths
+        if out[2] != 0:
+            raise RGBError(self._failure(out))
+
+    def _ensure_dest(self, dest=None):
+        dest = dest or self.dest
+        if not os.path.isdir(dest):
+            self._require(self.r.run({"args":["mkdir","-p",dest],"sudo":True}))
+
+    def _store_backup(self, name, dest=None):
+        # Stores the existing override in our backup store, then removes it
+        # so the new copy lands in a clean folder
+        dest = dest or self.dest
+        try:
+            gen = self.b.add(os.path.join(dest,name))
+        except Exception as e:
+            raise RGBError("Backup failed: {}".format(e))
+        self._require(self.r.run({"args":["rm","-rf",os.path.join(dest,name)],"sudo":True}))
+        return gen
+
+    @timed("rgb.install")
+    def _install(self, src, name, dest=None):
+        # Merges the override files in the folder at src into dest/name.  Only
+        # the files passed in are replaced - other products' overrides under
+        # the same vendor folder are left alone.  If any are replaced, the
+        # folder is backed up first.  Returns the backup generation, or None
+        # if nothing was replaced.
+        dest = dest or self.dest
+        target = os.path.join(dest,name)
+        if not os.path.isdir(target):
+            self._require(self.r.run({"args":["cp","-r",src,target],"sudo":True}))
+            return None
+        files = sorted(os.listdir(src))
+        gen = None
+        if any(os.path.exists(os.path.join(target,f)) for f in files):
+            try:
+                gen = self.b.add(target)
+            except Exception as e:
+                raise RGBError("Backup failed: {}".format(e))
+        self._require(self.r.run({"args":["cp"]+[os.path.join(src,f) for f in files]+[target],"sudo":True}))
+        return gen
+
+    def _backup(self, name, prefix=" - "):
+        print("{}Backing up to the generation store...".format(prefix))
+        try:
+            gen = self._store_backup(name)
+        except RGBError as e:
+            print("{}Failed: {}".format(prefix,e))
+            exit(1)
+        print("{}Stored as generation {}".format(prefix,gen))
+        return gen
+
+    def _ioreg(self):
+        out = self.r.run({"args":["ioreg","-l","-w0","-d0","-r","-c","AppleDisplay"]})
+        self._require(out)
+        return out[0]
+
+    def get_displays(self):
+        # Returns the display dicts for all attached displays that report an EDID
+        return edid.parse_ioreg(self._ioreg())
+
+    def _load_watch_state(self, path):
+        try:
+            with open(path,"r") as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return {}
+
+    def _save_watch_state(self, path, state):
+        folder = os.path.dirname(path)
+        if folder and not os.path.isdir(folder):
+            os.makedirs(folder)
+        utils.atomic_write(path,json.dumps(state,indent=2,sort_keys=True))
+
+    def watch(self, display_is_tv=None, dest=None, interval=2.0, polls=None, as_json=False, state_path=None):
+        # Daemon mode - polls ioreg every interval seconds and installs
+        # overrides (through apply()) only for displays whose EDID hash we
+        # haven't applied yet.  Unchanged ioreg output is skipped before any
+        # parsing, so a quiet poll costs one ioreg call and a hash.  Applied
+        # hashes are kept in state_path so restarts don't redo them, unless
+        # the override has since been removed.  Stops after polls checks if
+        # set - with --replay, the recorded ioreg outputs are served in
+        # order, which makes a scripted hot-plug sequence.  Returns the exit code.
+        dest = dest or self.dest
+        state_path = state_path or os.path.join(self.store.root,"watch.json")
+        state = self._load_watch_state(state_path)
+        # Anything whose override has since been removed gets applied again
+        applied = dict((h,a) for h,a in state.get(dest,{}).items() if os.path.exists(a["path"]))
+        attached = {}
+        last = None
+        count = failed = 0
+        def report(event, **info):
+            info["event"] = event
+            if as_json:
+                print(json.dumps(info,sort_keys=True))
+            elif event == "error":
+                sys.stderr.write("{}\n".format(info["error"]))
+            elif event == "applied":
+                print("{} -> {}".format(info["name"],info["path"]))
+            elif event == "removed":
+                print("{} removed".format(info["name"]))
+            sys.stdout.flush()
+        try:
+            while polls is None or count < polls:
+                if count:
+                    time.sleep(interval)
+                count += 1
+                try:
+                    output = self._ioreg()
+                except RGBError as e:
+                    report("error",error=str(e))
+                    failed += 1
+                    last = None
+                    continue
+                digest = hashlib.sha256(output.encode("utf-8")).hexdigest()
+                if digest == last:
+                    continue # Nothing plugged or unplugged
+                last = digest
+                current = {}
+                for d in edid.parse_ioreg(output):
+                    current[hashlib.sha256(d["edid"]).hexdigest()] = d
+                for h in sorted(set(attached)-set(current)):
+                    report("removed",hash=h,name=edid.display_name(attached[h]["edid"]))
+                attached = current
+                new = [h for h in sorted(current) if not h in applied]
+                if not new:
+                    continue
+                try:
+                    results = self.apply([current[h] for h in new], display_is_tv=display_is_tv, dest=dest)
+                except RGBError as e:
+                    report("error",error=str(e))
+                    failed += 1
+                    last = None # Try these again next poll
+                    continue
+                # Results come back grouped by folder - match them up by id
+                by_id = dict(((r["vendor_id"],r["product_id"]),r) for r in results)
+                for h in new:
+                    r = by_id[(current[h]["vendor_id"],current[h]["product_id"])]
+                    applied[h] = {"name":r["name"],"path":r["path"],"time":time.time()}
+                    report("applied",hash=h,**r)
+                state[dest] = applied
+                self._save_watch_state(state_path,state)
+        except KeyboardInterrupt:
+            pass
+        return 1 if failed else 0
+
+    @timed("rgb.apply")
+    def apply(self, edids, display_is_tv=None, dest=None):
+        # Library entry point - builds the overrides for the passed EDIDs (raw
+        # bytes, hex strings, or display dicts from edid.parse_ioreg) and
+        # installs them in dest without any prompts or screen work.  Returns a
+        # list of result dicts and raises RGBError on failure.
+        dest = dest or self.dest
+        try:
+            displays = [x if isinstance(x,dict) else edid.display(x) for x in edids]
+        except (ValueError, TypeError, IndexError) as e:
+            raise RGBError("Invalid EDID: {}".format(e))
+        if not displays:
+            return []
+        template = self._template()
+        staging = tempfile.mkdtemp(prefix="ForceRGB-")
+        folders = {}
+        results = []
+        try:
+            for d in displays:
+                try:
+                    override = edid.build_override(d, display_is_tv, template=template)
+                except (ValueError, TypeError, IndexError) as e:
+                    raise RGBError("Invalid EDID: {}".format(e))
+                name = edid.folder_name(d)
+                folder = os.path.join(staging,name)
+                if not os.path.isdir(folder):
+                    os.makedirs(folder)
+                target = os.path.join(folder,edid.file_name(d))
+                patched = override["IODisplayEDID"]
+                override["IODisplayEDID"] = plist.wrap_data(patched)
+                with open(target,"wb") as f:
+                    plist.dump(override,f)
+                folders.setdefault(name,[]).append({
+                    "vendor_id": d["vendor_id"],
+                    "product_id": d["product_id"],
+                    "name": override["DisplayProductName"],
+                    "edid": binascii.hexlify(patched).decode("ascii"),
+                    "path": os.path.join(dest,name,os.path.basename(target))
+                })
+            self._ensure_dest(dest)
+            for name in sorted(folders):
+                gen = self._install(os.path.join(staging,name), name, dest)
+                for r in folders[name]:
+                    r["backup"] = gen
+                    results.append(r)
+        finally:
+            shutil.rmtree(staging,ignore_errors=True)
+        return results
+
+    def batch(self, display_is_tv=None, edids=None, dest=None, as_json=False):
+        # Non-interactive pipeline - no screen clearing, prompts or exit()
+        # calls.  Returns the process exit code.
+        result = {"status":"ok","dest":dest}
+        try:
+            result["dest"] = dest = dest or self.dest
+            displays = edids or self.get_displays()
+            if not displays:
+                raise RGBError("No displays reporting an EDID were found")
+            result["displays"] = self.apply(displays, display_is_tv=display_is_tv, dest=dest)
+        except RGBError as e:
+            result["status"] = "error"
+            result["error"] = str(e)
+        if as_json:
+            print(json.dumps(result,indent=2))
+        elif result["status"] == "ok":
+            for r in result["displays"]:
+                print("{} -> {}".format(r["name"],r["path"]))
+        else:
+            sys.stderr.write("{}\n".format(result["error"]))
+        return 0 if result["status"] == "ok" else 1
+
+    def export_bundle(self, path, dest=None):
+        # Bundles the overrides in dest into a single file for apply_bundle()
+        # on other machines.  Returns the bundle's manifest.
+        dest = dest or self.dest
+        if not os.path.isdir(dest):
+            raise RGBError("{} does not exist".format(dest))
+        try:
+            manifest, skipped = bundle.export(dest, path)
+        except (IOError, OSError) as e:
+            raise RGBError("Failed to write {}: {}".format(path,e))
+        for file_path, reason in skipped:
+            sys.stderr.write("Skipped {}: {}\n".format(file_path,reason))
+        return manifest
+
+    @timed("rgb.apply_bundle")
+    def apply_bundle(self, path, dest=None, replace=False):
+        # Installs a bundle made by export_bundle().  Its files are merged
+        # into dest - or with replace, whole vendor folders are swapped in -
+        # by one process: this one if we can write to dest, or one sudo call
+        # if not, instead of an rm and a cp -r per folder.  Each vendor
+        # folder that has something replaced is backed up first.  Returns
+        # the installed paths and raises RGBError on failure.
+        dest = dest or self.dest
+        try:
+            with bundle.Bundle(path) as b:
+                folders = b.folders()
+        except bundle.BundleError as e:
+            raise RGBError(str(e))
+        for name in sorted(folders):
+            target = os.path.join(dest,name)
+            if not os.path.exists(target):
+                continue
+            if replace or any(os.path.exists(os.path.join(target,rel.split("/")[1])) for rel in folders[name]):
+                try:
+                    self.b.add(target)
+                except Exception as e:
+                    raise RGBError("Backup failed: {}".format(e))
+        parent = dest if os.path.isdir(dest) else os.path.dirname(dest)
+        if os.access(parent, os.W_OK):
+            try:
+                return bundle.install(path, dest, replace=replace)
+            except (bundle.BundleError, IOError, OSError) as e:
+                raise RGBError("Install failed: {}".format(e))
+        script = os.path.join(os.path.dirname(os.path.realpath(__file__)),self.scripts,"bundle.py")
+        out = self.r.run({"args":[sys.executable,script,"apply",os.path.abspath(path),dest,"--json"]+(["--replace"] if replace else []),"sudo":True})
+        try:
+            result = json.loads(out[0])
+        except ValueError:
+            raise RGBError(self._failure(out))
+        if result.get("status") != "ok":
+            raise RGBError(result.get("error","Install failed"))
+        return result["installed"]
+
+    def list_backups(self):
+        gens = self.b.generations()
+        if not gens:
+            print("No backups found.")
+            return
+        for g in gens:
+            print("{:>5}  {}  {} ({:,} file{})".format(
+                g["id"],
+                g["timestamp"],
+                g["name"],
+                len(g["files"]),
+                "" if len(g["files"]) == 1 else "s"
+            ))
+
+    def diff_backup(self, gen, other=None):
+        try:
+            lines = self.b.diff(gen, other=other, dest=self.dest)
+        except ValueError as e:
+            print(e)
+            exit(1)
+        if not lines:
+            print("No differences.")
+        for line in lines:
+            print(line)
+
+    def restore_backup(self, gen):
+        info = self.b.get(gen)
+        if not info:
+            print("Generation {} does not exist.".format(gen))
+            exit(1)
+        print("Restoring generation {} ({})...".format(info["id"],info["name"]))
+        staged = self.b.stage(gen)
+        try:
+            if not os.path.isdir(self.dest):
+                print(" - {} does not exist, attempting to create...".format(self.dest))
+                out = self.r.run({"args":["mkdir","-p",self.dest],"sudo":True})
+                self._check_out(out,prefix=" --> ")
+            if os.path.exists(os.path.join(self.dest,info["name"])):
+                self._backup(info["name"])
+            print(" - Copying...")
+            out = self.r.run({"args":["cp","-r",staged,os.path.join(self.dest,info["name"])],"sudo":True})
+            self._check_out(out,prefix=" --> ")
+        finally:
+            shutil.rmtree(os.path.dirname(staged),ignore_errors=True)
+        print("Done.")
+
+    def _rewrite_plist(self, target, key, value):
+        try:
+            with open(target,"rb") as f:
+                p_data = plist.load(f)
+        except Exception:
+            print(" -> Failed to open {}.  Aborting...".format(os.path.basename(target)))
+            exit(1)
+        # Set the prop and write the file
+        p_data[key] = value
+        try:
+            with open(target,"wb") as f:
+                plist.dump(p_data,f)
+        except Exception:
+            print(" -> Failed to save {}.  Aborting...".format(os.path.basename(target)))
             exit(1)
 
+    @timed("rgb.main")
     def main(self, display_is_tv="prompt"):
         s_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), self.scripts)
         self.u.head()
@@ -154,23 +636,16 @@ class RGB:
                     if not os.path.isfile(target):
                         print(" -> {} not found.  Aborting...".format(os.path.basename(target)))
                     try:
-                        with open(target,"rb") as f:
-                            p_data = plist.load(f)
-                    except Exception:
-                        print(" -> Failed to open {}.  Aborting...".format(os.path.basename(target)))
-                        exit(1)
-                    # Set the prop and write the file
-                    p_data["DisplayIsTV"] = display_is_tv
-                    try:
-                        with open(target,"wb") as f:
-                            plist.dump(p_data,f)
+                        # Splice in just the one entry - leaves the rest of the
+                        # file byte-for-byte as the patch script wrote it
+                        plist.edit_file(target,"DisplayIsTV",display_is_tv)
                     except Exception:
-                        print(" -> Failed to save {}.  Aborting...".format(os.path.basename(target)))
-                        exit(1)
+                        # Not an XML plist we can edit in place - fall back on
+                        # a full load and dump
+                        self._rewrite_plist(target,"DisplayIsTV",display_is_tv)
                 if os.path.exists(os.path.join(self.dest, d)):
                     print(" - Already exists at destination.")
-                    print(" - Backing up with timestamp...")
-                    self.r.run({"args":["mv",os.path.join(self.dest,d),os.path.join(self.dest,d+self._get_timestamp())],"sudo":True})
+                    self._backup(d)
                 print(" - Copying...")
                 out = self.r.run({"args":["cp","-r",os.path.join(s_path,d),os.path.join(self.dest,d)],"sudo":True})
                 self._check_out(out,prefix=" --> ")
@@ -189,7 +664,215 @@ if __name__ == "__main__":
             " - accepts prompt, none, true, or false - default is prompt"
         )
     )
+    parser.add_argument(
+        "-l",
+        "--list-backups",
+        help="lists the override generations in the backup store",
+        action="store_true"
+    )
+    parser.add_argument(
+        "--diff-backup",
+        help=(
+            "shows the differences between a backup generation and the installed"
+            " override - or a second generation if one is passed"
+        ),
+        nargs="+",
+        metavar="GENERATION"
+    )
+    parser.add_argument(
+        "--restore-backup",
+        help="restores the passed backup generation to the overrides folder",
+        metavar="GENERATION"
+    )
+    parser.add_argument(
+        "-b",
+        "--batch",
+        help=(
+            "runs without prompts or screen output using the built-in patch logic"
+            " - prompt is treated as none"
+        ),
+        action="store_true"
+    )
+    parser.add_argument(
+        "-j",
+        "--json",
+        help="implies --batch and prints the results as JSON",
+        action="store_true"
+    )
+    parser.add_argument(
+        "-e",
+        "--edid",
+        help=(
+            "a hex EDID or path to an EDID file to patch in batch mode instead of"
+            " the attached displays - can be passed more than once"
+        ),
+        action="append"
+    )
+    parser.add_argument(
+        "--export-bundle",
+        help="saves the installed overrides to a single bundle file for --apply-bundle on other machines",
+        metavar="PATH"
+    )
+    parser.add_argument(
+        "--apply-bundle",
+        help="installs the overrides from a bundle made with --export-bundle, backing up any it replaces",
+        metavar="PATH"
+    )
+    parser.add_argument(
+        "-w",
+        "--watch",
+        help=(
+            "keeps running and installs overrides for displays as they're attached - implies"
+            " --batch, and --json prints one JSON line per event"
+        ),
+        action="store_true"
+    )
+    parser.add_argument(
+        "--interval",
+        help="how often --watch checks the attached displays - default is 2",
+        type=float,
+        default=2.0,
+        metavar="SECONDS"
+    )
+    parser.add_argument(
+        "--polls",
+        help="stops --watch after this many checks - with --replay, runs through the recorded displays",
+        type=int,
+        metavar="COUNT"
+    )
+    parser.add_argument(
+        "--dest",
+        help="overrides the destination Overrides folder"
+    )
+    parser.add_argument(
+        "-o",
+        "--offline",
+        help="never reaches out to the network - the patch script must be in the artifact store",
+        action="store_true"
+    )
+    parser.add_argument(
+        "-m",
+        "--mirror",
+        help=(
+            "a patch-edid.rb path or folder, an http(s) URL, or gist[:ID] to get the patch"
+            " script from - tried in order, can be passed more than once - default is gist"
+        ),
+        action="append"
+    )
+    parser.add_argument(
+        "--limit-rate",
+        help="caps downloads at this many bytes per second - accepts K, M and G suffixes, e.g. 512K",
+        metavar="RATE"
+    )
+    parser.add_argument(
+        "--limit-requests",
+        help="caps downloads at this many requests per second",
+        type=float,
+        metavar="COUNT"
+    )
+    parser.add_argument(
+        "--seed-store",
+        help=(
+            "adds a patch-edid.rb script, an override template plist, or the contents"
+            " of another artifact store folder to the local artifact store"
+        ),
+        metavar="PATH"
+    )
+    parser.add_argument(
+        "-t",
+        "--timeout",
+        help="kills any command (and everything it started) that runs longer than this many seconds",
+        type=float,
+        metavar="SECONDS"
+    )
+    parser.add_argument(
+        "--deadline",
+        help="kills any command still running this many seconds after start, and skips the rest",
+        type=float,
+        metavar="SECONDS"
+    )
+    parser.add_argument(
+        "--record",
+        help="saves every command ForceRGB runs, with its output and timing, to a fixture at the passed path",
+        metavar="PATH"
+    )
+    parser.add_argument(
+        "--replay",
+        help="serves commands from a fixture saved with --record instead of running them",
+        metavar="PATH"
+    )
+    parser.add_argument(
+        "-p",
+        "--profile",
+        help="records where the run spends its time and saves it to the passed path on exit",
+        metavar="PATH"
+    )
+    parser.add_argument(
+        "--profile-format",
+        help="the format to save --profile in - accepts json or chrome - default is json",
+        choices=("json","chrome"),
+        default="json"
+    )
     args = parser.parse_args()
+    if args.profile:
+        # Save on any exit - main() and the error paths all leave via exit()
+        import atexit
+        timer.enable()
+        atexit.register(timer.save, os.path.abspath(args.profile), args.profile_format)
+    r = RGB()
+    r.offline = args.offline
+    if args.mirror:
+        r.mirrors = args.mirror
+    if args.limit_rate or args.limit_requests:
+        try:
+            rate = downloader.parse_rate(args.limit_rate) if args.limit_rate else None
+        except ValueError:
+            print("{} is not a valid rate.".format(args.limit_rate))
+            exit(1)
+        r.limiter = downloader.RateLimiter(bytes_per_second=rate, requests_per_second=args.limit_requests)
+    r.timeout = args.timeout
+    if args.replay and not os.path.isfile(args.replay):
+        print("{} does not exist.".format(args.replay))
+        exit(1)
+    r.record = args.record
+    r.replay = args.replay
+    if args.deadline:
+        r.deadline = time.time() + args.deadline
+    if args.dest:
+        r.dest = args.dest
+    if args.seed_store:
+        r.seed_store(args.seed_store)
+        exit(0)
+    if args.export_bundle or args.apply_bundle:
+        try:
+            if args.export_bundle:
+                manifest = r.export_bundle(args.export_bundle)
+                result = {"status":"ok","bundle":args.export_bundle,"displays":sorted(manifest["entries"])}
+                message = "Bundled {:,} display(s) into {}".format(len(manifest["entries"]),args.export_bundle)
+            else:
+                result = {"status":"ok","bundle":args.apply_bundle,"installed":r.apply_bundle(args.apply_bundle)}
+                message = "\n".join(result["installed"])
+        except RGBError as e:
+            result = {"status":"error","error":str(e)}
+            message = None
+        if args.json:
+            print(json.dumps(result,indent=2))
+        elif message is None:
+            sys.stderr.write("{}\n".format(result["error"]))
+        else:
+            print(message)
+        exit(0 if result["status"] == "ok" else 1)
+    if args.list_backups or args.diff_backup or args.restore_backup:
+        if args.list_backups:
+            r.list_backups()
+        elif args.diff_backup:
+            if len(args.diff_backup) > 2:
+                print("--diff-backup accepts at most 2 generations.")
+                exit(1)
+            r.diff_backup(*args.diff_backup)
+        else:
+            r.restore_backup(args.restore_backup)
+        exit(0)
     display_is_tv = "prompt"
     if args.display_is_tv:
         # Make sure it's valid
@@ -206,5 +889,23 @@ if __name__ == "__main__":
             # Didn't get a valid value - throw an error
             print("Invalid value for --display-is-tv:\n  Only prompt, none, true, or false can be passed.")
             exit(1)
-    r = RGB()
+    if args.watch:
+        exit(r.watch(
+            display_is_tv=None if display_is_tv == "prompt" else display_is_tv,
+            interval=args.interval,
+            polls=args.polls,
+            as_json=args.json
+        ))
+    if args.batch or args.json:
+        edids = []
+        for e in args.edid or []:
+            if os.path.isfile(e):
+                with open(e,"rb") as f:
+                    e = f.read()
+            edids.append(e)
+        exit(r.batch(
+            display_is_tv=None if display_is_tv == "prompt" else display_is_tv,
+            edids=edids,
+            as_json=args.json
+        ))
     r.main(display_is_tv=display_is_tv)
@@ -0,0 +1,257 @@
+import os, zlib, asyncio
+from urllib.parse import urlsplit, urljoin
+from .timing import timer
+
+# Concurrent downloads on asyncio streams - stdlib only, Python 3 only (the
+# synchronous Downloader stays the Python 2 compatible path).  Concurrency is
+# capped overall and per host, and stream_to_file keeps Downloader's resume
+# and size check behaviour:
+#   d = AsyncDownloader(concurrency=8, per_host=4)
+#   results = d.download_all([(url, path), ...])
+
+class HTTPError(Exception):
+    pass
+
+class _Response(object):
+    def __init__(self, status, headers, reader, writer):
+        self.status = status
+        self.headers = headers
+        self.reader = reader
+        self.writer = writer
+
+    def close(self):
+        self.writer.close()
+
+class AsyncDownloader(object):
+
+    def __init__(self, concurrency = 8, per_host = 4, useragent = None, ssl_context = None, timeout = 30, chunk = 65536, max_redirects = 5, limiter = None):
+        self.ua = useragent or {"User-Agent":"Mozilla"}
+        self.concurrency = concurrency
+        self.per_host = per_host
+        self.timeout = timeout
+        self.chunk = chunk
+        self.max_redirects = max_redirects
+        # Optional downloader.RateLimiter - can be shared with sync Downloaders
+        self.limiter = limiter
+        self._ssl_context = ssl_context
+        # Semaphores belong to the running loop - built in _limits()
+        self._loop = self._semaphore = None
+        self._hosts = {}
+
+    @property
+    def ssl_context(self):
+        if self._ssl_context is None:
+            # Same CA handling as Downloader
+            from .downloader import Downloader
+            self._ssl_context = Downloader().ssl_context
+        return self._ssl_context
+
+    @ssl_context.setter
+    def ssl_context(self, value):
+        self._ssl_context = value
+
+    def _limits(self, host):
+        # Returns (per_host, total) - take them in that order, so a job
+        # waiting on a busy host doesn't hold a slot other hosts could use
+        loop = asyncio.get_running_loop() if hasattr(asyncio, "get_running_loop") else asyncio.get_event_loop()
+        if loop is not self._loop:
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+            self._hosts = {}
+        if not host in self._hosts:
+            self._hosts[host] = asyncio.Semaphore(self.per_host)
+        return (self._hosts[host], self._semaphore)
+
+    async def _wait(self, awaitable):
+        return await asyncio.wait_for(awaitable, self.timeout)
+
+    async def _throttle(self, bytes = 0, requests = 0):
+        if self.limiter:
+            delay = self.limiter.reserve(bytes, requests)
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+    async def open_url(self, url, headers = None):
+        if timer.enabled:
+            with timer.span("async_downloader.open_url", url=url):
+                return await self._open_url(url, headers)
+        return await self._open_url(url, headers)
+
+    async def _open_url(self, url, headers = None):
+        # Sends a GET and returns the _Response once the headers are in,
+        # following redirects
+        headers = dict(headers or self.ua)
+        for _ in range(self.max_redirects + 1):
+            await self._throttle(requests=1)
+            parts = urlsplit(url)
+            https = parts.scheme == "https"
+            port = parts.port or (443 if https else 80)
+            reader, writer = await self._wait(asyncio.open_connection(
+                parts.hostname, port,
+                ssl=self.ssl_context if https else None,
+                server_hostname=parts.hostname if https else None
+            ))
+            path = (parts.path or "/") + ("?" + parts.query if parts.query else "")
+            request = ["GET {} HTTP/1.1".format(path), "Host: {}".format(parts.netloc)]
+            request.extend("{}: {}".format(k, v) for k, v in headers.items() if k.lower() not in ("host","connection"))
+            request.append("Connection: close")
+            writer.write(("\r\n".join(request) + "\r\n\r\n").encode("latin-1"))
+            await self._wait(writer.drain())
+            status_line = await self._wait(reader.readline())
+            try:
+                status = int(status_line.split()[1])
+            except (IndexError, ValueError):
+                writer.close()
+                raise HTTPError("Bad status line from {}: {!r}".format(url, status_line))
+            response_headers = {}
+            while True:
+                line = await self._wait(reader.readline())
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                k, _, v = line.decode("latin-1").partition(":")
+                response_headers[k.strip().lower()] = v.strip()
+            if status in (301, 302, 303, 307, 308) and "location" in response_headers:
+                writer.close()
+                url = urljoin(url, response_headers["location"])
+                continue
+            return _Response(status, response_headers, reader, writer)
+        raise HTTPError("Too many redirects for {}".format(url))
+
+    async def _body(self, response):
+        # Yields the raw body, un-chunking it if needed.  With a limiter, reads
+        # are sized by it and each one is paid for before it's passed on.
+        reader = response.reader
+        if self.limiter:
+            self.limiter.start()
+        try:
+            if response.headers.get("transfer-encoding", "").lower() == "chunked":
+                while True:
+                    size = int((await self._wait(reader.readline())).split(b";")[0].strip() or b"0", 16)
+                    if not size:
+                        break
+                    data = await self._wait(reader.readexactly(size))
+                    await self._wait(reader.readline())
+                    await self._throttle(bytes=len(data))
+                    yield data
+                return
+            remaining = int(response.headers["content-length"]) if "content-length" in response.headers else None
+            while remaining is None or remaining > 0:
+                chunk = self.limiter.chunk_size(self.chunk) if self.limiter else self.chunk
+                data = await self._wait(reader.read(chunk if remaining is None else min(chunk, remaining)))
+                if not data:
+                    break # Closed - short reads are caught by the size checks
+                if remaining is not None:
+                    remaining -= len(data)
+                await self._throttle(bytes=len(data))
+                yield data
+        finally:
+            if self.limiter:
+                self.limiter.stop()
+
+    async def get_bytes(self, url, headers = None, expand_gzip = True):
+        # Returns the body, or None on any failure - like Downloader.get_bytes
+        host = urlsplit(url).netloc
+        per_host, total = self._limits(host)
+        async with per_host, total:
+            try:
+                response = await self.open_url(url, headers)
+            except (OSError, asyncio.TimeoutError, HTTPError):
+                return None
+            try:
+                if response.status >= 400:
+                    return None
+                chunks = [x async for x in self._body(response)]
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError):
+                return None
+            finally:
+                response.close()
+        data = b"".join(chunks)
+        if "content-length" in response.headers and len(data) != int(response.headers["content-length"]):
+            return None # Cut short
+        if expand_gzip and response.headers.get("content-encoding", "").lower() == "gzip":
+            try:
+                data = zlib.decompress(data, 16 + zlib.MAX_WBITS)
+            except zlib.error:
+                return None
+        return data
+
+    async def get_string(self, url, headers = None, expand_gzip = True):
+        data = await self.get_bytes(url, headers, expand_gzip)
+        return None if data is None else data.decode("utf-8", "ignore")
+
+    async def stream_to_file(self, url, file_path, headers = None, ensure_size_if_present = True, allow_resume = False):
+        # Same contract as Downloader.stream_to_file - returns file_path, or
+        # None on failure or a size mismatch.  Resuming asks for the rest with
+        # a Range header up front rather than opening the URL twice.
+        host = urlsplit(url).netloc
+        per_host, total = self._limits(host)
+        headers = dict(headers or self.ua)
+        current = os.path.getsize(file_path) if allow_resume and os.path.isfile(file_path) else 0
+        if current:
+            headers["Range"] = "bytes={}-".format(current)
+        async with per_host, total:
+            try:
+                response = await self.open_url(url, headers)
+            except (OSError, asyncio.TimeoutError, HTTPError):
+                return None
+            try:
+                total_size = -1
+                mode = "wb"
+                if response.status == 416 and current:
+                    # Nothing left to send - complete if the sizes agree
+                    known = response.headers.get("content-range", "").rpartition("/")[2]
+                    if known.isdigit() and int(known) == current:
+                        return file_path
+                    # The local file is bigger than the remote one - start
+                    # over without Range, as Downloader does
+                    response.close()
+                    headers.pop("Range", None)
+                    current = 0
+                    response = await self.open_url(url, headers)
+                if response.status >= 400:
+                    return None
+                if response.status == 206 and current:
+                    known = response.headers.get("content-range", "").rpartition("/")[2]
+                    total_size = int(known) if known.isdigit() else -1
+                    mode = "ab"
+                else:
+                    # Full body - the server ignored (or we didn't send) Range
+                    current = 0
+                    if "content-length" in response.headers:
+                        total_size = int(response.headers["content-length"])
+                bytes_so_far = current
+                with open(file_path, mode) as f:
+                    async for data in self._body(response):
+                        f.write(data)
+                        bytes_so_far += len(data)
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError, HTTPError):
+                return None
+            finally:
+                response.close()
+        if ensure_size_if_present and total_size != -1 and bytes_so_far != total_size:
+            return None # We didn't get what we were promised
+        return file_path if os.path.exists(file_path) else None
+
+    async def gather(self, jobs, callback = None):
+        # Runs the (url, file_path) jobs - or url strings for get_bytes - and
+        # returns their results in order.  callback(index, result) is called
+        # as each one finishes.
+        async def run(index, job):
+            if isinstance(job, str):
+                result = await self.get_bytes(job)
+            else:
+                result = await self.stream_to_file(*job)
+            if callback:
+                callback(index, result)
+            return result
+        return await asyncio.gather(*(run(i, job) for i, job in enumerate(jobs)))
+
+    def download_all(self, jobs, callback = None):
+        # Synchronous entry point for gather()
+        if hasattr(asyncio, "run"):
+            return asyncio.run(self.gather(jobs, callback))
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(self.gather(jobs, callback))
+        finally:
+            loop.close()
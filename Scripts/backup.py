@@ -0,0 +1,175 @@
+import os, json, shutil, hashlib, datetime, tempfile
+from . import plist
+from .utils import atomic_write
+
+class BackupStore:
+
+    def __init__(self, root):
+        # Layout:
+        #   objects/ab/cdef...  - content-addressed file contents (sha256)
+        #   generations/N.json  - one manifest per generation
+        #   names/<name>        - latest generation id per override folder
+        #   latest              - the highest generation id handed out
+        self.root = root
+        self.objects = os.path.join(root, "objects")
+        self.gens = os.path.join(root, "generations")
+        self.names = os.path.join(root, "names")
+
+    def _ensure(self):
+        for p in (self.objects, self.gens, self.names):
+            if not os.path.isdir(p):
+                os.makedirs(p)
+
+    def _read(self, path, default=None):
+        try:
+            with open(path, "r") as f:
+                return f.read().strip()
+        except (IOError, OSError):
+            return default
+
+    def _write(self, path, value):
+        # Never leaves a half-written manifest
+        atomic_write(path, value)
+
+    def _object_path(self, digest):
+        return os.path.join(self.objects, digest[:2], digest[2:])
+
+    def _store_object(self, path):
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(65536), b""):
+                h.update(chunk)
+        digest = h.hexdigest()
+        target = self._object_path(digest)
+        if not os.path.exists(target):
+            # New content - copy it in
+            if not os.path.isdir(os.path.dirname(target)):
+                os.makedirs(os.path.dirname(target))
+            shutil.copyfile(path, target + ".tmp")
+            os.rename(target + ".tmp", target)
+        return digest
+
+    def _walk(self, path):
+        # Returns a dict of relative path -> absolute path for all files
+        files = {}
+        for root, dirs, names in os.walk(path):
+            for name in names:
+                full = os.path.join(root, name)
+                files[os.path.relpath(full, path).replace(os.sep, "/")] = full
+        return files
+
+    def add(self, path, name=None):
+        # Stores the override folder at path as a new generation and returns
+        # its id.  If the contents match the latest generation for the same
+        # name, that generation's id is returned instead.
+        self._ensure()
+        name = name or os.path.basename(os.path.normpath(path))
+        files = {}
+        for rel, full in self._walk(path).items():
+            files[rel] = self._store_object(full)
+        last = self.latest(name)
+        if last is not None:
+            prev = self.get(last)
+            if prev and prev.get("files") == files:
+                return last
+        gen = int(self._read(os.path.join(self.root, "latest"), 0)) + 1
+        info = {
+            "id": gen,
+            "name": name,
+            "timestamp": "{:%Y-%m-%d %H.%M.%S}".format(datetime.datetime.now()),
+            "files": files
+        }
+        self._write(os.path.join(self.gens, "{}.json".format(gen)), json.dumps(info, indent=2, sort_keys=True))
+        self._write(os.path.join(self.names, name), str(gen))
+        self._write(os.path.join(self.root, "latest"), str(gen))
+        return gen
+
+    def get(self, gen):
+        try:
+            with open(os.path.join(self.gens, "{}.json".format(int(gen))), "r") as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+
+    def latest(self, name):
+        gen = self._read(os.path.join(self.names, name))
+        return int(gen) if gen else None
+
+    def generations(self):
+        if not os.path.isdir(self.gens):
+            return []
+        ids = sorted(int(x[:-5]) for x in os.listdir(self.gens) if x.endswith(".json") and x[:-5].isdigit())
+        return [g for g in (self.get(x) for x in ids) if g]
+
+    def materialize(self, gen, target):
+        # Rebuilds the generation's folder at target - returns target, or
+        # None if the generation does not exist
+        info = self.get(gen)
+        if not info:
+            return None
+        for rel, digest in info["files"].items():
+            out = os.path.join(target, *rel.split("/"))
+            if not os.path.isdir(os.path.dirname(out)):
+                os.makedirs(os.path.dirname(out))
+            shutil.copyfile(self._object_path(digest), out)
+        return target
+
+    def _load_plist(self, path):
+        try:
+            with open(path, "rb") as f:
+                return plist.load(f)
+        except Exception:
+            return None
+
+    def diff(self, gen, other=None, dest=None):
+        # Compares a generation against another generation, or against the
+        # live folder of the same name in dest if other is None.  Returns a
+        # list of human readable lines.
+        info = self.get(gen)
+        if not info:
+            raise ValueError("Generation {} does not exist".format(gen))
+        old = dict((rel, self._object_path(d)) for rel, d in info["files"].items())
+        if other is None:
+            if not dest:
+                raise ValueError("No generation or destination to compare against")
+            new = self._walk(os.path.join(dest, info["name"]))
+        else:
+            o_info = self.get(other)
+            if not o_info:
+                raise ValueError("Generation {} does not exist".format(other))
+            new = dict((rel, self._object_path(d)) for rel, d in o_info["files"].items())
+        lines = []
+        for rel in sorted(set(old) | set(new)):
+            if not rel in new:
+                lines.append("- {}".format(rel))
+                continue
+            if not rel in old:
+                lines.append("+ {}".format(rel))
+                continue
+            with open(old[rel], "rb") as f:
+                a = f.read()
+            with open(new[rel], "rb") as f:
+                b = f.read()
+            if a == b:
+                continue
+            lines.append("~ {}".format(rel))
+            a, b = self._load_plist(old[rel]), self._load_plist(new[rel])
+            if not isinstance(a, dict) or not isinstance(b, dict):
+                continue
+            for key in sorted(set(a) | set(b)):
+                if not key in b:
+                    lines.append("    - {}".format(key))
+                elif not key in a:
+                    lines.append("    + {}: {!r}".format(key, b[key]))
+                elif a[key] != b[key]:
+                    lines.append("    ~ {}: {!r} -> {!r}".format(key, a[key], b[key]))
+        return lines
+
+    def stage(self, gen):
+        # Materializes the generation inside a new temp folder and returns
+        # the path to the rebuilt override folder
+        info = self.get(gen)
+        if not info:
+            return None
+        temp = tempfile.mkdtemp(prefix="ForceRGB-")
+        return self.materialize(gen, os.path.join(temp, info["name"]))
@@ -0,0 +1,325 @@
+import sys, os, time, json, shutil, tempfile, subprocess, argparse
+from io import BytesIO
+
+# Benchmarks for ForceRGB and the shared Scripts - run them with:
+#   python -m Scripts.bench <name> [--runs N] [--json]
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+def _median(values):
+    values = sorted(values)
+    if not values:
+        return 0
+    mid = len(values) // 2
+    return values[mid] if len(values) % 2 else (values[mid-1] + values[mid]) / 2.0
+
+def _importtime(stderr):
+    # Sums the cumulative time (in ms) of the top level imports reported by
+    # -X importtime.  Lines look like:
+    #   import time:  self [us] | cumulative | imported package
+    total = 0
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line.split("|")
+        if len(parts) != 3 or not parts[2].startswith(" ") or parts[2].startswith("  "):
+            continue # Nested import - already counted by its parent
+        try:
+            total += int(parts[1])
+        except ValueError:
+            continue # Header line
+    return total / 1000.0
+
+def _time_process(args):
+    start = time.time()
+    p = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=ROOT)
+    o, e = p.communicate()
+    return ((time.time() - start) * 1000.0, e.decode("utf-8", "ignore"))
+
+def startup(runs=10, args=None):
+    # Times `ForceRGB.py --help` (or the passed args) against a bare
+    # interpreter start, and reports the import cost from -X importtime
+    args = args or ["--help"]
+    script = os.path.join(ROOT, "ForceRGB.py")
+    base, wall, imports = [], [], []
+    for _ in range(runs):
+        base.append(_time_process([sys.executable, "-c", "pass"])[0])
+        ms, err = _time_process([sys.executable, "-X", "importtime", script] + list(args))
+        wall.append(ms)
+        imports.append(_importtime(err))
+    return {
+        "command": " ".join(["ForceRGB.py"] + list(args)),
+        "runs": runs,
+        "interpreter_ms": round(_median(base), 2),
+        "wall_ms": round(_median(wall), 2),
+        "overhead_ms": round(_median(wall) - _median(base), 2),
+        "import_ms": round(_median(imports), 2)
+    }
+
+def _plist_fixtures(folder):
+    # An override sized plist in each format, plus an XML copy with a
+    # whitespace prefix like the ones hand edited files tend to pick up
+    from . import plist
+    value = {
+        "DisplayProductName": "Forced RGB Mode (EDID override)",
+        "DisplayVendorID": 1552,
+        "DisplayProductID": 41026,
+        "DisplayIsTV": False,
+        "IODisplayEDID": plist.wrap_data(bytes(bytearray(range(256)))),
+        "Timings": [{"Index": i, "Clock": 148500} for i in range(64)]
+    }
+    paths = {}
+    for name, fmt, prefix in (
+        ("xml", plist.FMT_XML, b""),
+        ("binary", plist.FMT_BINARY, b""),
+        ("xml_padded", plist.FMT_XML, b"\n" * 65536)
+    ):
+        paths[name] = os.path.join(folder, name + ".plist")
+        with open(paths[name], "wb") as f:
+            f.write(prefix)
+            plist.dump(value, f, fmt=fmt)
+    return paths
+
+def plist_load(runs=10, args=None):
+    # Times plist.load per fixture through buffered and unbuffered (raw)
+    # file objects - the latter show the cost of each read on the way in
+    from . import plist
+    folder = tempfile.mkdtemp()
+    results = {"runs": runs}
+    try:
+        for name, path in sorted(_plist_fixtures(folder).items()):
+            for label, buffering in (("", -1), ("_unbuffered", 0)):
+                times = []
+                for _ in range(runs):
+                    with open(path, "rb", buffering=buffering) as f:
+                        start = time.time()
+                        plist.load(f)
+                        times.append((time.time() - start) * 1000.0)
+                results["{}{}_ms".format(name, label)] = round(_median(times), 3)
+        # Binary load and dump through each backend, plus what auto picked
+        binary = os.path.join(folder, "binary.plist")
+        with open(binary, "rb") as f:
+            data = f.read()
+        value = plist.loads(data)
+        for name in plist.backends():
+            plist.set_backend(name)
+            for op, func in (
+                ("load", lambda: plist.loads(data)),
+                ("dump", lambda: plist.dump(value, BytesIO(), fmt=plist.FMT_BINARY))
+            ):
+                times = []
+                for _ in range(runs):
+                    start = time.time()
+                    func()
+                    times.append((time.time() - start) * 1000.0)
+                results["binary_{}_{}_ms".format(op, name)] = round(_median(times), 3)
+        plist.set_backend("auto")
+        results["auto"] = plist.rank_backends()
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+    return results
+
+# Never exists, so replayed runs can't find (and back up) real overrides
+PIPELINE_DEST = "/ForceRGB-bench/Overrides"
+
+def _pipeline_fixture(path, displays=4):
+    # A Run fixture for `ForceRGB.py --batch` with a few attached displays
+    import binascii
+    from . import edid
+    ioreg, commands = [], []
+    def add(args, output="", error="", returncode=0):
+        commands.append({"args": args, "shell": False, "stream": False, "output": output, "error": error, "returncode": returncode, "seconds": 0})
+    add(["sw_vers", "-productVersion"], "14.5\n")
+    add(["which", "sudo"], "/usr/bin/sudo\n")
+    add(["/usr/bin/sudo", "mkdir", "-p", PIPELINE_DEST])
+    for i in range(displays):
+        vendor, product = 0x610 + i, 0xa040 + i
+        ioreg.append('+-o AppleDisplay  <class AppleDisplay>\n  {{\n    "DisplayVendorID" = {}\n    "DisplayProductID" = {}\n    "IODisplayEDID" = <{}>\n  }}\n'.format(
+            vendor, product, binascii.hexlify(edid.build(vendor, product, "Bench {}".format(i))).decode("ascii")
+        ))
+        folder = "DisplayVendorID-{:x}".format(vendor)
+        add(["/usr/bin/sudo", "cp", "-r", os.path.join(tempfile.gettempdir(), "ForceRGB-bench", folder), os.path.join(PIPELINE_DEST, folder)])
+    add(["ioreg", "-l", "-w0", "-d0", "-r", "-c", "AppleDisplay"], "".join(ioreg))
+    with open(path, "w") as f:
+        json.dump({"version": 1, "commands": commands}, f, indent=2)
+    return path
+
+def pipeline(runs=10, args=None):
+    # Replays a recorded batch run so the Python side of the whole pipeline
+    # (ioreg parsing, patching, plist writing, staging, installs) can be
+    # timed anywhere - in process, and as a full `ForceRGB.py --json` run
+    sys.path.insert(0, ROOT)
+    import ForceRGB
+    folder = tempfile.mkdtemp()
+    try:
+        fixture = _pipeline_fixture(os.path.join(folder, "pipeline.json"))
+        times = []
+        for _ in range(runs):
+            r = ForceRGB.RGB()
+            r.replay = fixture
+            start = time.time()
+            result = r.apply(r.get_displays(), dest=PIPELINE_DEST)
+            times.append((time.time() - start) * 1000.0)
+        if len(result) != 4:
+            raise RuntimeError("Expected 4 displays from the replay, got {}".format(len(result)))
+        script = os.path.join(ROOT, "ForceRGB.py")
+        base, wall = [], []
+        for _ in range(runs):
+            base.append(_time_process([sys.executable, "-c", "pass"])[0])
+            wall.append(_time_process([sys.executable, script, "--json", "--dest", PIPELINE_DEST, "--replay", fixture])[0])
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+    return {
+        "runs": runs,
+        "displays": len(result),
+        "in_process_ms": round(_median(times), 3),
+        "interpreter_ms": round(_median(base), 2),
+        "wall_ms": round(_median(wall), 2),
+        "overhead_ms": round(_median(wall) - _median(base), 2)
+    }
+
+# name -> (Downloader method, stand-in path, extra kwargs).  Sizes are in
+# MiB and scaled by the benchmark's size.
+DOWNLOAD_MODES = (
+    ("get_bytes", "get_bytes", "/plain/{}M", {}),
+    ("get_bytes_chunked", "get_bytes", "/chunked/{}M", {}),
+    ("get_bytes_gzip", "get_bytes", "/gzip/{}M", {}),
+    ("stream_to_file", "stream_to_file", "/plain/{}M", {}),
+    ("stream_to_file_progress", "stream_to_file", "/plain/{}M", {"progress": True}),
+    ("stream_to_file_resume", "stream_to_file", "/plain/{}M", {"allow_resume": True}),
+    ("stream_to_file_slow", "stream_to_file", "/slow/{}M?rate=8388608", {}),
+    ("stream_to_file_truncated", "stream_to_file", "/truncated/{}M", {}),
+    ("async_get_bytes", "async_get_bytes", "/plain/{}M", {}),
+    ("async_stream_to_file", "async_stream_to_file", "/plain/{}M", {}),
+    ("async_stream_to_file_resume", "async_stream_to_file", "/plain/{}M", {"allow_resume": True})
+)
+
+def _download_child(name, method, url, path, kwargs, size, queue):
+    # Runs one download in its own process so CPU time and peak RSS are
+    # just the download's.  Progress output goes to /dev/null.
+    import resource
+    from .downloader import Downloader
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 1)
+    if name.endswith("_resume"):
+        # Start with the first half on disk
+        from .testserver import payload_bytes
+        with open(path, "wb") as f:
+            f.write(payload_bytes(size, 0, size // 2))
+    kwargs = dict(kwargs)
+    if method.startswith("async_"):
+        import asyncio
+        from .async_downloader import AsyncDownloader
+        d = AsyncDownloader()
+    else:
+        d = Downloader()
+        kwargs.setdefault("progress", False)
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.time()
+    if method == "async_get_bytes":
+        result = asyncio.run(d.get_bytes(url, **kwargs))
+        ok = result is not None and len(result) == size
+    elif method == "async_stream_to_file":
+        result = asyncio.run(d.stream_to_file(url, path, **kwargs))
+        ok = result is not None and os.path.getsize(path) == size
+    elif method == "get_bytes":
+        result = d.get_bytes(url, **kwargs)
+        ok = result is not None and len(result) == size
+    else:
+        result = d.stream_to_file(url, path, **kwargs)
+        ok = result is not None and os.path.getsize(path) == size
+    seconds = time.time() - start
+    usage = [resource.getrusage(x) for x in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN)]
+    peak = usage[0].ru_maxrss - rss
+    queue.put({
+        "seconds": seconds,
+        "cpu": sum(u.ru_utime + u.ru_stime for u in usage),
+        # Linux reports KiB, macOS bytes
+        "peak_rss_mb": peak / 1048576.0 if sys.platform == "darwin" else peak / 1024.0,
+        "ok": ok
+    })
+
+def _mirror(server, folder, runs, files=8):
+    # A mirror-style batch of small files on a slow link - one at a time with
+    # Downloader against AsyncDownloader's bounded concurrency
+    from .downloader import Downloader
+    from .async_downloader import AsyncDownloader
+    jobs = [(server.url("/slow/64K?rate=262144&file={}".format(i)), os.path.join(folder, "mirror-{}".format(i))) for i in range(files)]
+    d = Downloader()
+    sync = []
+    concurrent = []
+    for _ in range(runs):
+        start = time.time()
+        ok = all(d.stream_to_file(url, path, progress=False) for url, path in jobs)
+        sync.append(time.time() - start)
+        start = time.time()
+        ok = all(AsyncDownloader(concurrency=files, per_host=files).download_all(jobs)) and ok
+        concurrent.append(time.time() - start)
+    return {
+        "files": files,
+        "sync_seconds": round(_median(sync), 4),
+        "async_seconds": round(_median(concurrent), 4),
+        "ok": ok
+    }
+
+def downloads(runs=10, args=None, size=32):
+    # Times each Downloader mode against the local stand-in server (see
+    # Scripts/testserver.py) and reports throughput, CPU seconds per MiB and
+    # peak RSS, then times a batch of small files fetched one at a time against
+    # AsyncDownloader.  Truncated downloads are expected to fail (ok is False).
+    import multiprocessing
+    from .testserver import TestServer
+    folder = tempfile.mkdtemp()
+    results = {"runs": runs, "size_mb": size}
+    try:
+        with TestServer() as server:
+            for name, method, path, kwargs in DOWNLOAD_MODES:
+                # The slow drip is timed on a fraction of the size
+                mb = max(1, size // 8) if name.endswith("_slow") else size
+                samples = []
+                for _ in range(runs):
+                    target = os.path.join(folder, name)
+                    if os.path.exists(target):
+                        os.remove(target)
+                    queue = multiprocessing.Queue()
+                    p = multiprocessing.Process(target=_download_child, args=(
+                        name, method, server.url(path.format(mb)), target, kwargs, mb * 1048576, queue
+                    ))
+                    p.start()
+                    samples.append(queue.get())
+                    p.join()
+                seconds = _median([x["seconds"] for x in samples])
+                results[name] = {
+                    "mb_per_s": round(mb / seconds, 2) if seconds else None,
+                    "seconds": round(seconds, 4),
+                    "cpu_ms_per_mb": round(_median([x["cpu"] for x in samples]) * 1000.0 / mb, 3),
+                    "peak_rss_mb": round(_median([x["peak_rss_mb"] for x in samples]), 2),
+                    "ok": all(x["ok"] for x in samples)
+                }
+            results["mirror"] = _mirror(server, folder, runs)
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+    return results
+
+BENCHMARKS = {
+    "downloads": downloads,
+    "pipeline": pipeline,
+    "plist": plist_load,
+    "startup": startup
+}
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m Scripts.bench")
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS), help="the benchmark to run")
+    parser.add_argument("-r", "--runs", type=int, default=10, help="how many times to repeat each measurement - default is 10")
+    parser.add_argument("-j", "--json", action="store_true", help="prints the results as JSON")
+    args = parser.parse_args()
+    results = BENCHMARKS[args.benchmark](runs=args.runs)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for k in results:
+        print("{}: {}".format(k, results[k]))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+import os, sys, json, time, shutil, zipfile, hashlib, argparse, datetime
+from io import BytesIO
+try:
+    from . import plist, validate
+    from .utils import atomic_write
+except (ImportError, ValueError):
+    # Run as a plain script - e.g. by ForceRGB under sudo, where -m can't
+    # find the package
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from Scripts import plist, validate
+    from Scripts.utils import atomic_write
+
+# Single file bundles of override trees for pushing to many machines:
+#   python -m Scripts.bundle export Overrides overrides.frgb
+#   python -m Scripts.bundle list overrides.frgb
+#   python -m Scripts.bundle import overrides.frgb Overrides-copy [-d 610/a040]
+#   sudo python -m Scripts.bundle apply overrides.frgb [DEST] [-d 610] [--replace]
+# A bundle is a zip of uncompressed binary plists (DisplayVendorID-<hex>/
+# DisplayProductID-<hex>) plus MANIFEST with their ids, names and sha256
+# hashes.  The zip's central directory is the index, so one display can be
+# read without unpacking the rest, and every read is checked against the
+# manifest.  apply writes each file into place with a rename in one process,
+# rather than one rm and one cp -r per folder, and leaves overrides the
+# bundle doesn't have alone unless --replace is passed.
+
+MANIFEST = "manifest.json"
+FORMAT = "ForceRGB-bundle"
+VERSION = 1
+
+class BundleError(Exception):
+    pass
+
+def _hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+def export(src, path, displays=None):
+    # Bundles the Overrides tree at src into path.  Files that don't parse
+    # are left out and reported.  Returns (manifest, skipped) where skipped
+    # is a list of (path, reason).
+    jobs, _ = validate.scan(src)
+    entries, skipped = {}, []
+    out = BytesIO()
+    with zipfile.ZipFile(out, "w", zipfile.ZIP_STORED) as z:
+        for file_path, vendor, product in jobs:
+            if displays and not _selected(vendor, product, displays):
+                continue
+            display, issues = validate.check_file(file_path, vendor, product)
+            errors = [x["message"] for x in issues if x["level"] == "error"]
+            if display is None or errors:
+                skipped.append((file_path, "; ".join(errors)))
+                continue
+            with open(file_path, "rb") as f:
+                value = plist.load(f)
+            f = BytesIO()
+            plist.dump(value, f, fmt=plist.FMT_BINARY, sort_keys=False)
+            data = f.getvalue()
+            rel = "/".join((os.path.basename(os.path.dirname(file_path)), os.path.basename(file_path)))
+            z.writestr(rel, data)
+            entries[rel] = {
+                "sha256": _hash(data),
+                "size": len(data),
+                "vendor_id": vendor,
+                "product_id": product,
+                "name": display["name"]
+            }
+        manifest = {
+            "format": FORMAT,
+            "version": VERSION,
+            "created": "{:%Y-%m-%d %H.%M.%S}".format(datetime.datetime.now()),
+            "entries": entries
+        }
+        # Written last - readers find it through the central directory
+        z.writestr(MANIFEST, json.dumps(manifest, indent=2, sort_keys=True))
+    atomic_write(path, out.getvalue())
+    return (manifest, skipped)
+
+def parse_display(value):
+    # "610" -> (0x610, None), "610/a040" -> (0x610, 0xa040)
+    vendor, _, product = value.partition("/")
+    try:
+        return (int(vendor, 16), int(product, 16) if product else None)
+    except ValueError:
+        raise BundleError("Expected VENDOR or VENDOR/PRODUCT in hex, got {}".format(value))
+
+def _selected(vendor, product, displays):
+    return any(v == vendor and p in (None, product) for v, p in displays)
+
+class Bundle(object):
+
+    def __init__(self, path):
+        self.path = path
+        try:
+            self._zip = zipfile.ZipFile(path, "r")
+            self.manifest = json.loads(self._zip.read(MANIFEST).decode("utf-8"))
+        except (IOError, OSError, KeyError, ValueError, zipfile.BadZipfile) as e:
+            raise BundleError("{} is not a valid bundle: {}".format(path, e))
+        if self.manifest.get("format") != FORMAT or self.manifest.get("version", 0) > VERSION:
+            raise BundleError("{} is not a bundle this version can read".format(path))
+        self.entries = self.manifest["entries"]
+        for rel in self.entries:
+            # Names become paths under dest, often as root - only ours pass
+            folder, _, name = rel.partition("/")
+            if not validate._VENDOR_RE.match(folder) or not validate._PRODUCT_RE.match(name):
+                raise BundleError("{} has an unexpected entry: {}".format(path, rel))
+
+    def close(self):
+        self._zip.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def names(self, displays=None):
+        # The entry names, optionally limited to (vendor, product) selections
+        return sorted(
+            rel for rel, e in self.entries.items()
+            if not displays or _selected(e["vendor_id"], e["product_id"], displays)
+        )
+
+    def folders(self, displays=None):
+        # vendor folder -> entry names in it
+        folders = {}
+        for rel in self.names(displays):
+            folders.setdefault(rel.split("/")[0], []).append(rel)
+        return folders
+
+    def read(self, rel):
+        # Reads one entry straight from its offset, checked against the manifest
+        try:
+            data = self._zip.read(rel)
+        except KeyError:
+            raise BundleError("{} is not in {}".format(rel, self.path))
+        if _hash(data) != self.entries[rel]["sha256"]:
+            raise BundleError("{} in {} does not match its hash".format(rel, self.path))
+        return data
+
+    def load(self, rel):
+        return plist.loads(self.read(rel))
+
+def unpack(path, target, displays=None):
+    # Extracts the bundle (or just the selected displays) into a plain tree
+    # at target.  Returns the written paths.
+    written = []
+    with Bundle(path) as b:
+        for rel in b.names(displays):
+            out = os.path.join(target, *rel.split("/"))
+            if not os.path.isdir(os.path.dirname(out)):
+                os.makedirs(os.path.dirname(out))
+            atomic_write(out, b.read(rel))
+            written.append(out)
+    return written
+
+def install(path, dest, displays=None, replace=False):
+    # Installs the bundle into the Overrides folder at dest.  Files are
+    # merged into existing vendor folders (each with a rename) and any
+    # overrides the bundle doesn't have are left alone.  New folders - and
+    # with replace, every folder - are built next to dest/<folder> and
+    # swapped in with renames, so nothing ever sees a half-written folder.
+    # Returns the installed paths.
+    installed = []
+    if not os.path.isdir(dest):
+        os.makedirs(dest)
+    with Bundle(path) as b:
+        # Read and verify everything before touching dest
+        folders = dict((f, [(rel, b.read(rel)) for rel in rels]) for f, rels in b.folders(displays).items())
+    for folder in sorted(folders):
+        target = os.path.join(dest, folder)
+        if not replace and os.path.isdir(target):
+            for rel, data in folders[folder]:
+                out = os.path.join(dest, *rel.split("/"))
+                atomic_write(out, data)
+                installed.append(out)
+            continue
+        staging = os.path.join(dest, ".{}.bundle-new".format(folder))
+        old = os.path.join(dest, ".{}.bundle-old".format(folder))
+        for leftover in (staging, old):
+            shutil.rmtree(leftover, ignore_errors=True)
+        os.makedirs(staging)
+        for rel, data in folders[folder]:
+            with open(os.path.join(staging, rel.split("/")[1]), "wb") as f:
+                f.write(data)
+        if os.path.exists(target):
+            os.rename(target, old)
+        os.rename(staging, target)
+        shutil.rmtree(old, ignore_errors=True)
+        installed.extend(os.path.join(dest, *rel.split("/")) for rel, _ in folders[folder])
+    return installed
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m Scripts.bundle")
+    sub = parser.add_subparsers(dest="command")
+    p = sub.add_parser("export", help="bundles an Overrides tree")
+    p.add_argument("source", help="the Overrides folder to bundle")
+    p.add_argument("bundle", help="the bundle file to write")
+    p = sub.add_parser("list", help="lists the displays in a bundle")
+    p.add_argument("bundle")
+    p = sub.add_parser("import", help="extracts a bundle into a plain tree")
+    p.add_argument("bundle")
+    p.add_argument("dest", help="the folder to extract to")
+    p = sub.add_parser("apply", help="installs a bundle into an Overrides folder")
+    p.add_argument("bundle")
+    p.add_argument("dest", nargs="?", default=validate.DEFAULT_ROOT, help="the Overrides folder - default is {}".format(validate.DEFAULT_ROOT))
+    p.add_argument("-r", "--replace", action="store_true", help="replaces whole vendor folders, removing overrides the bundle doesn't have")
+    for name in ("export", "import", "apply"):
+        sub.choices[name].add_argument("-d", "--display", action="append", help=(
+            "only this display - a hex vendor id, or VENDOR/PRODUCT - can be passed more than once"
+        ))
+    for name in sub.choices:
+        sub.choices[name].add_argument("-j", "--json", action="store_true", help="prints the results as JSON")
+    args = parser.parse_args()
+    if not getattr(args, "command", None):
+        parser.print_help()
+        exit(1)
+    start = time.time()
+    try:
+        displays = [parse_display(x) for x in getattr(args, "display", None) or []] or None
+        if args.command == "export":
+            if not os.path.isdir(args.source):
+                raise BundleError("{} is not a folder".format(args.source))
+            manifest, skipped = export(args.source, args.bundle, displays)
+            result = {"bundle": args.bundle, "displays": len(manifest["entries"]), "skipped": [{"path": x, "reason": y} for x, y in skipped]}
+        elif args.command == "list":
+            with Bundle(args.bundle) as b:
+                result = {"bundle": args.bundle, "created": b.manifest["created"], "entries": b.entries}
+        elif args.command == "import":
+            result = {"bundle": args.bundle, "written": unpack(args.bundle, args.dest, displays)}
+        else:
+            result = {"bundle": args.bundle, "installed": install(args.bundle, args.dest, displays, args.replace)}
+    except (BundleError, IOError, OSError) as e:
+        if args.json:
+            print(json.dumps({"status": "error", "error": str(e)}, indent=2))
+        else:
+            print(e)
+        exit(1)
+    result["status"] = "ok"
+    result["seconds"] = round(time.time() - start, 4)
+    if args.json:
+        print(json.dumps(result, indent=2, sort_keys=True))
+        return
+    if args.command == "export":
+        for path, reason in skipped:
+            print("Skipped {}: {}".format(path, reason))
+        print("Bundled {:,} display{} into {}".format(result["displays"], "" if result["displays"] == 1 else "s", args.bundle))
+    elif args.command == "list":
+        for rel in sorted(result["entries"]):
+            print("{}  {}".format(rel, result["entries"][rel]["name"]))
+    else:
+        paths = result.get("written", result.get("installed"))
+        for path in paths:
+            print(path)
+        print("{} {:,} display{} in {:.2f}s".format(
+            "Imported" if args.command == "import" else "Installed",
+            len(paths), "" if len(paths) == 1 else "s", result["seconds"]
+        ))
+
+if __name__ == "__main__":
+    main()
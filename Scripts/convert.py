@@ -0,0 +1,177 @@
+import os, sys, json, time, fnmatch, hashlib, argparse, multiprocessing
+from io import BytesIO
+from . import plist
+from .utils import atomic_write
+
+# Converts whole trees of plists between XML and binary, e.g.:
+#   python -m Scripts.convert Overrides --to binary
+#   python -m Scripts.convert Preferences Preferences-xml --to xml -p "*.plist"
+# Files are converted across a process pool, one at a time per worker, and
+# a manifest of source mtimes, sizes and hashes lets reruns skip anything
+# that hasn't changed since it was last converted.
+
+MANIFEST = ".convert-manifest.json"
+FORMATS = {"xml": plist.FMT_XML, "binary": plist.FMT_BINARY}
+
+def _hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+def _write(path, data):
+    # Write next to the target and move it into place
+    folder = os.path.dirname(path)
+    if folder and not os.path.isdir(folder):
+        try:
+            os.makedirs(folder)
+        except OSError:
+            if not os.path.isdir(folder): # Another worker may have made it
+                raise
+    atomic_write(path, data, ".converting")
+
+def _entry(path, data):
+    st = os.stat(path)
+    return {"mtime": st.st_mtime, "size": st.st_size, "sha256": _hash(data)}
+
+def convert_file(src, dst, fmt, known=None):
+    # Converts src to fmt at dst (which can be src).  known is the manifest
+    # entry from the last run, if any.  Returns a (src, status, entry) tuple
+    # where status is converted, unchanged, skipped, or an error, and entry
+    # is the manifest entry to keep for src.
+    try:
+        status = "skipped" if known and known.get("skipped") else "unchanged"
+        if known and (status == "skipped" or os.path.isfile(dst)):
+            st = os.stat(src)
+            if st.st_mtime == known["mtime"] and st.st_size == known["size"]:
+                return (src, status, known)
+        with open(src, "rb") as f:
+            data = f.read()
+        digest = _hash(data)
+        if known and known["sha256"] == digest and (status == "skipped" or os.path.isfile(dst)):
+            # Touched but not changed - refresh the stat info
+            entry = dict(known)
+            st = os.stat(src)
+            entry.update(mtime=st.st_mtime, size=st.st_size)
+            return (src, status, entry)
+        detected, _ = plist._sniff(BytesIO(data))
+        if detected is None:
+            # Not a plist - remember that so it isn't read again
+            entry = _entry(src, data)
+            entry["skipped"] = True
+            return (src, "skipped", entry)
+        if detected == fmt:
+            # Already in the right format - just copy it if it has to move
+            out = data
+        else:
+            f = BytesIO()
+            plist.dump(plist.loads(data), f, fmt=fmt, sort_keys=False)
+            out = f.getvalue()
+        if src == dst and out is data:
+            return (src, "unchanged", _entry(src, data))
+        _write(dst, out)
+        return (src, "converted", _entry(src, out if src == dst else data))
+    except Exception as e:
+        return (src, "error: {}".format(e), None)
+
+def _convert_args(args):
+    return convert_file(*args)
+
+def walk(root, pattern="*", exclude=(MANIFEST, MANIFEST + ".tmp")):
+    # Generator yielding files under root whose name matches pattern
+    for folder, dirs, files in os.walk(root):
+        dirs.sort()
+        for name in sorted(files):
+            if name in exclude or name.endswith(".converting") or not fnmatch.fnmatch(name, pattern):
+                continue
+            yield os.path.join(folder, name)
+
+def load_manifest(path):
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        return {}
+
+def save_manifest(path, manifest):
+    folder = os.path.dirname(path)
+    if folder and not os.path.isdir(folder):
+        os.makedirs(folder)
+    atomic_write(path, json.dumps(manifest, sort_keys=True))
+
+def convert(src, dst=None, fmt=plist.FMT_BINARY, pattern="*", processes=None, force=False, manifest_path=None, chunksize=64, save_interval=30):
+    # Generator yielding a (path, status) tuple per file under src as it's
+    # converted.  dst defaults to converting in place.  The manifest lives in
+    # dst (or manifest_path), and is saved every save_interval seconds so an
+    # interrupted run over a big tree keeps most of its progress, and at the end.
+    dst = dst or src
+    manifest_path = manifest_path or os.path.join(dst, MANIFEST)
+    manifest = {} if force else load_manifest(manifest_path)
+    fmt_name = "binary" if fmt == plist.FMT_BINARY else "xml"
+    if manifest.get("format") != fmt_name:
+        # Entries only count for the format they were converted to
+        manifest = {}
+    files = manifest.setdefault("files", {})
+    manifest["format"] = fmt_name
+    def jobs():
+        name = os.path.basename(manifest_path)
+        for path in walk(src, pattern, (name, name + ".tmp")):
+            rel = os.path.relpath(path, src)
+            yield (path, os.path.join(dst, rel), fmt, files.get(rel))
+    if processes == 1:
+        results = (convert_file(*job) for job in jobs())
+        pool = None
+    else:
+        pool = multiprocessing.Pool(processes)
+        results = pool.imap_unordered(_convert_args, jobs(), chunksize)
+    saved = time.time()
+    try:
+        for path, status, entry in results:
+            rel = os.path.relpath(path, src)
+            if entry is None:
+                files.pop(rel, None)
+            else:
+                files[rel] = entry
+            if time.time() - saved > save_interval:
+                save_manifest(manifest_path, manifest)
+                saved = time.time()
+            yield (path, status)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        save_manifest(manifest_path, manifest)
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m Scripts.convert")
+    parser.add_argument("source", help="the folder of plists to convert")
+    parser.add_argument("dest", nargs="?", help="the folder to write to - default is to convert in place")
+    parser.add_argument("-t", "--to", choices=sorted(FORMATS), required=True, help="the format to convert to")
+    parser.add_argument("-p", "--pattern", default="*", help="only converts files whose names match this glob - default is *")
+    parser.add_argument("-j", "--jobs", type=int, help="the number of processes to use - default is one per CPU")
+    parser.add_argument("-f", "--force", action="store_true", help="ignores the manifest and converts everything")
+    parser.add_argument("-m", "--manifest", help="where to keep the manifest - default is {} in the destination".format(MANIFEST))
+    parser.add_argument("-q", "--quiet", action="store_true", help="only prints errors, progress and the summary")
+    args = parser.parse_args()
+    if not os.path.isdir(args.source):
+        print("{} is not a folder".format(args.source))
+        exit(1)
+    counts = {}
+    start = time.time()
+    for path, status in convert(args.source, args.dest, FORMATS[args.to], args.pattern, args.jobs, args.force, args.manifest):
+        kind = "error" if status.startswith("error") else status
+        counts[kind] = counts.get(kind, 0) + 1
+        if not args.quiet or kind == "error":
+            print("{}: {}".format(path, status))
+        total = sum(counts.values())
+        if args.quiet and total % 1000 == 0:
+            print("{:,} files ({:,.0f}/s)...".format(total, total / max(time.time() - start, 0.001)))
+            sys.stdout.flush()
+    print("{:,} converted, {:,} unchanged, {:,} skipped, {:,} failed in {:.2f}s".format(
+        counts.get("converted", 0),
+        counts.get("unchanged", 0),
+        counts.get("skipped", 0),
+        counts.get("error", 0),
+        time.time() - start
+    ))
+    exit(1 if counts.get("error") else 0)
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,4 @@
-import sys, os, time, ssl, gzip, multiprocessing
+import sys, os, time, ssl, gzip, threading, multiprocessing
 from io import BytesIO
 # Python-aware urllib stuff
 try:
@@ -10,6 +10,8 @@ except ImportError:
     from urllib2 import urlopen, Request
     import Queue as q
 
+from .timing import timer, timed
+
 TERMINAL_WIDTH = 120 if os.name=="nt" else 80
 
 def get_size(size, suffix=None, use_1024=False, round_to=2, strip_zeroes=False):
@@ -140,25 +142,118 @@ def _process_hook(queue, total_size, bytes_so_far=0, update_interval=1.0, max_pa
                 # Clear the packets so we don't reuse the same ones
                 packets = []
 
-class Downloader:
+def parse_rate(value):
+    # "512K", "2M", "1.5G" or a plain number -> a float, in 1024s
+    value = str(value).strip().upper()
+    mult = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}.get(value[-1:], 1)
+    return float(value.rstrip("KMG")) * mult
+
+_clock = getattr(time, "monotonic", time.time)
+
+class RateLimiter(object):
+    # Token buckets for bytes/sec and requests/sec that any number of
+    # Downloaders (and threads) can share, so a process stays under one
+    # budget however many downloads it has going:
+    #   limiter = RateLimiter(bytes_per_second=parse_rate("2M"), requests_per_second=4)
+    #   Downloader(limiter=limiter)
+    # Callers take tokens up front and sleep off any debt, which keeps the
+    # lock held only for the arithmetic.  burst is how many seconds' worth
+    # of tokens can build up while idle.
+
+    def __init__(self, bytes_per_second=None, requests_per_second=None, burst=1.0, min_chunk=16384, max_chunk=1048576):
+        self.bytes_per_second = bytes_per_second
+        self.requests_per_second = requests_per_second
+        self.burst = burst
+        self.min_chunk = min_chunk
+        self.max_chunk = max_chunk
+        self._lock = threading.Lock()
+        self._tokens = {"bytes": self._capacity("bytes"), "requests": self._capacity("requests")}
+        self._last = _clock()
+        self.active = 0 # Reads in flight - they split the byte rate
+
+    def _rate(self, bucket):
+        return self.bytes_per_second if bucket == "bytes" else self.requests_per_second
+
+    def _capacity(self, bucket):
+        rate = self._rate(bucket)
+        # Always room for at least one request
+        return max(rate * self.burst, 1) if rate else 0
+
+    def reserve(self, bytes=0, requests=0):
+        # Takes the tokens and returns how many seconds the caller has to
+        # wait before using them - for callers that sleep their own way (asyncio)
+        with self._lock:
+            now = _clock()
+            elapsed, self._last = now - self._last, now
+            wait = 0
+            for bucket, amount in (("bytes", bytes), ("requests", requests)):
+                rate = self._rate(bucket)
+                if not rate:
+                    continue
+                tokens = min(self._capacity(bucket), self._tokens[bucket] + elapsed * rate) - amount
+                self._tokens[bucket] = tokens
+                if tokens < 0:
+                    wait = max(wait, -tokens / float(rate))
+            return wait
+
+    def wait(self, bytes=0, requests=0):
+        delay = self.reserve(bytes, requests)
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+    def chunk_size(self, default=1048576):
+        # About a tenth of a second of this reader's share of the byte rate,
+        # so throttled reads stay smooth instead of bursting a whole MiB
+        if not self.bytes_per_second:
+            return default
+        size = int(self.bytes_per_second / 10.0 / max(1, self.active))
+        return max(self.min_chunk, min(self.max_chunk, size))
+
+    def start(self):
+        with self._lock:
+            self.active += 1
+
+    def stop(self):
+        with self._lock:
+            self.active = max(0, self.active - 1)
+
+class Downloader(object):
 
     def __init__(self,**kwargs):
         self.ua = kwargs.get("useragent",{"User-Agent":"Mozilla"})
         self.chunk = 1048576 # 1024 x 1024 i.e. 1MiB
+        # Seconds to wait on connects and reads - None waits as long as the
+        # socket default allows
+        self.timeout = kwargs.get("timeout")
+        # Optional RateLimiter - can be shared with other Downloaders
+        self.limiter = kwargs.get("limiter")
         if os.name=="nt": os.system("color") # Initialize cmd for ANSI escapes
-        # Provide reasonable default logic to workaround macOS CA file handling 
-        cafile = ssl.get_default_verify_paths().openssl_cafile
-        try:
-            # If default OpenSSL CA file does not exist, use that from certifi
-            if not os.path.exists(cafile):
-                import certifi
-                cafile = certifi.where()
-            self.ssl_context = ssl.create_default_context(cafile=cafile)
-        except:
-            # None of the above worked, disable certificate verification for now
-            self.ssl_context = ssl._create_unverified_context()
+        # The SSL context is built on first use - loading the CA file is
+        # the slowest part of setting up
+        self._ssl_context = None
         return
 
+    @property
+    def ssl_context(self):
+        if self._ssl_context is None:
+            # Provide reasonable default logic to workaround macOS CA file handling 
+            cafile = ssl.get_default_verify_paths().openssl_cafile
+            try:
+                # If default OpenSSL CA file does not exist, use that from certifi
+                if not os.path.exists(cafile):
+                    import certifi
+                    cafile = certifi.where()
+                self._ssl_context = ssl.create_default_context(cafile=cafile)
+            except:
+                # None of the above worked, disable certificate verification for now
+                self._ssl_context = ssl._create_unverified_context()
+        return self._ssl_context
+
+    @ssl_context.setter
+    def ssl_context(self, value):
+        self._ssl_context = value
+
     def _decode(self, value, encoding="utf-8", errors="ignore"):
         # Helper method to only decode if bytes type
         if sys.version_info >= (3,0) and isinstance(value, bytes):
@@ -206,9 +301,20 @@ class Downloader:
 
     def open_url(self, url, headers = None):
         headers = self._get_headers(headers)
+        if timer.enabled:
+            with timer.span("downloader.open_url", url=url):
+                return self._open_url(url, headers)
+        return self._open_url(url, headers)
+
+    def _open_url(self, url, headers):
         # Wrap up the try/except block so we don't have to do this for each function
+        if self.limiter:
+            self.limiter.wait(requests=1)
         try:
-            response = urlopen(Request(url, headers=headers), context=self.ssl_context)
+            if self.timeout is None:
+                response = urlopen(Request(url, headers=headers), context=self.ssl_context)
+            else:
+                response = urlopen(Request(url, headers=headers), context=self.ssl_context, timeout=self.timeout)
         except Exception as e:
             # No fixing this - bail
             return None
@@ -217,11 +323,22 @@ class Downloader:
     def get_size(self, *args, **kwargs):
         return get_size(*args,**kwargs)
 
+    def _read(self, response):
+        # Reads the next chunk - sized by and paid for through the limiter
+        # when we have one, self.chunk otherwise
+        if not self.limiter:
+            return response.read(self.chunk)
+        chunk = response.read(self.limiter.chunk_size(self.chunk))
+        if chunk:
+            self.limiter.wait(bytes=len(chunk))
+        return chunk
+
     def get_string(self, url, progress = True, headers = None, expand_gzip = True):
         response = self.get_bytes(url,progress,headers,expand_gzip)
         if response is None: return None
         return self._decode(response)
 
+    @timed("downloader.get_bytes")
     def get_bytes(self, url, progress = True, headers = None, expand_gzip = True):
         response = self.open_url(url, headers)
         if response is None: return None
@@ -243,9 +360,10 @@ class Downloader:
             if os.name == "nt" and hasattr(multiprocessing,"forking"):
                 self._update_main_name()
             process.start()
+        if self.limiter: self.limiter.start()
         try:
             while True:
-                chunk = response.read(self.chunk)
+                chunk = self._read(response)
                 if progress:
                     # Add our items to the queue
                     queue.put((time.time(),len(chunk)))
@@ -254,6 +372,7 @@ class Downloader:
         finally:
             # Close the response whenever we're done
             response.close()
+            if self.limiter: self.limiter.stop()
         if expand_gzip and response.headers.get("Content-Encoding","unknown").lower() == "gzip":
             fileobj = BytesIO(chunk_so_far)
             gfile   = gzip.GzipFile(fileobj=fileobj)
@@ -264,6 +383,7 @@ class Downloader:
             process.join()
         return chunk_so_far
 
+    @timed("downloader.stream_to_file")
     def stream_to_file(self, url, file_path, progress = True, headers = None, ensure_size_if_present = True, allow_resume = False):
         response = self.open_url(url, headers)
         if response is None: return None
@@ -307,9 +427,10 @@ class Downloader:
                 self._update_main_name()
             process.start()
         with open(file_path,mode) as f:
+            if self.limiter: self.limiter.start()
             try:
                 while True:
-                    chunk = response.read(self.chunk)
+                    chunk = self._read(response)
                     bytes_so_far += len(chunk)
                     if progress:
                         # Add our items to the queue
@@ -319,6 +440,7 @@ class Downloader:
             finally:
                 # Close the response whenever we're done
                 response.close()
+                if self.limiter: self.limiter.stop()
         if progress:
             # Finalize the queue and wait
             queue.put("DONE")
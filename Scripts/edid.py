@@ -0,0 +1,120 @@
+import re, binascii
+
+# Python port of the patch logic in adaugherity's patch-edid.rb - lets us build
+# overrides without ruby, and without shelling out once per display
+PATCH_VERSION = 1
+PRODUCT_NAME = "Display with forced RGB mode (EDID override)"
+
+_EDID_RE = re.compile(r'"IODisplayEDID"\s*=\s*<([0-9a-fA-F]+)>')
+_VENDOR_RE = re.compile(r'"DisplayVendorID"\s*=\s*(\d+)')
+_PRODUCT_RE = re.compile(r'"DisplayProductID"\s*=\s*(\d+)')
+
+def _to_bytes(value):
+    # Accepts raw EDID bytes or a hex string
+    if isinstance(value, (bytes, bytearray)) and bytearray(value[:2]) == bytearray(b"\x00\xff"):
+        return bytes(value)
+    if isinstance(value, (bytes, bytearray)):
+        value = value.decode("ascii")
+    return binascii.unhexlify("".join(value.split()))
+
+def checksum(block):
+    # Returns the checksum byte that makes the first 127 bytes of the block
+    # sum to 0 mod 256
+    return (0x100 - (sum(bytearray(block[:127])) % 256)) % 256
+
+def is_valid(edid):
+    # Checks the header and the checksum of every 128 byte block
+    edid = bytearray(edid)
+    if len(edid) < 128 or len(edid) % 128 or edid[:8] != bytearray(b"\x00\xff\xff\xff\xff\xff\xff\x00"):
+        return False
+    return all(checksum(edid[i:i+128]) == edid[i+127] for i in range(0, len(edid), 128))
+
+def vendor_id(edid):
+    # The big-endian PNP id at bytes 8-9 is what macOS reports as DisplayVendorID
+    edid = bytearray(edid)
+    return (edid[8] << 8) | edid[9]
+
+def product_id(edid):
+    # The little-endian product code at bytes 10-11 is DisplayProductID
+    edid = bytearray(edid)
+    return edid[10] | (edid[11] << 8)
+
+def display_name(edid):
+    # Walks the 4 descriptor blocks looking for the monitor name (0xFC)
+    edid = bytearray(edid)
+    for offset in (54, 72, 90, 108):
+        block = edid[offset:offset+18]
+        if len(block) == 18 and block[:3] == bytearray(3) and block[3] == 0xFC:
+            return bytes(block[5:]).split(b"\n")[0].decode("ascii", "ignore").strip() or None
+    return None
+
+def force_rgb(edid):
+    # Returns a copy of the base block set to RGB 4:4:4 only, with the
+    # extension blocks dropped and the checksum recalculated
+    edid = bytearray(edid[:128])
+    if len(edid) < 128:
+        raise ValueError("EDID must be at least 128 bytes, got {:,}".format(len(edid)))
+    edid[24] &= ~0b11000 & 0xFF
+    edid[126] = 0
+    edid[127] = checksum(edid)
+    return bytes(edid)
+
+def build(vendor, product, name=None):
+    # Builds a minimal valid base block for the ids and monitor name, with
+    # YCbCr 4:4:4 and 4:2:2 set - a stand-in display for tests and benchmarks
+    edid = bytearray(128)
+    edid[:8] = bytearray(b"\x00\xff\xff\xff\xff\xff\xff\x00")
+    edid[8:12] = bytearray([vendor >> 8, vendor & 0xFF, product & 0xFF, product >> 8])
+    edid[24] = 0b11000
+    if name:
+        edid[54:72] = bytearray(b"\x00\x00\x00\xfc\x00") + bytearray(name[:12].encode("ascii") + b"\n").ljust(13, b" ")
+    edid[127] = checksum(edid)
+    return bytes(edid)
+
+def display(edid, vendor=None, product=None):
+    # Normalizes an EDID (bytes or hex) into a display dict
+    edid = _to_bytes(edid)
+    return {
+        "edid": edid,
+        "vendor_id": vendor_id(edid) if vendor is None else vendor,
+        "product_id": product_id(edid) if product is None else product
+    }
+
+def parse_ioreg(text):
+    # Parses `ioreg -l -w0 -d0 -r -c AppleDisplay` output into a list of
+    # display dicts - one per "+-o" entry that has an EDID
+    displays = []
+    for entry in text.split("+-o")[1:]:
+        e = _EDID_RE.search(entry)
+        if not e:
+            continue
+        v = _VENDOR_RE.search(entry)
+        p = _PRODUCT_RE.search(entry)
+        displays.append(display(
+            e.group(1),
+            vendor=int(v.group(1)) if v else None,
+            product=int(p.group(1)) if p else None
+        ))
+    return displays
+
+def folder_name(d):
+    return "DisplayVendorID-{:x}".format(d["vendor_id"])
+
+def file_name(d):
+    return "DisplayProductID-{:x}".format(d["product_id"])
+
+def build_override(d, display_is_tv=None, template=None):
+    # Returns the override plist dict for the passed display dict.  Keys in
+    # template are used as defaults - the EDID and ids always come from d.
+    name = display_name(d["edid"])
+    override = dict(template or {})
+    if not "DisplayProductName" in override:
+        override["DisplayProductName"] = "{} - forced RGB mode (EDID override)".format(name) if name else PRODUCT_NAME
+    override.update({
+        "IODisplayEDID": force_rgb(d["edid"]),
+        "DisplayVendorID": d["vendor_id"],
+        "DisplayProductID": d["product_id"]
+    })
+    if display_is_tv is not None:
+        override["DisplayIsTV"] = display_is_tv
+    return override
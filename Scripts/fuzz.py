@@ -0,0 +1,220 @@
+import sys, os, time, json, random, struct, argparse, itertools, multiprocessing, plistlib
+from io import BytesIO
+from xml.parsers.expat import ExpatError
+from . import plist
+
+# Robustness and worst-case timing harness for Scripts/plist.py.  Every input
+# is parsed in a child process with a deadline and a memory cap, so hangs and
+# runaway allocations are reported instead of taking the harness down:
+#   python -m Scripts.fuzz [--iterations N] [--seed S] [--json]
+
+try:
+    import resource
+except ImportError:
+    resource = None # Windows - no memory caps
+
+# Exceptions that count as a clean rejection of bad input
+REJECTIONS = (ValueError, ExpatError, OverflowError)
+
+###                ###
+# Input Generators #
+###                ###
+
+def _bplist(objects, top=0, offset_size=None, ref_size=1):
+    # Assembles a binary plist from already encoded objects
+    data = b"bplist00"
+    offsets = []
+    for obj in objects:
+        offsets.append(len(data))
+        data += obj
+    table = len(data)
+    offset_size = offset_size or plist._count_to_size(table)
+    for o in offsets:
+        data += _pack_int(o, offset_size)
+    return data + struct.pack(">6xBBQQQ", offset_size, ref_size, len(objects), top, table)
+
+def _pack_int(value, size):
+    return b"".join(struct.pack(">B", (value >> (8 * i)) & 0xFF) for i in range(size - 1, -1, -1))
+
+def _refs(refs, ref_size=1):
+    return b"".join(_pack_int(r, ref_size) for r in refs)
+
+def _array(refs, ref_size=1):
+    if len(refs) < 15:
+        return struct.pack(">B", 0xA0 | len(refs)) + _refs(refs, ref_size)
+    return b"\xaf\x13" + struct.pack(">Q", len(refs)) + _refs(refs, ref_size)
+
+def binary_cases(scale=1):
+    yield ("binary_self_array", "binary", _bplist([_array([0])]))
+    # Dict whose only value is itself
+    yield ("binary_self_dict", "binary", _bplist([b"\xd1\x01\x00", b"\x51a"]))
+    # Dict keyed by a container - unhashable
+    yield ("binary_container_key", "binary", _bplist([b"\xd1\x01\x02", _array([]), b"\x08"]))
+    # Trailer claiming 2**40 objects in a tiny file
+    yield ("binary_huge_object_count", "binary", b"bplist00\x08\x08" + struct.pack(">6xBBQQQ", 1, 1, 1 << 40, 0, 9))
+    # Containers and strings claiming 2**40 entries
+    yield ("binary_huge_array", "binary", _bplist([b"\xaf\x13" + struct.pack(">Q", 1 << 40)]))
+    yield ("binary_huge_string", "binary", _bplist([b"\x5f\x13" + struct.pack(">Q", 1 << 40)]))
+    # Offsets pointing past the end of the file
+    yield ("binary_bad_offset", "binary", b"bplist00\x08" + b"\xff" + struct.pack(">6xBBQQQ", 1, 1, 1, 0, 9))
+    # 3 byte (non power of two) offsets and refs over many objects
+    count = 50000 * scale
+    objs = [_array(list(range(1, count + 1)), 3)] + [b"\x10" + struct.pack(">B", i & 0xFF) for i in range(count)]
+    yield ("binary_3_byte_ints", "binary", _bplist(objs, offset_size=3, ref_size=3))
+    # Arrays nested deeper than the recursion limit
+    depth = 100000 * scale
+    objs = [_array([i + 1], 4) for i in range(depth)] + [b"\x08"]
+    yield ("binary_deep_nesting", "binary", _bplist(objs, ref_size=4))
+    # A wide, valid array of ints for throughput
+    count = 200000 * scale
+    objs = [_array(list(range(1, count + 1)), 4)] + [b"\x12" + struct.pack(">L", i) for i in range(count)]
+    yield ("binary_wide_array", "binary", _bplist(objs, ref_size=4))
+
+def xml_cases(scale=1):
+    head = b'<?xml version="1.0" encoding="UTF-8"?>\n<plist version="1.0">\n'
+    tail = b"\n</plist>\n"
+    depth = 100000 * scale
+    yield ("xml_deep_nesting", "xml", head + b"<array>" * depth + b"</array>" * depth + tail)
+    yield ("xml_whitespace_prefix", "xml", b" \t\r\n" * (2 << 20) * scale + head + b"<true/>" + tail)
+    yield ("xml_huge_data", "xml", plistlib.dumps({"a": os.urandom(16 << 20)}))
+    yield ("xml_wide_array", "xml", head + b"<array>" + b"<integer>0x7f</integer>" * (200000 * scale) + b"</array>" + tail)
+    yield ("xml_entity_expansion", "xml", b'<?xml version="1.0"?>\n<!DOCTYPE plist [<!ENTITY a "aaaaaaaaaa"><!ENTITY b "&a;&a;&a;&a;&a;&a;&a;&a;&a;&a;">]>\n<plist><string>&b;</string></plist>')
+    yield ("xml_truncated", "xml", head + b"<dict><key>a</key><data>AAAA")
+
+def _sample():
+    return {
+        "DisplayProductName": "Display é",
+        "DisplayVendorID": 1552,
+        "DisplayProductID": 41026,
+        "DisplayIsTV": False,
+        "IODisplayEDID": os.urandom(256),
+        "Timings": [{"Active": [1920, 1080], "Clock": 148.5}]
+    }
+
+def mutation_cases(iterations, seed):
+    # Random byte flips, truncations and splices of valid binary and XML plists
+    rng = random.Random(seed)
+    samples = {}
+    for kind, fmt in (("binary", plist.FMT_BINARY), ("xml", plist.FMT_XML)):
+        b = BytesIO()
+        plist.dump(_sample(), b, fmt=fmt)
+        samples[kind] = b.getvalue()
+    for i in range(iterations):
+        kind = "binary" if i % 2 == 0 else "xml"
+        data = bytearray(samples[kind])
+        op = rng.choice(("flip", "truncate", "splice"))
+        if op == "flip":
+            for _ in range(rng.randint(1, 8)):
+                data[rng.randrange(len(data))] = rng.randrange(256)
+        elif op == "truncate":
+            data = data[:rng.randrange(len(data))]
+        else:
+            start = rng.randrange(len(data))
+            data[start:start] = data[rng.randrange(len(data)):][:rng.randint(1, 64)]
+        yield ("mutation_{}_{}_{}".format(i, kind, op), kind, bytes(data))
+
+###      ###
+# Runner #
+###      ###
+
+def _child(kind, data, memory_limit, backend, queue):
+    if resource is not None and memory_limit:
+        try:
+            # Cap the address space at what we have now plus the limit
+            with open("/proc/self/statm") as f:
+                base = int(f.read().split()[0]) * resource.getpagesize()
+        except (IOError, OSError, ValueError):
+            base = 0
+        limit = base + memory_limit * 1024 * 1024
+        try:
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+        except (ValueError, OSError):
+            pass # Not supported here (e.g. macOS) - we still report the peak
+    plist.set_backend(backend)
+    if backend == "auto":
+        plist.rank_backends() # Keep the one-off ranking out of the timings
+    start_rss = _max_rss()
+    start = time.time()
+    status, error = "ok", None
+    try:
+        plist.load(BytesIO(data))
+    except MemoryError:
+        status, error = "memory", "MemoryError"
+    except REJECTIONS as e:
+        status, error = "rejected", "{}: {}".format(type(e).__name__, e)
+    except Exception as e:
+        # plist.load wraps XML data errors in a plain Exception
+        if str(e).startswith("Data error"):
+            status, error = "rejected", "{}: {}".format(type(e).__name__, e)
+        else:
+            status, error = "error", "{}: {}".format(type(e).__name__, e)
+    queue.put((status, error, time.time() - start, max(0, _max_rss() - start_rss)))
+
+def _max_rss():
+    if resource is None:
+        return 0
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return rss / 1024.0 if sys.platform == "darwin" else float(rss)
+
+def run_case(name, kind, data, time_limit=5.0, memory_limit=256, backend="auto"):
+    queue = multiprocessing.Queue()
+    p = multiprocessing.Process(target=_child, args=(kind, data, memory_limit, backend, queue))
+    p.daemon = True
+    start = time.time()
+    p.start()
+    result = {"name": name, "kind": kind, "size": len(data)}
+    try:
+        status, error, seconds, peak_kib = queue.get(timeout=time_limit)
+    except Exception:
+        p.terminate()
+        p.join()
+        seconds = time.time() - start
+        if p.exitcode is None or seconds >= time_limit:
+            result.update(status="timeout", error="Exceeded {}s".format(time_limit), seconds=seconds)
+        else:
+            result.update(status="crash", error="Exit code {}".format(p.exitcode), seconds=seconds)
+        return result
+    p.join()
+    result.update(
+        status=status,
+        error=error,
+        seconds=round(seconds, 4),
+        peak_mb=round(peak_kib / 1024.0, 2),
+        mb_per_s=round(len(data) / 1048576.0 / seconds, 2) if seconds else None
+    )
+    if status == "ok" and result["peak_mb"] > memory_limit:
+        result.update(status="memory", error="Peak {} MiB over the {} MiB limit".format(result["peak_mb"], memory_limit))
+    return result
+
+def run(iterations=100, seed=0, time_limit=5.0, memory_limit=256, scale=1, backend="auto"):
+    cases = itertools.chain(binary_cases(scale), xml_cases(scale), mutation_cases(iterations, seed))
+    return [run_case(name, kind, data, time_limit, memory_limit, backend) for name, kind, data in cases]
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m Scripts.fuzz")
+    parser.add_argument("-i", "--iterations", type=int, default=100, help="the number of random mutations to try - default is 100")
+    parser.add_argument("-s", "--seed", type=int, default=0, help="the random seed for mutations - default is 0")
+    parser.add_argument("-t", "--time-limit", type=float, default=5.0, help="seconds allowed per input - default is 5")
+    parser.add_argument("-m", "--memory-limit", type=int, default=256, help="MiB allowed per input - default is 256")
+    parser.add_argument("--scale", type=int, default=1, help="multiplies the size of the generated worst cases - default is 1")
+    parser.add_argument("-b", "--backend", default="auto", choices=["auto"] + plist.backends(), help="the binary plist backend to parse with - default is auto")
+    parser.add_argument("-j", "--json", action="store_true", help="prints the results as JSON")
+    args = parser.parse_args()
+    results = run(args.iterations, args.seed, args.time_limit, args.memory_limit, args.scale, args.backend)
+    failed = [r for r in results if not r["status"] in ("ok", "rejected")]
+    if args.json:
+        print(json.dumps({"results": results, "failed": len(failed)}, indent=2))
+    else:
+        for r in results:
+            if r["name"].startswith("mutation_") and r["status"] in ("ok", "rejected"):
+                continue # Only show the interesting mutations
+            print("{:<28} {:<9} {:>12,} B {:>9}s {:>9} MiB/s {:>8} MiB peak{}".format(
+                r["name"], r["status"], r["size"], r.get("seconds"), r.get("mb_per_s"), r.get("peak_mb"),
+                "  " + r["error"] if r.get("error") and r["status"] != "ok" else ""
+            ))
+        print("{:,} inputs, {:,} failed".format(len(results), len(failed)))
+    exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+import os, sys, glob, binascii, argparse, multiprocessing
+from io import BytesIO
+from . import plist
+from .utils import atomic_write
+
+# Bulk key/value patching for override plists, e.g.:
+#   python -m Scripts.patcher "Overrides/**/DisplayProductID-*" DisplayIsTV=false
+
+class _Delete(object):
+    # Marks a key for removal - compared by type as it crosses process boundaries
+    def __repr__(self):
+        return "<delete>"
+
+DELETE = _Delete()
+
+def parse_value(value):
+    # Values can be typed with a prefix (bool:, int:, real:, str:, data:) - bare
+    # values are inferred: true/false, integers (0x for hex), none/null to
+    # remove the key, and strings for everything else
+    prefix, _, rest = value.partition(":")
+    prefix = prefix.lower()
+    if rest or value.endswith(":"):
+        if prefix == "bool":
+            if not rest.lower() in ("true","false","yes","no","1","0"):
+                raise ValueError("Invalid bool: {}".format(rest))
+            return rest.lower() in ("true","yes","1")
+        if prefix == "int":
+            return int(rest, 16) if rest.lower().startswith("0x") else int(rest)
+        if prefix == "real":
+            return float(rest)
+        if prefix == "str":
+            return rest
+        if prefix == "data":
+            return plist.wrap_data(binascii.unhexlify("".join(rest.split())))
+    if value.lower() in ("true","false"):
+        return value.lower() == "true"
+    if value.lower() in ("none","null"):
+        return DELETE
+    try:
+        return int(value, 16) if value.lower().startswith("0x") else int(value)
+    except ValueError:
+        return value
+
+def parse_spec(spec):
+    key, sep, value = spec.partition("=")
+    if not sep or not key:
+        raise ValueError("Expected KEY=VALUE, got {}".format(spec))
+    return (key, parse_value(value))
+
+def _fragment_value(raw, span):
+    # Parses just the value element of a located entry
+    return plist.loads(b'<plist version="1.0">' + raw[span["start"]:span["end"]] + b"</plist>")
+
+def is_set(raw, key, value):
+    # Checks an XML plist's raw bytes for key already holding value by
+    # scanning for the entry and parsing only its value
+    span = plist.locate(raw, key)
+    if isinstance(value, _Delete):
+        return span["key"] is None
+    if span["key"] is None:
+        return False
+    current = _fragment_value(raw, span)
+    return type(current) == type(value) and current == value
+
+def patch_file(path, changes, dry_run=False):
+    # Applies the list of (key, value) changes to the plist at path.  Returns
+    # a (path, status) tuple where status is unchanged, patched, or an error.
+    try:
+        with open(path, "rb") as f:
+            raw = f.read()
+        binary = raw.lstrip()[:8] == b"bplist00"
+        if not binary:
+            # Edit XML in place, entry by entry, so everything we don't
+            # touch stays byte-for-byte identical
+            new = raw
+            for key, value in changes:
+                if is_set(new, key, value):
+                    continue
+                if isinstance(value, _Delete):
+                    new = plist.edit(new, key, remove=True)
+                else:
+                    new = plist.edit(new, key, value)
+            if new == raw:
+                return (path, "unchanged")
+            if not dry_run:
+                atomic_write(path, new, ".patching")
+            return (path, "patched")
+        data = plist.loads(raw)
+        if not isinstance(data, dict):
+            return (path, "error: root is not a dictionary")
+        changed = False
+        for key, value in changes:
+            if isinstance(value, _Delete):
+                if key in data:
+                    data.pop(key)
+                    changed = True
+            elif not key in data or type(data[key]) != type(value) or data[key] != value:
+                data[key] = value
+                changed = True
+        if not changed:
+            return (path, "unchanged")
+        if dry_run:
+            return (path, "patched")
+        f = BytesIO()
+        plist.dump(data, f, fmt=plist.FMT_BINARY, sort_keys=False)
+        atomic_write(path, f.getvalue(), ".patching")
+        return (path, "patched")
+    except Exception as e:
+        return (path, "error: {}".format(e))
+
+def _patch_args(args):
+    return patch_file(*args)
+
+def find(pattern):
+    if sys.version_info >= (3,5):
+        paths = glob.glob(pattern, recursive=True)
+    else:
+        paths = glob.glob(pattern)
+    return sorted(p for p in paths if os.path.isfile(p))
+
+def patch(pattern, changes, processes=None, dry_run=False, chunksize=32):
+    # Generator yielding a (path, status) tuple per matched file.  Files are
+    # patched across a process pool when there are enough of them to be worth it.
+    paths = find(pattern) if isinstance(pattern, str) else list(pattern)
+    jobs = [(p, changes, dry_run) for p in paths]
+    if processes == 1 or len(jobs) < chunksize:
+        for job in jobs:
+            yield patch_file(*job)
+        return
+    pool = multiprocessing.Pool(processes)
+    try:
+        for result in pool.imap_unordered(_patch_args, jobs, chunksize):
+            yield result
+    finally:
+        pool.close()
+        pool.join()
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m Scripts.patcher")
+    parser.add_argument("pattern", help="a glob matching the plists to patch - ** is recursive")
+    parser.add_argument("changes", nargs="+", metavar="KEY=VALUE", help=(
+        "the key and value to set - values can be prefixed with bool:, int:, real:, str:, or"
+        " data: (hex) - bare values are inferred, and none removes the key"
+    ))
+    parser.add_argument("-j", "--jobs", type=int, help="the number of processes to use - default is one per CPU")
+    parser.add_argument("-n", "--dry-run", action="store_true", help="only reports which files would change")
+    parser.add_argument("-q", "--quiet", action="store_true", help="only prints errors and the summary")
+    args = parser.parse_args()
+    try:
+        changes = [parse_spec(x) for x in args.changes]
+    except ValueError as e:
+        print(e)
+        exit(1)
+    counts = {}
+    for path, status in patch(args.pattern, changes, processes=args.jobs, dry_run=args.dry_run):
+        kind = "error" if status.startswith("error") else status
+        counts[kind] = counts.get(kind, 0) + 1
+        if not args.quiet or kind == "error":
+            print("{}: {}".format(path, status))
+    print("{:,} patched, {:,} unchanged, {:,} failed".format(
+        counts.get("patched", 0),
+        counts.get("unchanged", 0),
+        counts.get("error", 0)
+    ))
+    exit(1 if counts.get("error") else 0)
+
+if __name__ == "__main__":
+    main()
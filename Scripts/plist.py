@@ -2,8 +2,14 @@
 # Imports #
 ###     ###
 
-import datetime, os, plistlib, struct, sys, itertools, binascii
+import datetime, os, plistlib, struct, sys, time, itertools, binascii, re, tempfile, mmap, hashlib, threading, array
 from io import BytesIO
+from collections import OrderedDict
+try:
+    from .timing import timed
+except (ImportError, ValueError):
+    # Loaded on its own, outside the Scripts package - skip the timing
+    timed = lambda *a, **k: (lambda f: f)
 
 if sys.version_info < (3,0):
     # Force use of StringIO instead of cStringIO as the latter
@@ -41,28 +47,148 @@ def extract_data(value):
 def _check_py3():
     return sys.version_info >= (3, 0)
 
-def _is_binary(fp):
-    if isinstance(fp, basestring):
-        return fp.startswith(b"bplist00")
-    header = fp.read(32)
-    fp.seek(0)
-    return header[:8] == b'bplist00'
+class _Base64Decoder:
+    # Decodes base64 as it arrives from the XML parser into a bytearray, a
+    # batch of text at a time so only the batch and the decoded bytes are held.
+    # Once the decoded size passes spill_size it moves to a temp file and
+    # finish() returns a read-only mmap instead.
+    batch_size = 65536
+
+    def __init__(self, spill_size=None):
+        self.spill_size = spill_size
+        self._pieces = []
+        self._size = 0
+        self._pending = b""
+        self._buffer = bytearray()
+        self._file = None
+
+    def feed(self, text):
+        self._pieces.append(text)
+        self._size += len(text)
+        if self._size >= self.batch_size:
+            self._flush()
+
+    def _flush(self, final=False):
+        text = type(self._pieces[0])().join(self._pieces) if self._pieces else b""
+        if not isinstance(text, bytes):
+            text = text.encode("ascii")
+        self._pieces, self._size = [], 0
+        text = self._pending + b"".join(text.split())
+        # Only decode whole 4 character quanta until the end
+        usable = len(text) if final else len(text) - len(text) % 4
+        self._pending = text[usable:]
+        if usable:
+            self._write(binascii.a2b_base64(text[:usable]))
+
+    def _write(self, chunk):
+        if self._file is not None:
+            self._file.write(chunk)
+            return
+        self._buffer += chunk
+        if self.spill_size is not None and len(self._buffer) > self.spill_size:
+            self._file = tempfile.TemporaryFile()
+            self._file.write(self._buffer)
+            self._buffer = bytearray()
+
+    def finish(self):
+        self._flush(final=True)
+        if self._file is None:
+            return bytes(self._buffer)
+        self._file.flush()
+        return mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+_data_types = (bytes, bytearray, memoryview, mmap.mmap)
+
+def _write_base64(writer, data, maxlinelength):
+    # Encodes a line at a time straight to the writer instead of building
+    # the whole encoded string first
+    maxbinsize = (maxlinelength // 4) * 3
+    view = memoryview(data)
+    for i in range(0, len(view), maxbinsize):
+        writer.writeln(binascii.b2a_base64(view[i:i + maxbinsize]).rstrip(b"\n"))
+
+_SNIFF_SIZE = 65536
+
+class _PrefixedReader:
+    # Replays the bytes already peeked from a non-seekable stream before
+    # reading the rest of it
+    def __init__(self, prefix, fp):
+        self._prefix = prefix
+        self._fp = fp
 
-def _seek_past_whitespace(fp):
-    offset = 0
+    def read(self, size=-1):
+        if not self._prefix:
+            return self._fp.read(size)
+        if size is None or size < 0:
+            data, self._prefix = self._prefix + self._fp.read(), b""
+            return data
+        data, self._prefix = self._prefix[:size], self._prefix[size:]
+        return data
+
+def _detect(header):
+    if header[:8] == b"bplist00":
+        return FMT_BINARY
+    if not _check_py3():
+        return FMT_XML # Python 2 only has the XML parser
+    for fmt, info in plistlib._FORMATS.items():
+        if info["detect"](header):
+            return fmt
+    return None
+
+def _sniff(fp):
+    # Peeks at the start of fp once, a buffer at a time, to find the format
+    # and skip any UTF-8 BOM and leading whitespace.  Returns a (format,
+    # stream) tuple where the stream is positioned at the first byte to parse
+    # - format is None if it can't be detected.
+    if _check_py3() and isinstance(fp, (str, bytes, bytearray)):
+        # The plist itself rather than a stream - read it like loads() does
+        fp = BytesIO(fp.encode("utf-8") if isinstance(fp, str) else bytes(fp))
+    elif isinstance(fp, basestring):
+        # Python 2 str or unicode
+        if fp.startswith(b"bplist00"):
+            return (FMT_BINARY, fp)
+        stripped = fp[3:] if fp.startswith(b"\xef\xbb\xbf") else fp
+        stripped = stripped.lstrip()
+        return (_detect(stripped[:32]), stripped)
+    try:
+        start = fp.tell() if fp.seekable() else None
+    except AttributeError:
+        # Python 2 file objects have no seekable()
+        try:
+            start = fp.tell()
+        except (IOError, OSError):
+            start = None
+    buf = fp.read(_SNIFF_SIZE)
+    if buf[:8] == b"bplist00":
+        if start is None:
+            # The binary parser reads from the end - hand it everything
+            return (FMT_BINARY, BytesIO(buf + fp.read()))
+        fp.seek(start)
+        return (FMT_BINARY, fp)
+    offset = 3 if buf.startswith(b"\xef\xbb\xbf") else 0
     while True:
-        byte = fp.read(1)
-        if not byte:
-            # End of file, reset offset and bail
-            offset = 0
+        rest = buf[offset:].lstrip()
+        offset = len(buf) - len(rest)
+        if len(rest) >= 32:
             break
-        if not byte.isspace():
-            # Found our first non-whitespace character
+        more = fp.read(_SNIFF_SIZE)
+        if not more:
             break
-        offset += 1
-    # Seek to the first non-whitespace char
-    fp.seek(offset)
-    return offset
+        if not rest:
+            # All whitespace so far - drop it rather than growing the buffer
+            if start is not None:
+                start += len(buf)
+            buf, offset = more, 0
+        else:
+            buf += more
+    if not buf[offset:]:
+        # Nothing but whitespace - let the parser complain about it
+        offset = 0
+    fmt = _detect(buf[offset:offset + 32])
+    if start is None:
+        return (fmt, _PrefixedReader(buf[offset:], fp))
+    fp.seek(start + offset)
+    return (fmt, fp)
 
 ###                             ###
 # Deprecated Functions - Remapped #
@@ -84,31 +210,26 @@ def writePlist(value, pathOrFile):
 # Remapped Functions #
 ###                ###
 
-def load(fp, fmt=None, use_builtin_types=None, dict_type=dict):
-    if _is_binary(fp):
+@timed("plist.load")
+def load(fp, fmt=None, use_builtin_types=None, dict_type=dict, data_spill_size=None, array_type=None):
+    value = _load(fp, fmt=fmt, use_builtin_types=use_builtin_types, dict_type=dict_type, data_spill_size=data_spill_size)
+    if array_type is not None:
+        value = to_arrays(value, array_type=array_type)
+    return value
+
+def _load(fp, fmt=None, use_builtin_types=None, dict_type=dict, data_spill_size=None):
+    detected, fp = _sniff(fp)
+    if detected == FMT_BINARY:
         use_builtin_types = False if use_builtin_types is None else use_builtin_types
-        try:
-            p = _BinaryPlistParser(use_builtin_types=use_builtin_types, dict_type=dict_type)
-        except:
-            # Python 3.9 removed use_builtin_types
-            p = _BinaryPlistParser(dict_type=dict_type)
-        return p.parse(fp)
+        return _binary_load(fp, use_builtin_types, dict_type)
     elif _check_py3():
-        offset = _seek_past_whitespace(fp)
         use_builtin_types = True if use_builtin_types is None else use_builtin_types
         # We need to monkey patch this to allow for hex integers - code taken/modified from 
         # https://github.com/python/cpython/blob/3.8/Lib/plistlib.py
+        fmt = fmt or detected
         if fmt is None:
-            header = fp.read(32)
-            fp.seek(offset)
-            for info in plistlib._FORMATS.values():
-                if info['detect'](header):
-                    P = info['parser']
-                    break
-            else:
-                raise plistlib.InvalidFileException()
-        else:
-            P = plistlib._FORMATS[fmt]['parser']
+            raise plistlib.InvalidFileException()
+        P = plistlib._FORMATS[fmt]['parser']
         try:
             p = P(use_builtin_types=use_builtin_types, dict_type=dict_type)
         except:
@@ -123,16 +244,29 @@ def load(fp, fmt=None, use_builtin_types=None, dict_type=dict):
                     p.add_object(value)
                 else:
                     raise OverflowError("Integer overflow at line {}".format(p.parser.CurrentLineNumber))
+            # Decode <data> elements as they stream in rather than joining
+            # all of the text first
+            decoder = [None]
+            def begin_data(attrs):
+                decoder[0] = _Base64Decoder(spill_size=data_spill_size)
+            def handle_data(data):
+                if decoder[0] is None:
+                    p.data.append(data)
+                else:
+                    decoder[0].feed(data)
             def end_data():
                 try:
-                    p.add_object(plistlib._decode_base64(p.get_data()))
+                    p.add_object(decoder[0].finish())
                 except Exception as e:
                     raise Exception("Data error at line {}: {}".format(p.parser.CurrentLineNumber,e))
+                finally:
+                    decoder[0] = None
             p.end_integer = end_integer
+            p.begin_data = begin_data
+            p.handle_data = handle_data
             p.end_data = end_data
         return p.parse(fp)
     else:
-        offset = _seek_past_whitespace(fp)
         # Is not binary - assume a string - and try to load
         # We avoid using readPlistFromString() as that uses
         # cStringIO and fails when Unicode strings are detected
@@ -144,7 +278,7 @@ def load(fp, fmt=None, use_builtin_types=None, dict_type=dict):
         parser = ParserCreate()
         parser.StartElementHandler = p.handleBeginElement
         parser.EndElementHandler = p.handleEndElement
-        parser.CharacterDataHandler = p.handleData
+        parser.CharacterDataHandler = lambda data: handle_data(data)
         # We also need to monkey patch this to allow for other dict_types, hex int support
         # proper line output for data errors, and for unicode string decoding
         def begin_dict(attrs):
@@ -158,17 +292,28 @@ def load(fp, fmt=None, use_builtin_types=None, dict_type=dict):
                 p.addObject(value)
             else:
                 raise OverflowError("Integer overflow at line {}".format(parser.CurrentLineNumber))
+        decoder = [None]
+        def begin_data(attrs):
+            decoder[0] = _Base64Decoder(spill_size=data_spill_size)
+        def handle_data(data):
+            if decoder[0] is None:
+                p.handleData(data)
+            else:
+                decoder[0].feed(data)
         def end_data():
             try:
-                p.addObject(plistlib.Data.fromBase64(p.getData()))
+                p.addObject(plistlib.Data(decoder[0].finish()))
             except Exception as e:
                 raise Exception("Data error at line {}: {}".format(parser.CurrentLineNumber,e))
+            finally:
+                decoder[0] = None
         def end_string():
             d = p.getData()
             if isinstance(d,unicode):
                 d = d.encode("utf-8")
             p.addObject(d)
         p.begin_dict = begin_dict
+        p.begin_data = begin_data
         p.end_integer = end_integer
         p.end_data = end_data
         p.end_string = end_string
@@ -182,24 +327,46 @@ def load(fp, fmt=None, use_builtin_types=None, dict_type=dict):
         parser.ParseFile(fp)
         return p.root
 
-def loads(value, fmt=None, use_builtin_types=None, dict_type=dict):
+def loads(value, fmt=None, use_builtin_types=None, dict_type=dict, data_spill_size=None, array_type=None):
     if _check_py3() and isinstance(value, basestring):
         # If it's a string - encode it
         value = value.encode()
     try:
-        return load(BytesIO(value),fmt=fmt,use_builtin_types=use_builtin_types,dict_type=dict_type)
+        return load(BytesIO(value),fmt=fmt,use_builtin_types=use_builtin_types,dict_type=dict_type,data_spill_size=data_spill_size,array_type=array_type)
     except:
         # Python 3.9 removed use_builtin_types
-        return load(BytesIO(value),fmt=fmt,dict_type=dict_type)
-
-def dump(value, fp, fmt=FMT_XML, sort_keys=True, skipkeys=False):
+        return load(BytesIO(value),fmt=fmt,dict_type=dict_type,data_spill_size=data_spill_size,array_type=array_type)
+
+def _xml_writer(fp, sort_keys, skipkeys, indent_level=0, header=True):
+    # plistlib's XML writer with data handling monkey patched to encode a
+    # line at a time, and to accept memoryview and mmap values (e.g. from
+    # data_spill_size)
+    writer = plistlib._PlistWriter(fp, indent_level=indent_level, writeHeader=header, sort_keys=sort_keys, skipkeys=skipkeys)
+    write_value = writer.write_value
+    def write_data_value(value):
+        if isinstance(value, _data_types):
+            write_bytes(value)
+        else:
+            write_value(value)
+    def write_bytes(data):
+        writer.begin_element("data")
+        writer._indent_level -= 1
+        maxlinelength = max(16, 76 - len(writer.indent.replace(b"\t", b" " * 8) * writer._indent_level))
+        _write_base64(writer, data, maxlinelength)
+        writer._indent_level += 1
+        writer.end_element("data")
+    writer.write_value = write_data_value
+    writer.write_bytes = write_bytes
+    return writer
+
+@timed("plist.dump")
+def dump(value, fp, fmt=FMT_XML, sort_keys=True, skipkeys=False, intern_containers=False):
     if fmt == FMT_BINARY:
         # Assume binary at this point
-        writer = _BinaryPlistWriter(fp, sort_keys=sort_keys, skipkeys=skipkeys)
-        writer.write(value)
+        _binary_dump(value, fp, sort_keys, skipkeys, intern_containers)
     elif fmt == FMT_XML:
         if _check_py3():
-            plistlib.dump(value, fp, fmt=fmt, sort_keys=sort_keys, skipkeys=skipkeys)
+            _xml_writer(fp, sort_keys, skipkeys).write(value)
         else:
             # We need to monkey patch a bunch here too in order to avoid auto-sorting
             # of keys
@@ -236,6 +403,569 @@ def dumps(value, fmt=FMT_XML, skipkeys=False, sort_keys=True):
         value = value.decode("utf-8")
     return value
 
+###             ###
+# Binary Backends #
+###             ###
+
+# Binary plist implementations by name.  Each entry holds:
+#   load(fp, use_builtin_types, dict_type)
+#   dump(value, fp, sort_keys, skipkeys, intern_containers)
+#   features - the optional behaviour (beyond dict_type, sort_keys and
+#              skipkeys, which all backends honor) it supports
+# "auto" dispatches to the fastest backend that passed check_backend() and
+# supports what the call needs.  Hex integers and the other XML patches are
+# unaffected - XML always goes through the patched parser in _load.
+_BACKENDS = OrderedDict()
+_backend = "auto"
+_ranking = None
+_ranking_lock = threading.Lock()
+
+def register_backend(name, load, dump, features=()):
+    global _ranking
+    _BACKENDS[name] = {"load": load, "dump": dump, "features": frozenset(features)}
+    _ranking = None
+
+def backends():
+    return list(_BACKENDS)
+
+def get_backend():
+    return _backend
+
+def set_backend(name):
+    # Sends every binary load and dump through the named backend - "auto"
+    # restores the default dispatch
+    global _backend
+    if name != "auto" and not name in _BACKENDS:
+        raise ValueError("Unknown plist backend: {}".format(name))
+    _backend = name
+
+def _builtin_load(fp, use_builtin_types, dict_type):
+    return _BinaryPlistParser(use_builtin_types=use_builtin_types, dict_type=dict_type).parse(fp)
+
+def _builtin_dump(value, fp, sort_keys, skipkeys, intern_containers):
+    _BinaryPlistWriter(fp, sort_keys=sort_keys, skipkeys=skipkeys, intern_containers=intern_containers).write(value)
+
+def _stdlib_load(fp, use_builtin_types, dict_type):
+    try:
+        try:
+            p = plistlib._BinaryPlistParser(use_builtin_types=use_builtin_types, dict_type=dict_type)
+        except TypeError:
+            # Python 3.9 removed use_builtin_types
+            p = plistlib._BinaryPlistParser(dict_type=dict_type)
+        value = p.parse(fp)
+        # plistlib hands back containers that hold themselves - reject
+        # them like our parser does
+        _reject_cycles(value, set(), set())
+    except (plistlib.InvalidFileException, RuntimeError):
+        # RuntimeError covers runaway nesting, same as our parser
+        raise InvalidFileException()
+    if any(isinstance(o, plistlib.UID) for o in p._objects):
+        value = _own_uids(value, set())
+    return value
+
+def _reject_cycles(value, path, done):
+    # path holds the ids of the containers above value, done those already
+    # checked - shared (but acyclic) containers are only walked once
+    if not isinstance(value, (list, dict)) or id(value) in done:
+        return
+    if id(value) in path:
+        raise InvalidFileException()
+    path.add(id(value))
+    for v in (value.values() if isinstance(value, dict) else value):
+        _reject_cycles(v, path, done)
+    path.discard(id(value))
+    done.add(id(value))
+
+def _own_uids(value, seen):
+    # Swaps plistlib's UIDs for ours, in place, so every backend hands back
+    # the same types
+    if isinstance(value, plistlib.UID):
+        return UID(value.data)
+    if id(value) in seen:
+        return value
+    if isinstance(value, list):
+        seen.add(id(value))
+        value[:] = [_own_uids(v, seen) for v in value]
+    elif isinstance(value, dict):
+        seen.add(id(value))
+        for k in value:
+            value[k] = _own_uids(value[k], seen)
+    return value
+
+def _stdlib_dump(value, fp, sort_keys, skipkeys, intern_containers):
+    # Buffered so an unsupported type (e.g. our UID) raises TypeError before
+    # anything reaches fp, and the dispatcher can fall back
+    buf = BytesIO()
+    plistlib._BinaryPlistWriter(buf, sort_keys=sort_keys, skipkeys=skipkeys).write(value)
+    fp.write(buf.getvalue())
+
+register_backend("builtin", _builtin_load, _builtin_dump, features=("intern_containers", "uid"))
+if hasattr(plistlib, "_BinaryPlistParser") and hasattr(plistlib, "UID"):
+    register_backend("stdlib", _stdlib_load, _stdlib_dump)
+
+def _conformance_value(dict_type=dict):
+    value = dict_type()
+    value["true"] = True
+    value["false"] = False
+    value["ints"] = [0, 1, -1, 255, 256, 65535, 65536, 1 << 31, 1 << 32, (1 << 63) - 1, -1 << 63]
+    value["reals"] = [0.5, -1.25e300]
+    value["date"] = datetime.datetime(2024, 1, 2, 3, 4, 5)
+    value["data"] = [wrap_data(b""), wrap_data(b"\x00\xff" * 20)]
+    value["strings"] = ["", "RGB", u"Forced RGB é ✓"]
+    value["empty"] = [[], dict_type()]
+    value["nested"] = dict_type([("z", [dict_type([("a", [1])])]), ("a", "b")])
+    return value
+
+def _cross_load(data, name, dict_type=dict):
+    return _BACKENDS[name]["load"](BytesIO(data), False, dict_type)
+
+def _cross_dump(value, name, sort_keys=True, skipkeys=False):
+    f = BytesIO()
+    _BACKENDS[name]["dump"](value, f, sort_keys, skipkeys, False)
+    return f.getvalue()
+
+def check_backend(name):
+    # The conformance suite every backend has to pass to be picked by "auto".
+    # Output is checked against the builtin backend in both directions.
+    # Returns a list of (operation, failure) tuples - empty if it conforms.
+    failures = []
+    def check(op, label, func):
+        try:
+            if not func():
+                failures.append((op, label))
+        except Exception as e:
+            failures.append((op, "{}: {}".format(label, repr(e))))
+    value = _conformance_value()
+    ordered = _conformance_value(OrderedDict)
+    uid = {"uid": UID(7), "uids": [UID(0), UID((1 << 32) - 1)]}
+    check("load", "round trip", lambda: _cross_load(_cross_dump(value, "builtin"), name) == value)
+    check("load", "dict_type", lambda: type(_cross_load(_cross_dump(ordered, "builtin"), name, OrderedDict)["nested"]) == OrderedDict)
+    check("load", "uid", lambda: _cross_load(_cross_dump(uid, "builtin"), name) == uid)
+    check("dump", "round trip", lambda: _cross_load(_cross_dump(value, name), "builtin") == value)
+    check("dump", "sort_keys", lambda: list(_cross_load(_cross_dump(ordered, name, sort_keys=False), "builtin", OrderedDict)["nested"]) == ["z", "a"])
+    check("dump", "skipkeys", lambda: _cross_load(_cross_dump({1: 1, "a": 1}, name, sort_keys=False, skipkeys=True), "builtin") == {"a": 1})
+    if "uid" in _BACKENDS[name]["features"]:
+        check("dump", "uid", lambda: _cross_load(_cross_dump(uid, name), "builtin") == uid)
+    # Malformed input has to be rejected with InvalidFileException (a
+    # ValueError) rather than anything else
+    good = _cross_dump(value, "builtin")
+    for label, data in (
+        ("truncated", good[:-40]),
+        ("no trailer", good[:8]),
+        ("huge object count", b"bplist00\x08\x08" + struct.pack(">6xBBQQQ", 1, 1, 1 << 40, 0, 9)),
+        ("huge array", b"bplist00\xaf\x13" + struct.pack(">Q", 1 << 40) + b"\x08" + struct.pack(">6xBBQQQ", 1, 1, 1, 0, 18)),
+        ("self reference", b"bplist00\xa1\x00\x08" + struct.pack(">6xBBQQQ", 1, 1, 1, 0, 10))
+    ):
+        def rejected(data=data):
+            try:
+                _cross_load(data, name)
+            except ValueError:
+                return True
+            return False
+        check("load", label, rejected)
+    return failures
+
+def rank_backends(force=False):
+    # Times every conforming backend on an override sized sample and returns
+    # {"load": [...], "dump": [...]} with the names fastest first.  Runs once
+    # per process on first use unless forced.
+    global _ranking
+    with _ranking_lock:
+        if _ranking is not None and not force:
+            return _ranking
+        sample = {
+            "DisplayProductName": "Forced RGB Mode (EDID override)",
+            "IODisplayEDID": wrap_data(b"\x00\xff" * 128),
+            "Timings": [{"Index": i, "Clock": 148500, "Active": [1920, 1080]} for i in range(20)]
+        }
+        data = _cross_dump(sample, "builtin")
+        times = {"load": [], "dump": []}
+        for name in _BACKENDS:
+            failed = set(op for op, label in check_backend(name))
+            for op, func in (
+                ("load", lambda: _cross_load(data, name)),
+                ("dump", lambda: _cross_dump(sample, name))
+            ):
+                if op in failed:
+                    continue
+                best = None
+                for _ in range(3):
+                    start = time.time()
+                    func()
+                    elapsed = time.time() - start
+                    best = elapsed if best is None else min(best, elapsed)
+                times[op].append((best, name))
+        _ranking = dict((op, [name for t, name in sorted(times[op])]) for op in times)
+        return _ranking
+
+def _choose(op, features=()):
+    # Returns the backend names to try, in order, for op
+    features = frozenset(features)
+    if _backend != "auto":
+        missing = features - _BACKENDS[_backend]["features"]
+        if missing:
+            raise ValueError("The {} plist backend doesn't support {}".format(_backend, ", ".join(sorted(missing))))
+        return [_backend]
+    names = [n for n in rank_backends()[op] if features <= _BACKENDS[n]["features"]]
+    # The builtin backend is the reference - always the last resort
+    return names if "builtin" in names else names + ["builtin"]
+
+def _binary_load(fp, use_builtin_types, dict_type):
+    return _BACKENDS[_choose("load")[0]]["load"](fp, use_builtin_types, dict_type)
+
+def _binary_dump(value, fp, sort_keys, skipkeys, intern_containers):
+    names = _choose("dump", ("intern_containers",) if intern_containers else ())
+    for name in names:
+        try:
+            return _BACKENDS[name]["dump"](value, fp, sort_keys, skipkeys, intern_containers)
+        except TypeError:
+            # Unsupported type - try the next backend, or raise from the last
+            if name == names[-1]:
+                raise
+
+###             ###
+# Array Conversion #
+###             ###
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError("array_type=\"numpy\" requires numpy to be installed")
+    return numpy
+
+def _int_typecode(values):
+    # Picks the array typecode for a list of ints, or None if they don't fit
+    low, high = min(values), max(values)
+    if low >= -1 << 63 and high < 1 << 63:
+        return "q"
+    if low >= 0 and high < 1 << 64:
+        return "Q"
+    return None
+
+def stack_data(blobs, array_type="numpy"):
+    # Stacks same-length data blobs into a single 2D uint8 matrix - one join,
+    # no per-byte objects.  Returns a numpy array, or a 2D memoryview for
+    # array_type="array".
+    blobs = [extract_data(b) for b in blobs]
+    if not blobs:
+        raise ValueError("No data to stack")
+    width = len(blobs[0])
+    if any(len(b) != width for b in blobs):
+        raise ValueError("All data blobs must be the same length to stack")
+    joined = b"".join(blobs)
+    if array_type == "numpy":
+        return _numpy().frombuffer(joined, dtype="uint8").reshape(len(blobs), width)
+    if array_type == "array":
+        return memoryview(joined).cast("B", (len(blobs), width))
+    raise ValueError("Unsupported array_type: {}".format(array_type))
+
+def to_arrays(value, array_type="numpy"):
+    # Walks a loaded plist and replaces homogeneous arrays:  ints and reals
+    # become array.array ("array") or numpy arrays ("numpy"), and arrays of
+    # same-length data blobs are stacked via stack_data()
+    if not array_type in ("array","numpy"):
+        raise ValueError("Unsupported array_type: {}".format(array_type))
+    if array_type == "numpy":
+        _numpy() # Fail early if it's missing
+    return _to_arrays(value, array_type)
+
+def _to_arrays(value, array_type):
+    if isinstance(value, dict):
+        for k in value:
+            value[k] = _to_arrays(value[k], array_type)
+        return value
+    if not isinstance(value, list):
+        return value
+    if value:
+        kinds = set(type(x) for x in value)
+        if len(kinds) == 1:
+            kind = kinds.pop()
+            if kind is int or (not _check_py3() and kind is long):
+                code = _int_typecode(value)
+                if code:
+                    if array_type == "numpy":
+                        return _numpy().array(value, dtype="int64" if code == "q" else "uint64")
+                    return array.array(code, value)
+            elif kind is float:
+                if array_type == "numpy":
+                    return _numpy().array(value, dtype="float64")
+                return array.array("d", value)
+            elif kind in (bytes, bytearray) or (hasattr(plistlib, "Data") and kind is plistlib.Data):
+                if len(set(len(extract_data(x)) for x in value)) == 1 and (array_type == "numpy" or _check_py3()):
+                    return stack_data(value, array_type=array_type)
+    return [_to_arrays(x, array_type) for x in value]
+
+###            ###
+# Cached Loading #
+###            ###
+
+class _FrozenDict(dict):
+    # Read-only dict handed out by PlistCache so one caller can't change the
+    # shared parse result under another
+    def _read_only(self, *args, **kwargs):
+        raise TypeError("Cached plist values are read-only - pass copy=True for a mutable copy")
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = _read_only
+    __ior__ = _read_only # d |= other on 3.9+
+
+    def __copy__(self):
+        return _thaw(self)
+
+    def __deepcopy__(self, memo):
+        return _thaw(self)
+
+    def __reduce__(self):
+        return (dict, (dict(self),))
+
+def _freeze(value):
+    if isinstance(value, dict):
+        return _FrozenDict((k, _freeze(v)) for k, v in value.items())
+    if isinstance(value, list):
+        return tuple(_freeze(v) for v in value)
+    if isinstance(value, bytearray):
+        return bytes(value)
+    return value
+
+def _thaw(value, dict_type=dict):
+    if isinstance(value, dict):
+        return dict_type((k, _thaw(v, dict_type)) for k, v in value.items())
+    if isinstance(value, tuple):
+        return [_thaw(v, dict_type) for v in value]
+    return value
+
+class PlistCache:
+    # Bounded LRU of parsed plists.  With key="stat" entries are keyed by path
+    # and reused while the inode, mtime and size match; with key="hash" they
+    # are keyed by a hash of the contents, so identical files share an entry.
+    # Values are frozen - dicts are read-only and arrays are tuples - unless
+    # copy=True is passed, which returns a fresh mutable copy.
+    def __init__(self, max_entries=256, key="stat"):
+        if not key in ("stat","hash"):
+            raise ValueError("key must be stat or hash")
+        self.max_entries = max_entries
+        self.key = key
+        self.hits = self.misses = self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _identity(self, st):
+        mtime = getattr(st, "st_mtime_ns", st.st_mtime)
+        return (st.st_dev, st.st_ino, mtime, st.st_size)
+
+    def _get(self, key, identity):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None or entry[0] != identity:
+                self.misses += 1
+                return _undefined
+            # Re-insert to mark it as most recently used
+            self._entries[key] = entry
+            self.hits += 1
+            return entry[1]
+
+    def _put(self, key, identity, value):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (identity, value)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def load(self, path, copy=False, **kwargs):
+        # Loads the plist at path via the cache - kwargs are passed to load()
+        # and are part of the cache key
+        options = tuple(sorted(kwargs.items()))
+        with open(path, "rb") as f:
+            source = f
+            if self.key == "hash":
+                data = f.read()
+                key = identity = (hashlib.sha256(data).hexdigest(), options)
+                source = BytesIO(data)
+            else:
+                # The identity comes from the open file, so a replace between
+                # the stat and the read can't pair new contents with old keys
+                key = (os.path.realpath(path), options)
+                identity = self._identity(os.fstat(f.fileno()))
+            value = self._get(key, identity)
+            if value is _undefined:
+                value = _freeze(load(source, **kwargs))
+                self._put(key, identity, value)
+        return _thaw(value, kwargs.get("dict_type", dict)) if copy else value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": float(self.hits) / total if total else 0.0
+        }
+
+_default_cache = None
+
+def load_cached(path, copy=False, **kwargs):
+    # Module level convenience wrapper around a shared PlistCache
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = PlistCache()
+    return _default_cache.load(path, copy=copy, **kwargs)
+
+###                          ###
+# Format-Preserving XML Editing #
+###                          ###
+
+# Tokens we care about while scanning - comments, CDATA, processing
+# instructions and the doctype are matched so their contents are skipped
+_XML_TOKEN_RE = re.compile(br"<!--.*?-->|<!\[CDATA\[.*?\]\]>|<\?.*?\?>|<!DOCTYPE[^>]*>|<(/?)([A-Za-z]+)[^>]*?(/?)>", re.S)
+_XML_ENTITIES = ((b"&lt;", b"<"), (b"&gt;", b">"), (b"&quot;", b'"'), (b"&apos;", b"'"), (b"&amp;", b"&"))
+
+def _xml_unescape(value):
+    for entity, char in _XML_ENTITIES:
+        value = value.replace(entity, char)
+    return value
+
+def _xml_escape(value):
+    for entity, char in _XML_ENTITIES[::-1]:
+        if char in (b'"', b"'"):
+            continue
+        value = value.replace(char, entity)
+    return value
+
+def _to_bytes(value):
+    if _check_py3() and isinstance(value, str):
+        return value.encode("utf-8")
+    if not _check_py3() and isinstance(value, unicode):
+        return value.encode("utf-8")
+    return value
+
+def locate(data, key):
+    # Scans the tags of an XML plist for key in the root dict without building
+    # any objects.  Returns a dict with the byte offsets of the key element
+    # ("key"), and the start and end of its value ("start", "end") - or with
+    # "close" set to the offset of the root </dict> when the key is missing
+    # ("close" is None and "empty" is set for a <dict/> root).
+    key = _to_bytes(key)
+    stack = []
+    found = None
+    for m in _XML_TOKEN_RE.finditer(data):
+        close, tag, empty = m.group(1), m.group(2), m.group(3)
+        if tag is None or tag == b"plist":
+            continue
+        if close:
+            if tag in (b"dict", b"array"):
+                stack.pop()
+                if not stack:
+                    return {"key": None, "start": None, "end": None, "close": m.start()}
+                if found and found["start"] is not None and len(stack) == 1:
+                    # Closed the container holding our value
+                    found["end"] = m.end()
+                    return found
+            continue
+        if not stack:
+            if tag == b"dict" and empty:
+                return {"key": None, "start": None, "end": None, "close": None, "empty": (m.start(), m.end())}
+            if tag != b"dict":
+                raise ValueError("Root object is not a dictionary")
+        elif len(stack) == 1 and stack[0] == b"dict":
+            # An element directly in the root dict
+            if found:
+                found["start"] = m.start()
+                if empty:
+                    found["end"] = m.end()
+                    return found
+                if not tag in (b"dict", b"array"):
+                    end = data.find(b"</" + tag + b">", m.end())
+                    if end == -1:
+                        raise InvalidFileException()
+                    found["end"] = end + len(tag) + 3
+                    return found
+            elif tag == b"key":
+                end = data.find(b"</key>", m.end())
+                if end == -1:
+                    raise InvalidFileException()
+                if _xml_unescape(data[m.end():end]) == key:
+                    found = {"key": m.start(), "start": None, "end": None, "close": None}
+                continue
+        if tag in (b"dict", b"array") and not empty:
+            stack.append(tag)
+    raise InvalidFileException()
+
+def _xml_fragment(value, indent=b""):
+    # Serializes value as it would appear inside a plist, indented to match
+    if _check_py3():
+        # Written at the depth of indent, so <data> wraps where plistlib would
+        level = len(indent.expandtabs(8)) // 8
+        f = BytesIO()
+        _xml_writer(f, False, False, level, header=False).write_value(value)
+        prefix = b"\t" * level
+        lines = f.getvalue().rstrip(b"\n").split(b"\n")
+        return (b"\n" + indent).join(x[len(prefix):] if x.startswith(prefix) else x for x in lines)
+    lines = _to_bytes(dumps(value, fmt=FMT_XML, sort_keys=False)).split(b"\n")
+    start = next(i for i, line in enumerate(lines) if line.startswith(b"<plist")) + 1
+    end = max(i for i, line in enumerate(lines) if line.startswith(b"</plist>"))
+    return (b"\n" + indent).join(lines[start:end])
+
+def _line_start(data, offset):
+    return data.rfind(b"\n", 0, offset) + 1
+
+def edit(data, key, value=None, remove=False):
+    # Returns the XML plist bytes in data with the root dict's key set to value
+    # (or removed).  Only the bytes for that entry change - key order, comments,
+    # whitespace and every other element are left exactly as they were.
+    if data.lstrip()[:8] == b"bplist00":
+        raise ValueError("Only XML plists can be edited in place")
+    key = _to_bytes(key)
+    span = locate(data, key)
+    if span["key"] is not None:
+        start = _line_start(data, span["key"])
+        indent = data[start:span["key"]]
+        if indent.strip():
+            # Shares a line with something else - only touch the entry itself
+            start, indent = span["key"], b""
+        if remove:
+            end = span["end"]
+            if start != span["key"] and data[end:end+1] == b"\n":
+                end += 1 # Take the rest of the line with us
+            return data[:start] + data[end:]
+        return data[:span["start"]] + _xml_fragment(value, indent) + data[span["end"]:]
+    if remove:
+        return data
+    entry = b"<key>" + _xml_escape(key) + b"</key>"
+    if span.get("empty"):
+        s, e = span["empty"]
+        indent = data[_line_start(data, s):s]
+        if indent.strip():
+            indent = b""
+        inner = indent + b"\t"
+        return data[:s] + b"<dict>\n" + inner + entry + b"\n" + inner + _xml_fragment(value, inner) + b"\n" + indent + b"</dict>" + data[e:]
+    # Insert before the root </dict>, matching the indentation of the
+    # first key if there is one
+    close = span["close"]
+    first = re.search(br"\n([ \t]*)<key>", data[:close])
+    inner = first.group(1) if first else b"\t"
+    line = _line_start(data, close)
+    if data[line:close].strip():
+        # </dict> isn't on its own line
+        return data[:close] + entry + _xml_fragment(value) + data[close:]
+    return data[:line] + inner + entry + b"\n" + inner + _xml_fragment(value, inner) + b"\n" + data[line:]
+
+def edit_file(path, key, value=None, remove=False):
+    # Edits the XML plist at path in place via edit(), writing to a temp file
+    # first.  Returns True if the file changed.
+    with open(path, "rb") as f:
+        data = f.read()
+    new = edit(data, key, value=value, remove=remove)
+    if new == data:
+        return False
+    from .utils import atomic_write # Only needed here - keeps plist.py standalone otherwise
+    atomic_write(path, new, ".editing")
+    return True
+
 ###                        ###
 # Binary Plist Stuff For Py2 #
 ###                        ###
@@ -307,6 +1037,8 @@ class _BinaryPlistParser:
             # refid->offset...
             # TRAILER
             self._fp = fp
+            self._fp.seek(0, os.SEEK_END)
+            self._size = self._fp.tell()
             self._fp.seek(-32, os.SEEK_END)
             trailer = self._fp.read(32)
             if len(trailer) != 32:
@@ -315,13 +1047,23 @@ class _BinaryPlistParser:
                 offset_size, self._ref_size, num_objects, top_object,
                 offset_table_offset
             ) = struct.unpack('>6xBBQQQ', trailer)
+            # Check the trailer against the file size before allocating
+            # anything based on it
+            if not offset_size or not self._ref_size or top_object >= num_objects or \
+                offset_table_offset + num_objects * offset_size > self._size - 32:
+                raise InvalidFileException()
             self._fp.seek(offset_table_offset)
             self._object_offsets = self._read_ints(num_objects, offset_size)
             self._objects = [_undefined] * num_objects
+            # Containers being read - one that turns up inside itself is
+            # rejected, as nothing downstream can walk a cycle
+            self._reading = set()
             return self._read_object(top_object)
 
+        # RuntimeError covers runaway nesting (RecursionError on Python 3),
+        # and TypeError containers used as dict keys
         except (OSError, IndexError, struct.error, OverflowError,
-                UnicodeDecodeError):
+                UnicodeDecodeError, RuntimeError, TypeError):
             raise InvalidFileException()
 
     def _get_size(self, tokenL):
@@ -333,21 +1075,29 @@ class _BinaryPlistParser:
             m = m & 0x3
             s = 1 << m
             f = '>' + _BINARY_FORMAT[s]
-            return struct.unpack(f, self._fp.read(s))[0]
+            size = struct.unpack(f, self._fp.read(s))[0]
+            if size > self._size:
+                # Can't possibly hold that many bytes or refs
+                raise InvalidFileException()
+            return size
 
         return tokenL
 
     def _read_ints(self, n, size):
+        if not size or size * n > self._size:
+            raise InvalidFileException()
         data = self._fp.read(size * n)
+        if len(data) != size * n:
+            raise InvalidFileException()
         if size in _BINARY_FORMAT:
-            return struct.unpack('>' + _BINARY_FORMAT[size] * n, data)
+            # Use a repeat count rather than building a format string n long
+            return struct.unpack('>{}{}'.format(n, _BINARY_FORMAT[size]), data)
+        elif _check_py3():
+            return tuple(int.from_bytes(data[i: i + size], 'big')
+                         for i in range(0, size * n, size))
         else:
-            if not size or len(data) != size * n:
-                raise InvalidFileException()
             return tuple(int(binascii.hexlify(data[i: i + size]),16)
                          for i in range(0, size * n, size))
-            '''return tuple(int.from_bytes(data[i: i + size], 'big')
-                         for i in range(0, size * n, size))'''
 
     def _read_refs(self, n):
         return self._read_ints(n, self._ref_size)
@@ -357,11 +1107,15 @@ class _BinaryPlistParser:
         read the object by reference.
         May recursively read sub-objects (content of an array/dict/set)
         """
+        if ref in self._reading:
+            raise InvalidFileException()
         result = self._objects[ref]
         if result is not _undefined:
             return result
 
         offset = self._object_offsets[ref]
+        if offset >= self._size:
+            raise InvalidFileException()
         self._fp.seek(offset)
         token = self._fp.read(1)[0]
         if not _check_py3():
@@ -424,9 +1178,9 @@ class _BinaryPlistParser:
         elif tokenH == 0xA0:  # array
             s = self._get_size(tokenL)
             obj_refs = self._read_refs(s)
-            result = []
-            self._objects[ref] = result
-            result.extend(self._read_object(x) for x in obj_refs)
+            self._reading.add(ref)
+            result = [self._read_object(x) for x in obj_refs]
+            self._reading.discard(ref)
 
         # tokenH == 0xB0 is documented as 'ordset', but is not actually
         # implemented in the Apple reference code.
@@ -439,12 +1193,13 @@ class _BinaryPlistParser:
             key_refs = self._read_refs(s)
             obj_refs = self._read_refs(s)
             result = self._dict_type()
-            self._objects[ref] = result
+            self._reading.add(ref)
             for k, o in zip(key_refs, obj_refs):
                 key = self._read_object(k)
                 if hasattr(plistlib, "Data") and isinstance(key, plistlib.Data):
                     key = key.data
                 result[key] = self._read_object(o)
+            self._reading.discard(ref)
 
         else:
             raise InvalidFileException()
@@ -468,10 +1223,13 @@ def _count_to_size(count):
 _scalars = (str, int, float, datetime.datetime, bytes)
 
 class _BinaryPlistWriter (object):
-    def __init__(self, fp, sort_keys, skipkeys):
+    def __init__(self, fp, sort_keys, skipkeys, intern_containers=False):
         self._fp = fp
         self._sort_keys = sort_keys
         self._skipkeys = skipkeys
+        # When set, structurally identical dicts and arrays are written once
+        # and shared by reference
+        self._intern_containers = intern_containers
 
     def write(self, value):
 
@@ -486,7 +1244,11 @@ class _BinaryPlistWriter (object):
         self._objidtable = {}
 
         # Create list of all objects in the plist
-        self._flatten(value)
+        if self._intern_containers:
+            self._containertable = {}
+            self._flatten_interned(value)
+        else:
+            self._flatten(value)
 
         # Size of object references in serialized containers
         # depends on the number of objects in the plist.
@@ -566,6 +1328,40 @@ class _BinaryPlistWriter (object):
             for o in value:
                 self._flatten(o)
 
+    def _flatten_interned(self, value):
+        # Post-order variant of _flatten - children are flattened first so a
+        # container can be keyed by its type and its children's refnums, which
+        # makes identical subtrees share one object.  Returns the refnum.
+        if not isinstance(value, (dict, list, tuple)):
+            self._flatten(value)
+            return self._getrefnum(value)
+        if id(value) in self._objidtable:
+            return self._objidtable[id(value)]
+        if isinstance(value, dict):
+            keys = []
+            values = []
+            items = value.items()
+            if self._sort_keys:
+                items = sorted(items)
+            for k, v in items:
+                if not isinstance(k, basestring):
+                    if self._skipkeys:
+                        continue
+                    raise TypeError("keys must be strings")
+                keys.append(k)
+                values.append(v)
+            key_refs = tuple(self._flatten_interned(k) for k in keys)
+            struct_key = ("dict", key_refs, tuple(self._flatten_interned(v) for v in values))
+        else:
+            struct_key = ("array", tuple(self._flatten_interned(o) for o in value))
+        refnum = self._containertable.get(struct_key)
+        if refnum is None:
+            refnum = len(self._objlist)
+            self._objlist.append(value)
+            self._containertable[struct_key] = refnum
+        self._objidtable[id(value)] = refnum
+        return refnum
+
     def _getrefnum(self, value):
         if isinstance(value, _scalars):
             return self._objtable[(type(value), value)]
@@ -628,8 +1424,8 @@ class _BinaryPlistWriter (object):
             f = (value - datetime.datetime(2001, 1, 1)).total_seconds()
             self._fp.write(struct.pack('>Bd', 0x33, f))
 
-        elif (_check_py3() and isinstance(value, (bytes, bytearray))) or (hasattr(plistlib, "Data") and isinstance(value, plistlib.Data)):
-            if not isinstance(value, (bytes, bytearray)):
+        elif (_check_py3() and isinstance(value, _data_types)) or (hasattr(plistlib, "Data") and isinstance(value, plistlib.Data)):
+            if not isinstance(value, _data_types):
                 value = value.data # Unpack it
             self._write_size(0x40, len(value))
             self._fp.write(value)
@@ -1,78 +1,292 @@
-import sys, subprocess, time, threading, shlex
+import sys, os, io, re, json, time, codecs, signal, subprocess, tempfile, threading, shlex
+from collections import deque
 try:
     from Queue import Queue, Empty
 except:
     from queue import Queue, Empty
 
+from .timing import timer
+from .utils import atomic_write
+
 ON_POSIX = 'posix' in sys.builtin_module_names
+# Temp folders differ every run - fixtures match them by a placeholder.
+# Built on first use as gettempdir() probes the filesystem.
+_TEMP_RE = None
+
+class _Capture:
+    # Collects one stream's output as a list of chunks that's joined once at
+    # the end.  Options:
+    #   max_output - only keep the last max_output characters
+    #   spill      - write to a temp file instead, and hand that back
+    #                (rewound) in place of the string
+    #   callback   - called with (name, text) for every chunk as it arrives
+    #   keep       - False to only pass chunks to the callback
+    def __init__(self, name, max_output=None, spill=False, callback=None, keep=True):
+        self.name = name
+        self.max_output = max_output
+        self.callback = callback
+        self.keep = keep
+        self.chunks = deque()
+        self.size = 0
+        self.file = tempfile.TemporaryFile(mode="w+") if spill and keep else None
+
+    def write(self, text):
+        if self.callback:
+            self.callback(self.name, text)
+        if not self.keep:
+            return
+        if self.file:
+            self.file.write(text)
+            return
+        self.chunks.append(text)
+        self.size += len(text)
+        if self.max_output is None:
+            return
+        # Drop from the front until we're back under the cap
+        while self.size > self.max_output:
+            drop = self.size - self.max_output
+            if len(self.chunks[0]) <= drop:
+                self.size -= len(self.chunks.popleft())
+            else:
+                self.chunks[0] = self.chunks[0][drop:]
+                self.size -= drop
+
+    def value(self):
+        if self.file:
+            self.file.seek(0)
+            return self.file
+        return "".join(self.chunks)
+
+class Result(tuple):
+    # The (output, error, returncode) tuple every command returns, plus
+    # whether it was killed for running past its deadline or cancelled
+    def __new__(cls, output, error, returncode, timed_out = False, cancelled = False):
+        r = tuple.__new__(cls, (output, error, returncode))
+        r.timed_out = timed_out
+        r.cancelled = cancelled
+        return r
+
+    output = property(lambda self: self[0])
+    error = property(lambda self: self[1])
+    returncode = property(lambda self: self[2])
 
 class Run:
 
-    def __init__(self):
-        return
+    def __init__(self, timeout = None, deadline = None):
+        # timeout  - the default per-command limit in seconds
+        # deadline - a time.time() value no command may run past
+        self.timeout = timeout
+        self.deadline = deadline
+        self._cancel = threading.Event()
+        self._recording = None
+        self._replay = None
+        self._realtime = False
+
+    def set_deadline(self, seconds):
+        self.deadline = time.time() + seconds
+
+    def cancel(self):
+        # Kills whatever run() is executing right now and skips the rest of
+        # its commands - safe to call from another thread
+        self._cancel.set()
+
+    def record(self, path):
+        # Saves every command run from here on - args, output, return code
+        # and timing - to a JSON fixture at path that replay() can serve
+        self._recording = {"path": path, "commands": []}
+
+    def replay(self, path, realtime = False):
+        # Serves commands from a fixture made by record() instead of running
+        # them.  Commands are matched on their args (with temp folders
+        # normalized), in recorded order, and the last match repeats.  With
+        # realtime, each command takes as long as it did when recorded.
+        with open(path, "r") as f:
+            commands = json.load(f)["commands"]
+        self._replay = {}
+        for entry in commands:
+            self._replay.setdefault(self._fixture_key(entry["args"], entry["shell"]), []).append(entry)
+        self._realtime = realtime
 
-    def _read_output(self, pipe, q):
+    def _fixture_key(self, args, shell):
+        global _TEMP_RE
+        if _TEMP_RE is None:
+            _TEMP_RE = re.compile(re.escape(tempfile.gettempdir()) + r"[/\\][^/\\\s]+")
+        if isinstance(args, list):
+            args = [_TEMP_RE.sub("<tmp>", x) for x in args]
+        else:
+            args = _TEMP_RE.sub("<tmp>", args)
+        return json.dumps([bool(shell), args])
+
+    def _record(self, args, shell, stream, out, seconds):
+        values = []
+        for value in out[:2]:
+            if hasattr(value, "read"):
+                # Spilled output - read it back for the fixture, then rewind
+                text = value.read()
+                value.seek(0)
+                value = text
+            values.append(value)
+        self._recording["commands"].append({
+            "args": list(args) if isinstance(args, list) else args,
+            "shell": bool(shell),
+            "stream": bool(stream),
+            "output": values[0],
+            "error": values[1],
+            "returncode": out[2],
+            "timed_out": getattr(out, "timed_out", False),
+            "cancelled": getattr(out, "cancelled", False),
+            "seconds": round(seconds, 6)
+        })
+        # Saved after every command so exit() anywhere keeps the fixture
+        atomic_write(self._recording["path"], json.dumps({"version": 1, "commands": self._recording["commands"]}, indent=2))
+
+    def _replayed(self, args, shell = False, stream = False, **capture):
+        entries = self._replay.get(self._fixture_key(args, shell))
+        if not entries:
+            return Result("", "No recorded output for: {}".format(args if isinstance(args, str) else " ".join(args)), 127)
+        entry = entries.pop(0) if len(entries) > 1 else entries[0]
+        if self._realtime:
+            time.sleep(entry["seconds"])
+        # Replay through the same capture options, and echo if streamed
+        output = _Capture("stdout", **capture)
+        error = _Capture("stderr", **capture)
+        for target, text, pipe in ((output, entry["output"], sys.stdout), (error, entry["error"], sys.stderr)):
+            if not text:
+                continue
+            target.write(text)
+            if stream:
+                pipe.write(text)
+                pipe.flush()
+        return Result(output.value(), error.value(), entry["returncode"], entry.get("timed_out", False), entry.get("cancelled", False))
+
+    def _read_output(self, pipe, q, name):
+        # Reads whatever is available (up to 64KiB) at a time and decodes it
+        # incrementally, translating newlines like universal_newlines would
+        decoder = io.IncrementalNewlineDecoder(codecs.getincrementaldecoder("utf-8")("ignore"), True)
         try:
-            for line in iter(lambda: pipe.read(1), b''):
-                q.put(line)
-        except ValueError:
+            fd = pipe.fileno()
+            for data in iter(lambda: os.read(fd, 65536), b''):
+                text = decoder.decode(data)
+                if text:
+                    q.put((name, text))
+            text = decoder.decode(b'', True)
+            if text:
+                q.put((name, text))
+        except (OSError, ValueError):
             pass
-        pipe.close()
+        finally:
+            pipe.close()
+            q.put((name, None))
 
-    def _create_thread(self, output):
-        # Creates a new queue and thread object to watch based on the output pipe sent
-        q = Queue()
-        t = threading.Thread(target=self._read_output, args=(output, q))
+    def _create_thread(self, output, q, name):
+        # Creates a new thread object to watch the output pipe sent, putting
+        # (name, text) tuples on the shared queue - and (name, None) when done
+        t = threading.Thread(target=self._read_output, args=(output, q, name))
         t.daemon = True
-        return (q,t)
+        return t
 
-    def _stream_output(self, comm, shell = False):
-        output = error = ""
-        p = None
-        try:
-            if shell and type(comm) is list:
-                comm = " ".join(shlex.quote(x) for x in comm)
-            if not shell and type(comm) is str:
-                comm = shlex.split(comm)
-            p = subprocess.Popen(comm, shell=shell, stdout=subprocess.PIPE, stderr=subprocess.PIPE, bufsize=0, universal_newlines=True, close_fds=ON_POSIX)
-            # Setup the stdout thread/queue
-            q,t   = self._create_thread(p.stdout)
-            qe,te = self._create_thread(p.stderr)
-            # Start both threads
-            t.start()
-            te.start()
-
-            while True:
-                c = z = ""
-                try: c = q.get_nowait()
-                except Empty: pass
-                else:
-                    sys.stdout.write(c)
-                    output += c
-                    sys.stdout.flush()
-                try: z = qe.get_nowait()
-                except Empty: pass
+    def _popen(self, comm, shell = False, group = False):
+        if shell and type(comm) is list:
+            comm = " ".join(shlex.quote(x) for x in comm)
+        if not shell and type(comm) is str:
+            comm = shlex.split(comm)
+        kwargs = {}
+        if group and ON_POSIX:
+            # Give the command its own process group (and session) so a
+            # timeout can take out everything it started.  It also leaves
+            # the terminal, so sudo has to be passwordless - which beats
+            # hanging on a prompt nobody will answer.
+            kwargs["preexec_fn"] = os.setsid
+        p = subprocess.Popen(comm, shell=shell, stdout=subprocess.PIPE, stderr=subprocess.PIPE, bufsize=0, close_fds=ON_POSIX, **kwargs)
+        p.group = "preexec_fn" in kwargs
+        return p
+
+    def _kill(self, p, grace = 2):
+        # Terminates the command - and its process group if it has one -
+        # then kills it if it's still around after grace seconds
+        for sig in (signal.SIGTERM, getattr(signal, "SIGKILL", None)):
+            try:
+                if p.group:
+                    os.killpg(p.pid, sig)
+                elif sig == signal.SIGTERM:
+                    p.terminate()
                 else:
-                    sys.stderr.write(z)
-                    error += z
-                    sys.stderr.flush()
-                if not c==z=="": continue # Keep going until empty
-                # No output - see if still running
-                p.poll()
-                if p.returncode != None:
-                    # Subprocess ended
-                    break
-                # No output, but subprocess still running - stall for 20ms
+                    p.kill()
+            except OSError:
+                pass # Already gone, or not ours to kill (e.g. under sudo)
+            end = time.time() + grace
+            while p.poll() is None and time.time() < end:
                 time.sleep(0.02)
+            if p.returncode is not None:
+                break
 
-            o, e = p.communicate()
-            return (output+o, error+e, p.returncode)
+    def _collect(self, p, output, error, echo = False, deadline = None):
+        # Feeds both pipes into their captures until they close, the
+        # deadline passes, or we're cancelled.  Returns (timed_out, cancelled).
+        q = Queue()
+        for pipe, name in ((p.stdout, "stdout"), (p.stderr, "stderr")):
+            self._create_thread(pipe, q, name).start()
+        remaining = 2
+        timed_out = cancelled = False
+        while remaining:
+            if self._cancel.is_set():
+                cancelled = True
+                break
+            wait = 0.1
+            if deadline is not None:
+                wait = min(wait, deadline - time.time())
+                if wait <= 0:
+                    timed_out = True
+                    break
+            try:
+                name, text = q.get(timeout=wait)
+            except Empty:
+                continue
+            if text is None:
+                remaining -= 1
+                continue
+            (output if name == "stdout" else error).write(text)
+            if echo:
+                stream = sys.stdout if name == "stdout" else sys.stderr
+                stream.write(text)
+                stream.flush()
+        if timed_out or cancelled:
+            self._kill(p)
+            # Keep what was written before the kill - but don't wait on pipes
+            # held open by anything that escaped the group
+            end = time.time() + 1
+            while remaining and time.time() < end:
+                try:
+                    name, text = q.get(timeout=max(0, end - time.time()))
+                except Empty:
+                    break
+                if text is None:
+                    remaining -= 1
+                else:
+                    (output if name == "stdout" else error).write(text)
+        p.wait()
+        return (timed_out, cancelled)
+
+    def _capture(self, comm, shell = False, echo = False, deadline = None, **capture):
+        output = _Capture("stdout", **capture)
+        error = _Capture("stderr", **capture)
+        p = None
+        try:
+            p = self._popen(comm, shell, group=deadline is not None)
+            timed_out, cancelled = self._collect(p, output, error, echo, deadline)
+            return Result(output.value(), error.value(), p.returncode, timed_out, cancelled)
         except:
             if p:
-                try: o, e = p.communicate()
-                except: o = e = ""
-                return (output+o, error+e, p.returncode)
-            return ("", "Command not found!", 1)
+                try:
+                    if p.poll() is None:
+                        self._kill(p)
+                    p.wait()
+                except: pass
+                return Result(output.value(), error.value(), p.returncode)
+            return Result("", "Command not found!", 1)
+
+    def _stream_output(self, comm, shell = False, deadline = None, **capture):
+        return self._capture(comm, shell, True, deadline, **capture)
 
     def _decode(self, value, encoding="utf-8", errors="ignore"):
         # Helper method to only decode if bytes type
@@ -80,21 +294,37 @@ class Run:
             return value.decode(encoding,errors)
         return value
 
-    def _run_command(self, comm, shell = False):
-        c = None
-        try:
-            if shell and type(comm) is list:
-                comm = " ".join(shlex.quote(x) for x in comm)
-            if not shell and type(comm) is str:
-                comm = shlex.split(comm)
-            p = subprocess.Popen(comm, shell=shell, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            c = p.communicate()
-        except:
-            if c == None:
-                return ("", "Command not found!", 1)
-        return (self._decode(c[0]), self._decode(c[1]), p.returncode)
+    def _run_command(self, comm, shell = False, deadline = None, **capture):
+        return self._capture(comm, shell, False, deadline, **capture)
+
+    def _execute(self, args, shell = False, stream = False, deadline = None, **capture):
+        if self._replay is not None:
+            return self._replayed(args, shell, stream, **capture)
+        start = time.time()
+        if stream:
+            # Stream it!
+            out = self._stream_output(args, shell, deadline, **capture)
+        else:
+            # Just run and gather output
+            out = self._run_command(args, shell, deadline, **capture)
+        if self._recording is not None:
+            self._record(args, shell, stream, out, time.time() - start)
+        return out
+
+    def _deadline(self, timeout):
+        # The earlier of the command's own timeout and the global deadline
+        deadlines = [x for x in (time.time() + timeout if timeout else None, self.deadline) if x]
+        return min(deadlines) if deadlines else None
 
     def run(self, command_list, leave_on_fail = False):
+        # A cancel() that lands before run() gets going still counts - the
+        # flag is only cleared once the run is over
+        try:
+            return self._run(command_list, leave_on_fail)
+        finally:
+            self._cancel.clear()
+
+    def _run(self, command_list, leave_on_fail = False):
         # Command list should be an array of dicts
         if type(command_list) is dict:
             # We only have one command
@@ -109,6 +339,9 @@ class Run:
             stderr = comm.get("stderr", False)
             mess   = comm.get("message", None)
             show   = comm.get("show",   False)
+            # Output capture options - see _Capture
+            capture = dict((k, comm[k]) for k in ("max_output", "spill", "callback", "keep") if k in comm)
+            deadline = self._deadline(comm.get("timeout", self.timeout))
             
             if not mess == None:
                 print(mess)
@@ -116,9 +349,15 @@ class Run:
             if not len(args):
                 # nothing to process
                 continue
+            if self._cancel.is_set():
+                output_list.append(Result("", "Cancelled", 1, cancelled=True))
+                break
+            if self.deadline is not None and time.time() >= self.deadline:
+                output_list.append(Result("", "Deadline passed before the command started", 1, timed_out=True))
+                break
             if sudo:
                 # Check if we have sudo
-                out = self._run_command(["which", "sudo"])
+                out = self._execute(["which", "sudo"], deadline=deadline)
                 if "sudo" in out[0]:
                     # Can sudo
                     if type(args) is list:
@@ -129,21 +368,21 @@ class Run:
             if show:
                 print(" ".join(args))
 
-            if stream:
-                # Stream it!
-                out = self._stream_output(args, shell)
+            if timer.enabled:
+                with timer.span("run", command=args if isinstance(args, str) else " ".join(args)):
+                    out = self._execute(args, shell, stream, deadline, **capture)
             else:
-                # Just run and gather output
-                out = self._run_command(args, shell)
-                if stdout and len(out[0]):
+                out = self._execute(args, shell, stream, deadline, **capture)
+            if not stream:
+                if stdout and not hasattr(out[0], "read") and len(out[0]):
                     print(out[0])
-                if stderr and len(out[1]):
+                if stderr and not hasattr(out[1], "read") and len(out[1]):
                     print(out[1])
             # Append output
             output_list.append(out)
             # Check for errors
-            if leave_on_fail and out[2] != 0:
-                # Got an error - leave
+            if out.cancelled or (leave_on_fail and out[2] != 0):
+                # Cancelled, or got an error - leave
                 break
         if len(output_list) == 1:
             # We only ran one command - just return that output
@@ -0,0 +1,223 @@
+import os, json, time, hashlib, argparse, threading
+from . import downloader
+from .utils import atomic_write
+
+# Resolves where to fetch the patch script from.  Sources are tried in the
+# order they're configured, but probed all at once with a short timeout, so
+# a dead mirror costs at most one timeout rather than one each:
+#   r = Resolver([FileSource("/Volumes/Share/patch-edid.rb"), GistSource()])
+#   r.resolve() -> {"source": "file:...", "url": "/Volumes/...", "revision": None}
+# The pick is cached with a TTL so repeat runs don't probe at all.  Specs
+# for source_for() are a path, an http(s) URL, or gist[:ID[/FILENAME]].
+
+GIST_ID = "7435890"
+GIST_FILE = "patch-edid.rb"
+
+class SourceError(Exception):
+    pass
+
+class FileSource(object):
+    # A patch script on disk or a share - a folder is searched for the file name
+
+    def __init__(self, path, name=GIST_FILE):
+        self.path = path
+        self.file_name = name
+        self.name = "file:{}".format(path)
+
+    def probe(self, timeout):
+        path = self.path
+        if os.path.isdir(path):
+            path = os.path.join(path, self.file_name)
+        if not os.path.isfile(path):
+            raise SourceError("{} does not exist".format(path))
+        return {"url": os.path.abspath(path), "revision": None}
+
+class HTTPSource(object):
+    # A plain HTTP(S) mirror of the script.  The probe only reads the
+    # headers - the revision is the /raw/<revision>/ in the URL when it has
+    # one, and the ETag otherwise
+
+    def __init__(self, url, d=None):
+        self.url = url
+        self.name = url
+        self.d = d
+
+    def probe(self, timeout):
+        d = self.d or downloader.Downloader(timeout=timeout)
+        response = d.open_url(self.url)
+        if response is None:
+            raise SourceError("{} did not respond".format(self.url))
+        try:
+            status = response.getcode()
+            etag = response.headers.get("ETag")
+        finally:
+            response.close()
+        if status and status >= 400:
+            raise SourceError("{} returned {}".format(self.url, status))
+        revision = None
+        if "/raw/" in self.url:
+            revision = self.url.split("/raw/")[1].split("/")[0] or None
+        elif etag:
+            # W/"abc" and "abc" are the same revision - only drop the weak
+            # prefix and the quotes, not W's and slashes inside the tag
+            etag = etag.strip()
+            if etag.startswith("W/"):
+                etag = etag[2:]
+            revision = etag.strip('"') or None
+        return {"url": self.url, "revision": revision}
+
+class GistSource(object):
+    # The gist API - one small JSON request for the latest raw URL and the
+    # revision count, instead of scraping the gist's HTML page
+
+    def __init__(self, gist_id=GIST_ID, file_name=GIST_FILE, d=None):
+        self.gist_id = gist_id
+        self.file_name = file_name
+        self.name = "gist:{}/{}".format(gist_id, file_name)
+        self.d = d
+
+    def probe(self, timeout):
+        d = self.d or downloader.Downloader(timeout=timeout)
+        headers = {"User-Agent": "ForceRGB", "Accept": "application/vnd.github+json"}
+        text = d.get_string("https://api.github.com/gists/{}".format(self.gist_id), progress=False, headers=headers)
+        if not text:
+            raise SourceError("The gist API did not respond")
+        try:
+            info = json.loads(text)
+            url = info["files"][self.file_name]["raw_url"]
+        except (ValueError, KeyError, TypeError):
+            raise SourceError("{} is not in gist {}".format(self.file_name, self.gist_id))
+        history = info.get("history") or []
+        return {"url": url, "revision": str(len(history)) if history else None}
+
+def source_for(spec, d=None):
+    if spec.lower() == "gist" or spec.lower().startswith("gist:"):
+        gist_id, _, file_name = spec[5:].partition("/")
+        return GistSource(gist_id or GIST_ID, file_name or GIST_FILE, d)
+    if spec.lower().startswith(("http://", "https://")):
+        return HTTPSource(spec, d)
+    return FileSource(os.path.expanduser(spec))
+
+class Resolver(object):
+
+    def __init__(self, sources, timeout=5, ttl=3600, cache_path=None, d=None):
+        # d is the Downloader every probe shares - pass one with the
+        # caller's rate limiter and a socket timeout, or one is built with
+        # timeout.  Waiting on the probes is cut off at timeout either way.
+        self.d = d or downloader.Downloader(timeout=timeout)
+        self.sources = [x if hasattr(x, "probe") else source_for(x, self.d) for x in sources]
+        for source in self.sources:
+            if getattr(source, "d", False) is None:
+                source.d = self.d
+        self.timeout = timeout
+        self.ttl = ttl
+        self.cache_path = cache_path
+
+    def _key(self):
+        # Cached picks only count for the same list of sources
+        return hashlib.sha256("\n".join(x.name for x in self.sources).encode("utf-8")).hexdigest()
+
+    def cached(self):
+        if not self.cache_path or not self.ttl:
+            return None
+        try:
+            with open(self.cache_path, "r") as f:
+                cache = json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+        if cache.get("key") != self._key() or not 0 <= time.time() - cache.get("time", 0) < self.ttl:
+            return None
+        return cache.get("resolved")
+
+    def _save(self, resolved):
+        if not self.cache_path or not self.ttl:
+            return
+        folder = os.path.dirname(self.cache_path)
+        try:
+            if folder and not os.path.isdir(folder):
+                os.makedirs(folder)
+            atomic_write(self.cache_path, json.dumps({"key": self._key(), "time": time.time(), "resolved": resolved}, indent=2, sort_keys=True))
+        except (IOError, OSError):
+            pass # Only a cache
+
+    def invalidate(self):
+        # Drops the cached pick - e.g. when downloading from it failed
+        if self.cache_path and os.path.exists(self.cache_path):
+            try:
+                os.remove(self.cache_path)
+            except OSError:
+                pass
+
+    def _start(self):
+        # Probes every source on its own thread - returns a list of
+        # (source, event, result) where result is filled in as probes finish
+        probes = []
+        for source in self.sources:
+            result = {}
+            event = threading.Event()
+            def probe(source=source, result=result, event=event):
+                start = time.time()
+                try:
+                    result["resolved"] = source.probe(self.timeout)
+                except Exception as e:
+                    result["error"] = str(e)
+                result["seconds"] = time.time() - start
+                event.set()
+            t = threading.Thread(target=probe)
+            t.daemon = True # Don't hold up exit for a hung mirror
+            t.start()
+            probes.append((source, event, result))
+        return probes
+
+    def probe(self):
+        # Waits on every source and returns what each said, in order
+        results = []
+        deadline = time.time() + self.timeout
+        for source, event, result in self._start():
+            event.wait(max(0, deadline - time.time()))
+            entry = {"source": source.name}
+            entry.update(result if event.is_set() else {"error": "Timed out after {}s".format(self.timeout)})
+            results.append(entry)
+        return results
+
+    def resolve(self, refresh=False):
+        # Returns the first healthy source's {"source", "url", "revision"} in
+        # configured order, or None when none answered in time.  Sources
+        # after the pick aren't waited on.
+        if not refresh:
+            resolved = self.cached()
+            if resolved:
+                return resolved
+        deadline = time.time() + self.timeout
+        for source, event, result in self._start():
+            event.wait(max(0, deadline - time.time()))
+            if event.is_set() and "resolved" in result:
+                resolved = dict(result["resolved"], source=source.name)
+                self._save(resolved)
+                return resolved
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m Scripts.sources")
+    parser.add_argument("sources", nargs="*", default=["gist"], help="paths, http(s) URLs or gist[:ID[/FILENAME]] to probe, in order - default is gist")
+    parser.add_argument("-t", "--timeout", type=float, default=5, help="seconds to wait on the sources - default is 5")
+    parser.add_argument("-j", "--json", action="store_true", help="prints the results as JSON")
+    args = parser.parse_args()
+    results = Resolver(args.sources, args.timeout, ttl=0).probe()
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for r in results:
+            if "resolved" in r:
+                print("{}: {}{} ({:.2f}s)".format(
+                    r["source"],
+                    r["resolved"]["url"],
+                    " revision {}".format(r["resolved"]["revision"]) if r["resolved"]["revision"] else "",
+                    r["seconds"]
+                ))
+            else:
+                print("{}: {}".format(r["source"], r["error"]))
+    exit(0 if any("resolved" in r for r in results) else 1)
+
+if __name__ == "__main__":
+    main()
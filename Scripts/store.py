@@ -0,0 +1,103 @@
+import os, json, shutil, hashlib, datetime
+from .utils import atomic_write
+
+class ArtifactStore:
+
+    def __init__(self, root):
+        # Layout:
+        #   objects/<sha256>  - artifact contents
+        #   manifest.json     - every version of every artifact with its hash,
+        #                       source and when it was added
+        #   index.json        - artifact name -> current version and hash,
+        #                       so lookups never need the full manifest
+        self.root = root
+        self.objects = os.path.join(root, "objects")
+        self.manifest_path = os.path.join(root, "manifest.json")
+        self.index_path = os.path.join(root, "index.json")
+        self._index = None
+
+    def _load(self, path):
+        try:
+            with open(path, "r") as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return {}
+
+    def _save(self, path, value):
+        if not os.path.isdir(self.root):
+            os.makedirs(self.root)
+        atomic_write(path, json.dumps(value, indent=2, sort_keys=True))
+
+    def _hash(self, path):
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(65536), b""):
+                h.update(chunk)
+        return h.hexdigest()
+
+    @property
+    def index(self):
+        if self._index is None:
+            self._index = self._load(self.index_path)
+        return self._index
+
+    def manifest(self):
+        return self._load(self.manifest_path)
+
+    def add(self, name, path, version=None, source=None, make_current=True):
+        # Adds the file at path as a version of the named artifact and returns
+        # the version.  The version defaults to the start of the content hash.
+        digest = self._hash(path)
+        version = version or digest[:12]
+        target = os.path.join(self.objects, digest)
+        if not os.path.exists(target):
+            if not os.path.isdir(self.objects):
+                os.makedirs(self.objects)
+            shutil.copyfile(path, target + ".tmp")
+            os.rename(target + ".tmp", target)
+        manifest = self.manifest()
+        manifest.setdefault(name, {})[version] = {
+            "sha256": digest,
+            "source": source,
+            "added": "{:%Y-%m-%d %H:%M:%S}".format(datetime.datetime.now())
+        }
+        self._save(self.manifest_path, manifest)
+        if make_current:
+            self.index[name] = {"version": version, "sha256": digest}
+            self._save(self.index_path, self.index)
+        return version
+
+    def current(self, name):
+        return self.index.get(name, {}).get("version")
+
+    def path(self, name, version=None):
+        # Returns the path to the stored artifact (the current version if none
+        # is passed) or None if it's missing or fails its hash check
+        if not version or version == self.current(name):
+            info = self.index.get(name)
+        else:
+            info = self.manifest().get(name, {}).get(version)
+        if not info:
+            return None
+        target = os.path.join(self.objects, info["sha256"])
+        if not os.path.isfile(target) or self._hash(target) != info["sha256"]:
+            return None
+        return target
+
+    def seed(self, other_root):
+        # Merges another store (e.g. one pre-built for the fleet) into this one,
+        # adopting its current versions.  Returns the number of versions added.
+        other = ArtifactStore(other_root)
+        added = 0
+        for name, versions in other.manifest().items():
+            for version, info in versions.items():
+                source = os.path.join(other.objects, info["sha256"])
+                if not os.path.isfile(source):
+                    continue
+                self.add(name, source, version=version, source=info.get("source"), make_current=False)
+                added += 1
+        for name, info in other.index.items():
+            if self.path(name, info.get("version")):
+                self.index[name] = info
+        self._save(self.index_path, self.index)
+        return added
@@ -0,0 +1,242 @@
+import time, gzip, random, argparse, threading
+from io import BytesIO
+try:
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+    from socketserver import ThreadingMixIn
+    from urllib.parse import urlparse, parse_qs
+except ImportError:
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+    from SocketServer import ThreadingMixIn
+    from urlparse import urlparse, parse_qs
+from .downloader import parse_rate
+
+# Local stand-in for the servers Downloader talks to, so downloads can be
+# exercised and timed without GitHub.  Paths are /<mode>/<size>, e.g.:
+#   /plain/1048576        - Content-Length, honors Range (206)
+#   /chunked/1048576      - Transfer-Encoding: chunked, no length
+#   /gzip/1048576         - Content-Encoding: gzip of the payload
+#   /slow/65536?rate=N    - drips N bytes/sec (default 64KiB/s), honors Range
+#   /truncated/1048576    - promises the full length, closes half way
+#   /redirect/N/<path>    - 302s N times before landing on /<path>
+# Sizes can use a K, M or G suffix - see downloader.parse_rate.  Bodies are generated a block at a time,
+# so large payloads cost no memory.  Run it on its own with:
+#   python -m Scripts.testserver [--port N]
+
+BLOCK_SIZE = 65536
+
+def _block(seed=0):
+    # Hex text from a seeded RNG - looks like a download, but gzips ~2:1
+    rng = random.Random(seed)
+    return "".join("{:02x}".format(rng.randrange(256)) for _ in range(BLOCK_SIZE // 2)).encode("ascii")
+
+_BLOCK = _block()
+
+def payload(size, start=0, end=None):
+    # Yields the bytes [start, end) of the payload of the passed size
+    end = size if end is None else min(end, size)
+    offset = start
+    while offset < end:
+        i = offset % BLOCK_SIZE
+        piece = _BLOCK[i:i + min(BLOCK_SIZE - i, end - offset)]
+        offset += len(piece)
+        yield piece
+
+def payload_bytes(size, start=0, end=None):
+    return b"".join(payload(size, start, end))
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass # Keep benchmarks quiet
+
+    def do_HEAD(self):
+        self._handle(head=True)
+
+    def do_GET(self):
+        self._handle()
+
+    def _handle(self, head=False):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        parts = [x for x in url.path.split("/") if x]
+        self.server.record(self.command, self.path, dict(self.headers.items()))
+        if parts[:1] == ["redirect"]:
+            return self._send_redirect(parts[1:], url.query)
+        try:
+            mode, size = parts[0], int(parse_rate(parts[1]))
+        except (IndexError, ValueError):
+            return self._send_error(404, "Expected /<mode>/<size>")
+        if not mode in ("plain", "chunked", "gzip", "slow", "truncated"):
+            return self._send_error(404, "Unknown mode: {}".format(mode))
+        if mode == "gzip":
+            return self._send_gzip(size, head)
+        if mode == "chunked":
+            return self._send_chunked(size, head)
+        start, end, status = 0, size, 200
+        if mode in ("plain", "slow") and self.headers.get("Range", "").startswith("bytes="):
+            first, _, last = self.headers["Range"][6:].partition("-")
+            try:
+                start = int(first)
+                end = int(last) + 1 if last else size
+            except ValueError:
+                return self._send_error(416, "Bad range")
+            if start >= size:
+                return self._send_error(416, "Range not satisfiable", {"Content-Range": "bytes */{}".format(size)})
+            status = 206
+        self.send_response(status)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(end - start))
+        self.send_header("Accept-Ranges", "bytes")
+        if status == 206:
+            self.send_header("Content-Range", "bytes {}-{}/{}".format(start, end - 1, size))
+        self.end_headers()
+        if head:
+            return
+        if mode == "truncated":
+            end = start + (end - start) // 2
+        rate = float(query.get("rate", [65536])[0]) if mode == "slow" else None
+        try:
+            for piece in payload(size, start, end):
+                if rate:
+                    # Drip at most a tenth of a second's worth at a time
+                    step = max(1, int(rate / 10))
+                    for i in range(0, len(piece), step):
+                        self.wfile.write(piece[i:i + step])
+                        self.wfile.flush()
+                        time.sleep(len(piece[i:i + step]) / rate)
+                else:
+                    self.wfile.write(piece)
+        except (IOError, OSError):
+            return # Client went away
+        if mode == "truncated":
+            self.close_connection = True
+
+    def _send_chunked(self, size, head):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        if head:
+            return
+        try:
+            for piece in payload(size):
+                self.wfile.write("{:x}\r\n".format(len(piece)).encode("ascii") + piece + b"\r\n")
+            self.wfile.write(b"0\r\n\r\n")
+        except (IOError, OSError):
+            pass
+
+    def _send_gzip(self, size, head):
+        body = self.server.gzipped(size)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if not head:
+            try:
+                self.wfile.write(body)
+            except (IOError, OSError):
+                pass
+
+    def _send_redirect(self, parts, query):
+        try:
+            hops = int(parts[0])
+        except (IndexError, ValueError):
+            return self._send_error(404, "Expected /redirect/<count>/<path>")
+        rest = "/" + "/".join(parts[1:]) + ("?" + query if query else "")
+        location = rest if hops <= 1 else "/redirect/{}{}".format(hops - 1, rest)
+        self.send_response(302)
+        self.send_header("Location", location)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def _send_error(self, code, message, headers=None):
+        body = message.encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "text/plain")
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128 # The default of 5 drops concurrent connects
+
+    def __init__(self, *args, **kwargs):
+        HTTPServer.__init__(self, *args, **kwargs)
+        self.requests = []
+        self._lock = threading.Lock()
+        self._gzipped = {}
+
+    def record(self, method, path, headers):
+        with self._lock:
+            self.requests.append({"time": time.time(), "method": method, "path": path, "headers": headers})
+
+    def gzipped(self, size):
+        # Compressed once per size and kept - gzip mode is for moderate sizes
+        with self._lock:
+            if not size in self._gzipped:
+                f = BytesIO()
+                g = gzip.GzipFile(fileobj=f, mode="wb")
+                for piece in payload(size):
+                    g.write(piece)
+                g.close()
+                self._gzipped[size] = f.getvalue()
+            return self._gzipped[size]
+
+class TestServer(object):
+    # Runs the stand-in on a background thread:
+    #   with TestServer() as s:
+    #       Downloader().get_bytes(s.url("/plain/1M"), progress=False)
+
+    def __init__(self, host="127.0.0.1", port=0):
+        self.host = host
+        self.port = port
+        self._server = self._thread = None
+
+    def start(self):
+        self._server = _Server((self.host, self.port), _Handler)
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    @property
+    def requests(self):
+        return self._server.requests if self._server else []
+
+    def url(self, path):
+        return "http://{}:{}{}".format(self.host, self.port, path)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m Scripts.testserver")
+    parser.add_argument("-p", "--port", type=int, default=8000, help="the port to listen on - default is 8000")
+    parser.add_argument("--host", default="127.0.0.1", help="the address to listen on - default is 127.0.0.1")
+    args = parser.parse_args()
+    server = TestServer(args.host, args.port).start()
+    print("Serving on {} - try {}".format(server.url("/"), server.url("/plain/1M")))
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+import os, time, threading
+
+# Lightweight span timer shared by ForceRGB and the Scripts modules.  While
+# disabled, span() hands back the same no-op context manager every time, so
+# instrumented code only pays for one attribute check.  It has no
+# dependencies - modules import it directly rather than guarding the import.
+
+class _NullSpan(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+_NULL_SPAN = _NullSpan()
+
+class _Span(object):
+    def __init__(self, timer, name, args):
+        self.timer = timer
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        end = time.time()
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+        self.timer._record(self.name, self.start, end, self.args)
+        return False
+
+class Timer(object):
+
+    def __init__(self):
+        self.enabled = False
+        self.spans = []
+        self._origin = time.time()
+        self._lock = threading.Lock()
+
+    def enable(self):
+        self.enabled = True
+        self._origin = time.time()
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        with self._lock:
+            self.spans = []
+        self._origin = time.time()
+
+    def span(self, name, **args):
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, args)
+
+    def _record(self, name, start, end, args):
+        with self._lock:
+            self.spans.append((name, start, end, threading.current_thread().ident, args))
+
+    def to_json(self):
+        spans, totals = [], {}
+        for name, start, end, tid, args in sorted(self.spans, key=lambda x: x[1]):
+            duration = (end - start) * 1000.0
+            spans.append({
+                "name": name,
+                "start_ms": round((start - self._origin) * 1000.0, 3),
+                "duration_ms": round(duration, 3),
+                "thread": tid,
+                "args": args
+            })
+            t = totals.setdefault(name, {"count": 0, "total_ms": 0})
+            t["count"] += 1
+            t["total_ms"] = round(t["total_ms"] + duration, 3)
+        return {"spans": spans, "totals": totals}
+
+    def to_chrome_trace(self):
+        # Complete ("X") events - load the file in chrome://tracing or Perfetto
+        pid = os.getpid()
+        return {"traceEvents": [{
+            "name": name,
+            "ph": "X",
+            "ts": int((start - self._origin) * 1000000),
+            "dur": int((end - start) * 1000000),
+            "pid": pid,
+            "tid": tid,
+            "args": args
+        } for name, start, end, tid, args in self.spans]}
+
+    def save(self, path, fmt="json"):
+        import json
+        value = self.to_chrome_trace() if fmt == "chrome" else self.to_json()
+        with open(path, "w") as f:
+            json.dump(value, f, indent=2, default=str)
+        return path
+
+# Shared instance used by all modules
+timer = Timer()
+
+def timed(name):
+    # Decorator that wraps the call in a span while the timer is enabled
+    def decorator(func):
+        def wrapper(*args, **kwargs):
+            if not timer.enabled:
+                return func(*args, **kwargs)
+            with timer.span(name):
+                return func(*args, **kwargs)
+        wrapper.__name__ = func.__name__
+        wrapper.__doc__ = func.__doc__
+        return wrapper
+    return decorator
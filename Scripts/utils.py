@@ -7,6 +7,16 @@ else:
     # Not Windows \o/
     import select
 
+def atomic_write(path, data, suffix=".tmp"):
+    # Writes data (text or bytes) to a temp file next to path, then moves it
+    # into place - an interrupted write never leaves a half-written path
+    temp = path + suffix
+    with open(temp, "wb" if isinstance(data, bytes) else "w") as f:
+        f.write(data)
+    if os.name == "nt" and os.path.exists(path):
+        os.remove(path)
+    os.rename(temp, path)
+
 class Utils:
 
     def __init__(self, name = "Python Script"):
@@ -0,0 +1,185 @@
+import os, re, json, time, argparse, multiprocessing
+from . import plist, edid
+
+# Lints an Overrides tree, e.g.:
+#   python -m Scripts.validate /Library/Displays/Contents/Resources/Overrides --json
+# Every DisplayVendorID-*/DisplayProductID-* file is parsed across a process
+# pool and checked against its folder and file names and its own EDID.  The
+# tree itself is checked for leftovers of interrupted runs and old-style
+# timestamped backups.  Issues are errors or warnings - see ISSUES.
+
+DEFAULT_ROOT = "/Library/Displays/Contents/Resources/Overrides"
+
+# code -> level
+ISSUES = {
+    "parse_error": "error",         # Not a readable plist - e.g. an interrupted cp
+    "not_a_dict": "error",          # Parsed, but the root isn't a dictionary
+    "missing_key": "error",         # No DisplayVendorID or DisplayProductID
+    "vendor_mismatch": "error",     # DisplayVendorID doesn't match the folder name
+    "product_mismatch": "error",    # DisplayProductID doesn't match the file name
+    "edid_invalid": "error",        # IODisplayEDID has a bad header, length or checksum
+    "edid_id_mismatch": "warning",  # The EDID's own ids differ from the plist's
+    "missing_edid": "warning",      # No IODisplayEDID - nothing is overridden
+    "stale_backup": "warning",      # A timestamped copy from the old backup scheme
+    "leftover": "warning",          # A temp file from an interrupted write
+    "bad_name": "warning",          # DisplayVendorID-/DisplayProductID- without a hex id
+    "empty_folder": "warning"       # A vendor folder with no overrides in it
+}
+
+_VENDOR_RE = re.compile(r"^DisplayVendorID-([0-9a-fA-F]+)$")
+_PRODUCT_RE = re.compile(r"^DisplayProductID-([0-9a-fA-F]+)(\.plist)?$")
+_STAMP_RE = re.compile(r"-\d{4}-\d{2}-\d{2} \d{2}\.\d{2}\.\d{2}$")
+_LEFTOVERS = (".converting", ".patching", ".tmp")
+
+def _issue(path, code, message):
+    return {"path": path, "level": ISSUES[code], "code": code, "message": message}
+
+def check_file(path, vendor=None, product=None):
+    # Parses and checks one override plist.  vendor and product are the ids
+    # from the folder and file names, if they had any.  Returns a
+    # (display, issues) tuple - display is None if the file didn't parse.
+    issues = []
+    try:
+        with open(path, "rb") as f:
+            value = plist.load(f)
+    except Exception as e:
+        return (None, [_issue(path, "parse_error", "Could not parse: {}".format(e))])
+    if not isinstance(value, dict):
+        return (None, [_issue(path, "not_a_dict", "The root is a {}, not a dictionary".format(type(value).__name__))])
+    display = {
+        "path": path,
+        "vendor_id": value.get("DisplayVendorID"),
+        "product_id": value.get("DisplayProductID"),
+        "name": value.get("DisplayProductName"),
+        "edid_valid": None
+    }
+    for key, expected, code in (("DisplayVendorID", vendor, "vendor_mismatch"), ("DisplayProductID", product, "product_mismatch")):
+        actual = value.get(key)
+        if not isinstance(actual, int) or isinstance(actual, bool):
+            issues.append(_issue(path, "missing_key", "{} is missing or not an integer".format(key)))
+        elif expected is not None and actual != expected:
+            issues.append(_issue(path, code, "{} is {} ({:x}) but the name says {:x}".format(key, actual, actual, expected)))
+    data = plist.extract_data(value.get("IODisplayEDID"))
+    if data is None:
+        issues.append(_issue(path, "missing_edid", "No IODisplayEDID"))
+    elif not isinstance(data, (bytes, bytearray)) or not edid.is_valid(data):
+        display["edid_valid"] = False
+        issues.append(_issue(path, "edid_invalid", _edid_problem(data)))
+    else:
+        display["edid_valid"] = True
+        ids = (edid.vendor_id(data), edid.product_id(data))
+        if ids != (display["vendor_id"], display["product_id"]):
+            issues.append(_issue(path, "edid_id_mismatch", "The EDID is for {:x}/{:x}".format(*ids)))
+    return (display, issues)
+
+def _edid_problem(data):
+    if not isinstance(data, (bytes, bytearray)):
+        return "IODisplayEDID is a {}, not data".format(type(data).__name__)
+    data = bytearray(data)
+    if len(data) < 128 or len(data) % 128:
+        return "IODisplayEDID is {:,} bytes - expected a multiple of 128".format(len(data))
+    if data[:8] != bytearray(b"\x00\xff\xff\xff\xff\xff\xff\x00"):
+        return "IODisplayEDID has a bad header"
+    bad = [i // 128 for i in range(0, len(data), 128) if edid.checksum(data[i:i+128]) != data[i+127]]
+    return "IODisplayEDID has a bad checksum in block{} {}".format("" if len(bad) == 1 else "s", ", ".join(str(x) for x in bad))
+
+def _check_args(args):
+    return check_file(*args)
+
+def scan(root):
+    # Walks root for the files to check - returns (jobs, issues) where jobs
+    # are check_file() args and issues are what the layout alone shows
+    jobs, issues = [], []
+    for name in sorted(os.listdir(root)):
+        path = os.path.join(root, name)
+        if name.endswith(_LEFTOVERS):
+            issues.append(_issue(path, "leftover", "Left behind by an interrupted write"))
+            continue
+        if not name.startswith("DisplayVendorID-"):
+            continue # Not ours - Apple keeps other things in Overrides
+        if _STAMP_RE.search(name):
+            issues.append(_issue(path, "stale_backup", "Timestamped backup copy - safe to remove once checked"))
+            continue
+        m = _VENDOR_RE.match(name)
+        if not m or not os.path.isdir(path):
+            issues.append(_issue(path, "bad_name", "Expected a DisplayVendorID-<hex> folder"))
+            continue
+        vendor = int(m.group(1), 16)
+        found = False
+        for file_name in sorted(os.listdir(path)):
+            file_path = os.path.join(path, file_name)
+            if file_name.endswith(_LEFTOVERS):
+                issues.append(_issue(file_path, "leftover", "Left behind by an interrupted write"))
+                continue
+            if not file_name.startswith("DisplayProductID-") or not os.path.isfile(file_path):
+                continue
+            if _STAMP_RE.search(file_name):
+                issues.append(_issue(file_path, "stale_backup", "Timestamped backup copy - safe to remove once checked"))
+                continue
+            m = _PRODUCT_RE.match(file_name)
+            if not m:
+                issues.append(_issue(file_path, "bad_name", "Expected a DisplayProductID-<hex> file"))
+                continue
+            found = True
+            jobs.append((file_path, vendor, int(m.group(1), 16)))
+        if not found:
+            issues.append(_issue(path, "empty_folder", "No DisplayProductID-<hex> overrides"))
+    return (jobs, issues)
+
+def validate(root, processes=None, chunksize=16, min_parallel=500):
+    # Returns the report dict for the Overrides tree at root.  Checking a
+    # file takes ~50us, so trees smaller than min_parallel files are checked
+    # in process rather than paying to start a pool.
+    start = time.time()
+    jobs, issues = scan(root)
+    displays = []
+    if processes == 1 or len(jobs) < max(chunksize, min_parallel):
+        results = [check_file(*job) for job in jobs]
+    else:
+        pool = multiprocessing.Pool(processes)
+        try:
+            results = pool.map(_check_args, jobs, chunksize)
+        finally:
+            pool.close()
+            pool.join()
+    for display, file_issues in results:
+        if display:
+            displays.append(display)
+        issues.extend(file_issues)
+    issues.sort(key=lambda x: (x["path"], x["code"]))
+    return {
+        "root": os.path.abspath(root),
+        "files": len(jobs),
+        "errors": sum(1 for x in issues if x["level"] == "error"),
+        "warnings": sum(1 for x in issues if x["level"] == "warning"),
+        "seconds": round(time.time() - start, 4),
+        "issues": issues,
+        "displays": displays
+    }
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m Scripts.validate")
+    parser.add_argument("root", nargs="?", default=DEFAULT_ROOT, help="the Overrides folder to check - default is {}".format(DEFAULT_ROOT))
+    parser.add_argument("-j", "--json", action="store_true", help="prints the report as JSON")
+    parser.add_argument("-p", "--processes", type=int, help="the number of processes to use - default is one per CPU")
+    parser.add_argument("-s", "--strict", action="store_true", help="exits with 1 on warnings as well as errors")
+    args = parser.parse_args()
+    if not os.path.isdir(args.root):
+        print("{} is not a folder".format(args.root))
+        exit(1)
+    report = validate(args.root, args.processes)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        for issue in report["issues"]:
+            print("{}: {} {}: {}".format(issue["path"], issue["level"], issue["code"], issue["message"]))
+        print("{:,} override{}, {:,} error{}, {:,} warning{} in {:.2f}s".format(
+            report["files"], "" if report["files"] == 1 else "s",
+            report["errors"], "" if report["errors"] == 1 else "s",
+            report["warnings"], "" if report["warnings"] == 1 else "s",
+            report["seconds"]
+        ))
+    exit(1 if report["errors"] or (args.strict and report["warnings"]) else 0)
+
+if __name__ == "__main__":
+    main()
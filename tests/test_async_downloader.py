@@ -0,0 +1,61 @@
+import os, sys, time, shutil, asyncio, tempfile, unittest
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from Scripts import testserver
+from Scripts.testserver import payload
+from Scripts.async_downloader import AsyncDownloader
+
+class AsyncDownloaderTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = testserver.TestServer().start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def test_resume(self):
+        path = os.path.join(self.folder, "file")
+        expected = b"".join(payload(10000))
+        with open(path, "wb") as f:
+            f.write(expected[:4000])
+        d = AsyncDownloader()
+        self.assertEqual(d.download_all([(self.server.url("/plain/10000"), path, None, True, True)]), [path])
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(), expected)
+
+    def test_resume_larger_than_remote(self):
+        # 416 with a different size - start over rather than fail
+        path = os.path.join(self.folder, "file")
+        with open(path, "wb") as f:
+            f.write(b"x" * 5000)
+        d = AsyncDownloader()
+        self.assertEqual(d.download_all([(self.server.url("/plain/1000"), path, None, True, True)]), [path])
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(), b"".join(payload(1000)))
+
+    def test_busy_host_does_not_hold_total(self):
+        # Two jobs on one host and one on another, with room for two at once
+        # but one per host - the other host's job shouldn't queue behind both
+        d = AsyncDownloader(concurrency=2, per_host=1)
+        url = self.server.url("/slow/40000?rate=100000")
+        other = url.replace("127.0.0.1", "localhost")
+        finished = {}
+        start = time.time()
+        async def fetch(name, url):
+            self.assertIsNotNone(await d.get_bytes(url))
+            finished[name] = time.time() - start
+        async def main():
+            await asyncio.gather(fetch("a1", url), fetch("a2", url), fetch("b", other))
+        asyncio.run(main())
+        self.assertLess(finished["b"], finished["a2"])
+
+if __name__ == "__main__":
+    unittest.main()
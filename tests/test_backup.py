@@ -0,0 +1,120 @@
+import os, sys, shutil, tempfile, unittest
+from io import StringIO
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import ForceRGB
+from Scripts import backup, plist, run
+
+class _LocalRun(run.Run):
+    # Runs everything for real, minus sudo
+    def run(self, comm, leave_on_fail=False):
+        return run.Run.run(self, dict(comm, sudo=False), leave_on_fail)
+
+class BackupStoreTests(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.dest = os.path.join(self.folder, "Overrides")
+        self.override = os.path.join(self.dest, "DisplayVendorID-610")
+        os.makedirs(self.override)
+        self.store = backup.BackupStore(os.path.join(self.folder, "Backups"))
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def _write(self, name, value):
+        with open(os.path.join(self.override, name), "wb") as f:
+            plist.dump(value, f)
+
+    def _objects(self):
+        return sum(len(files) for _, _, files in os.walk(self.store.objects))
+
+    def test_generations_share_objects(self):
+        self._write("DisplayProductID-a040", {"DisplayProductName": "A"})
+        self._write("DisplayProductID-a041", {"DisplayProductName": "B"})
+        first = self.store.add(self.override)
+        self.assertEqual(first, 1)
+        self.assertEqual(self._objects(), 2)
+        # Unchanged - the latest generation is handed back
+        self.assertEqual(self.store.add(self.override), first)
+        self._write("DisplayProductID-a041", {"DisplayProductName": "B2"})
+        second = self.store.add(self.override)
+        self.assertEqual(second, 2)
+        # Only the changed file is stored again
+        self.assertEqual(self._objects(), 3)
+        a, b = self.store.get(first), self.store.get(second)
+        self.assertEqual(a["files"]["DisplayProductID-a040"], b["files"]["DisplayProductID-a040"])
+        self.assertNotEqual(a["files"]["DisplayProductID-a041"], b["files"]["DisplayProductID-a041"])
+        self.assertEqual([g["id"] for g in self.store.generations()], [1, 2])
+        self.assertEqual(self.store.latest("DisplayVendorID-610"), 2)
+
+    def test_diff(self):
+        self._write("DisplayProductID-a040", {"DisplayProductName": "A", "Old": 1})
+        self._write("DisplayProductID-a041", {"DisplayProductName": "B"})
+        gen = self.store.add(self.override)
+        self._write("DisplayProductID-a040", {"DisplayProductName": "A2", "New": True})
+        os.remove(os.path.join(self.override, "DisplayProductID-a041"))
+        self._write("DisplayProductID-a042", {"DisplayProductName": "C"})
+        expected = [
+            "~ DisplayProductID-a040",
+            "    ~ DisplayProductName: 'A' -> 'A2'",
+            "    + New: True",
+            "    - Old",
+            "- DisplayProductID-a041",
+            "+ DisplayProductID-a042"
+        ]
+        self.assertEqual(sorted(self.store.diff(gen, dest=self.dest)), sorted(expected))
+        other = self.store.add(self.override)
+        self.assertEqual(sorted(self.store.diff(gen, other)), sorted(expected))
+        self.assertEqual(self.store.diff(other, dest=self.dest), [])
+
+    def test_invalid_generations(self):
+        for gen in ("7", "abc", "-1"):
+            self.assertIsNone(self.store.get(gen))
+            self.assertIsNone(self.store.stage(gen))
+            self.assertRaises(ValueError, self.store.diff, gen, dest=self.dest)
+
+class RestoreTests(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.rgb = ForceRGB.RGB()
+        self.rgb._b = backup.BackupStore(os.path.join(self.folder, "Backups"))
+        self.rgb._r = _LocalRun()
+        self.rgb.dest = os.path.join(self.folder, "Overrides")
+        self.override = os.path.join(self.rgb.dest, "DisplayVendorID-610")
+        os.makedirs(self.override)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def _quiet(self, func, *args):
+        out, sys.stdout = sys.stdout, StringIO()
+        try:
+            func(*args)
+        except SystemExit as e:
+            return (sys.stdout.getvalue(), e.code)
+        finally:
+            out, sys.stdout = sys.stdout, out
+        return (out.getvalue(), None)
+
+    def test_restore_deleted_file(self):
+        path = os.path.join(self.override, "DisplayProductID-a040")
+        with open(path, "wb") as f:
+            plist.dump({"DisplayProductName": "A"}, f)
+        gen = self.rgb.b.add(self.override)
+        os.remove(path)
+        output, code = self._quiet(self.rgb.restore_backup, str(gen))
+        self.assertIsNone(code, output)
+        with open(path, "rb") as f:
+            self.assertEqual(plist.load(f), {"DisplayProductName": "A"})
+        # The state it replaced was backed up first
+        self.assertEqual(self.rgb.b.get(self.rgb.b.latest("DisplayVendorID-610"))["files"], {})
+
+    def test_invalid_generation_messages(self):
+        for gen in ("9", "abc"):
+            self.assertEqual(self._quiet(self.rgb.restore_backup, gen), ("Generation {} does not exist.\n".format(gen), 1))
+            self.assertEqual(self._quiet(self.rgb.diff_backup, gen), ("Generation {} does not exist\n".format(gen), 1))
+
+if __name__ == "__main__":
+    unittest.main()
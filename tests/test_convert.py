@@ -0,0 +1,79 @@
+import os, sys, shutil, plistlib, tempfile, unittest
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from Scripts import convert, plist
+
+VALUES = {
+    "a.plist": {"DisplayProductName": "A", "IODisplayEDID": b"\x00\xff" * 64},
+    "sub/b.plist": {"list": [1, 2.5, "x"], "nested": {"ok": True}}
+}
+
+class ConvertTests(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.src = os.path.join(self.folder, "src")
+        self.dst = os.path.join(self.folder, "dst")
+        for rel, value in VALUES.items():
+            self._write(rel, plistlib.dumps(value))
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def _write(self, rel, data):
+        path = os.path.join(self.src, *rel.split("/"))
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, "wb") as f:
+            f.write(data)
+        return path
+
+    def _run(self, dst=None, fmt=plist.FMT_BINARY, **kwargs):
+        kwargs.setdefault("processes", 1)
+        return dict(
+            (os.path.relpath(path, self.src).replace(os.sep, "/"), status)
+            for path, status in convert.convert(self.src, dst, fmt, **kwargs)
+        )
+
+    def _read(self, folder, rel):
+        with open(os.path.join(folder, *rel.split("/")), "rb") as f:
+            return f.read()
+
+    def test_round_trip(self):
+        self.assertEqual(self._run(self.dst), dict((rel, "converted") for rel in VALUES))
+        for rel, value in VALUES.items():
+            data = self._read(self.dst, rel)
+            self.assertEqual(data[:8], b"bplist00")
+            self.assertEqual(plistlib.loads(data), value)
+        # And back to XML, through the process pool
+        back = os.path.join(self.folder, "back")
+        self.assertEqual(len(list(convert.convert(self.dst, back, plist.FMT_XML, processes=2))), len(VALUES))
+        for rel, value in VALUES.items():
+            self.assertEqual(self._read(back, rel), plistlib.dumps(value, sort_keys=False))
+
+    def test_manifest_skips_unchanged(self):
+        self._run(self.dst)
+        self.assertEqual(self._run(self.dst), dict((rel, "unchanged") for rel in VALUES))
+        # A changed file is picked up, the rest still skipped
+        self._write("a.plist", plistlib.dumps({"changed": 1}))
+        self.assertEqual(self._run(self.dst), {"a.plist": "converted", "sub/b.plist": "unchanged"})
+        self.assertEqual(plistlib.loads(self._read(self.dst, "a.plist")), {"changed": 1})
+        # force ignores the manifest
+        self.assertEqual(self._run(self.dst, force=True), dict((rel, "converted") for rel in VALUES))
+        # The manifest only counts for the format it was made for
+        self.assertEqual(self._run(self.dst, plist.FMT_XML), dict((rel, "converted") for rel in VALUES))
+
+    def test_errors_do_not_stop_the_batch(self):
+        self._write("broken.plist", plistlib.dumps({"a": 1})[:-20])
+        self._write("notes.txt", b"not a plist at all")
+        for processes in (1, 2):
+            results = self._run(self.dst, force=True, processes=processes)
+            self.assertTrue(results.pop("broken.plist").startswith("error"))
+            self.assertEqual(results.pop("notes.txt"), "skipped")
+            self.assertEqual(results, dict((rel, "converted") for rel in VALUES))
+            self.assertFalse(os.path.exists(os.path.join(self.dst, "broken.plist")))
+        # Failures aren't remembered - they're tried again next time
+        self.assertTrue(self._run(self.dst)["broken.plist"].startswith("error"))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,78 @@
+import os, sys, shutil, tempfile, unittest
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from Scripts import downloader, testserver
+from Scripts.async_downloader import AsyncDownloader
+
+class DownloaderTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = testserver.TestServer().start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.folder, "file")
+        self.d = downloader.Downloader(timeout=10)
+        del self.server.requests[:]
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def _partial(self, data):
+        with open(self.path, "wb") as f:
+            f.write(data)
+
+    def _contents(self):
+        with open(self.path, "rb") as f:
+            return f.read()
+
+    def _ranges(self):
+        return [r["headers"].get("Range") for r in self.server.requests]
+
+    def test_resume(self):
+        expected = testserver.payload_bytes(200000)
+        self._partial(expected[:70000])
+        self.assertEqual(self.d.stream_to_file(self.server.url("/plain/200000"), self.path, False, allow_resume=True), self.path)
+        self.assertEqual(self._contents(), expected)
+        self.assertEqual(self._ranges(), [None, "bytes=70000-"])
+
+    def test_resume_complete(self):
+        self._partial(testserver.payload_bytes(1000))
+        self.assertEqual(self.d.stream_to_file(self.server.url("/plain/1000"), self.path, False, allow_resume=True), self.path)
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_resume_larger_than_remote(self):
+        self._partial(b"x" * 5000)
+        self.assertEqual(self.d.stream_to_file(self.server.url("/plain/1000"), self.path, False, allow_resume=True), self.path)
+        self.assertEqual(self._contents(), testserver.payload_bytes(1000))
+
+    def test_range_not_satisfiable(self):
+        # The 416 the async path relies on, with the size in Content-Range
+        response = self.d.open_url(self.server.url("/plain/1000"), {"Range": "bytes=1000-"})
+        self.assertIsNone(response)
+        self._partial(testserver.payload_bytes(1000))
+        d = AsyncDownloader()
+        self.assertEqual(d.download_all([(self.server.url("/plain/1000"), self.path, None, True, True)]), [self.path])
+        self.assertEqual(self._ranges(), ["bytes=1000-", "bytes=1000-"])
+        self.assertEqual(self._contents(), testserver.payload_bytes(1000))
+
+    def test_truncated(self):
+        self.assertIsNone(self.d.stream_to_file(self.server.url("/truncated/100000"), self.path, False))
+
+    def test_redirects(self):
+        url = self.server.url("/redirect/3/plain/1K")
+        expected = testserver.payload_bytes(1024)
+        self.assertEqual(self.d.get_bytes(url, False), expected)
+        self.assertEqual(self.d.stream_to_file(url, self.path, False), self.path)
+        self.assertEqual(self._contents(), expected)
+        d = AsyncDownloader()
+        self.assertEqual(d.download_all([url]), [expected])
+        self.assertEqual(AsyncDownloader(max_redirects=2).download_all([url]), [None])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,112 @@
+import os, sys, json, shutil, tempfile, binascii, unittest
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import ForceRGB
+from Scripts import run, backup, store, downloader
+from Scripts.edid import build as _edid
+
+A = (0x610, 0xa040)
+B = (0x610, 0xa041) # Same vendor as A
+C = (0x611, 0xa042)
+
+def _ioreg(ids):
+    return "".join('+-o AppleDisplay  <class AppleDisplay>\n  {{\n    "DisplayVendorID" = {}\n    "DisplayProductID" = {}\n    "IODisplayEDID" = <{}>\n  }}\n'.format(
+        v, p, binascii.hexlify(_edid(v, p, "Mon {:x}".format(p))).decode("ascii")
+    ) for v, p in ids)
+
+class _ReplayedIoreg(object):
+    # Serves ioreg from a replayed Run fixture and runs everything else for
+    # real (without sudo) so installs land on disk
+    def __init__(self, fixture):
+        self.replay = run.Run()
+        self.replay.replay(fixture)
+        self.real = run.Run()
+
+    def run(self, comm, leave_on_fail=False):
+        if comm["args"][0] == "ioreg":
+            return self.replay.run(comm)
+        return self.real.run(dict(comm, sudo=False))
+
+class ForceRGBTests(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.dest = os.path.join(self.folder, "Overrides")
+        self.rgb = ForceRGB.RGB()
+        self.rgb._b = backup.BackupStore(os.path.join(self.folder, "Backups"))
+        self.rgb._r = run.Run()
+        self.rgb.dest = self.dest
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def _sequence(self, *captures):
+        path = os.path.join(self.folder, "ioreg.json")
+        commands = [{
+            "args": ["ioreg", "-l", "-w0", "-d0", "-r", "-c", "AppleDisplay"], "shell": False, "stream": False,
+            "output": _ioreg(ids), "error": "", "returncode": 0, "seconds": 0
+        } for ids in captures]
+        with open(path, "w") as f:
+            json.dump({"version": 1, "commands": commands}, f)
+        self.rgb._r = _ReplayedIoreg(path)
+        return len(captures)
+
+    def _installed(self, vendor):
+        folder = os.path.join(self.dest, "DisplayVendorID-{:x}".format(vendor))
+        return sorted(os.listdir(folder)) if os.path.isdir(folder) else []
+
+    def test_apply_keeps_other_products(self):
+        self.rgb.apply([_edid(A[0], A[1], "A")])
+        results = self.rgb.apply([_edid(B[0], B[1], "B")])
+        self.assertEqual(self._installed(0x610), ["DisplayProductID-a040", "DisplayProductID-a041"])
+        self.assertIsNone(results[0]["backup"])
+        # Replacing a file backs the folder up first
+        results = self.rgb.apply([_edid(B[0], B[1], "B")])
+        self.assertIsNotNone(results[0]["backup"])
+        self.assertEqual(self._installed(0x610), ["DisplayProductID-a040", "DisplayProductID-a041"])
+
+    def test_apply_bundle_keeps_other_products(self):
+        source = os.path.join(self.folder, "Source")
+        self.rgb.apply([_edid(B[0], B[1], "B"), _edid(C[0], C[1], "C")], dest=source)
+        path = os.path.join(self.folder, "overrides.frgb")
+        self.rgb.export_bundle(path, source)
+        self.rgb.apply([_edid(A[0], A[1], "A")])
+        installed = self.rgb.apply_bundle(path)
+        self.assertEqual(len(installed), 2)
+        self.assertEqual(self._installed(0x610), ["DisplayProductID-a040", "DisplayProductID-a041"])
+        self.assertEqual(self._installed(0x611), ["DisplayProductID-a042"])
+        # Nothing was replaced, so nothing was backed up
+        self.assertEqual(self.rgb.b.generations(), [])
+        # Replacing the folders is opt-in, and backs them up first
+        self.rgb.apply_bundle(path, replace=True)
+        self.assertEqual(self._installed(0x610), ["DisplayProductID-a041"])
+        self.assertEqual(len(self.rgb.b.generations()), 2)
+
+    def test_resolver_downloader(self):
+        self.rgb.limiter = downloader.RateLimiter(requests_per_second=10)
+        self.rgb.resolve_timeout = 3
+        self.rgb._store = store.ArtifactStore(os.path.join(self.folder, "Store"))
+        r = self.rgb._resolver()
+        self.assertEqual(r.d.timeout, 3)
+        self.assertIs(r.d.limiter, self.rgb.limiter)
+        self.assertTrue(all(x.d is r.d for x in r.sources))
+
+    def test_watch_same_vendor_hotplug(self):
+        polls = self._sequence([], [A], [A], [A, B], [A, B, C])
+        state = os.path.join(self.folder, "watch.json")
+        with open(os.devnull, "w") as devnull:
+            stdout, sys.stdout = sys.stdout, devnull
+            try:
+                code = self.rgb.watch(interval=0, polls=polls, state_path=state)
+            finally:
+                sys.stdout = stdout
+        self.assertEqual(code, 0)
+        self.assertEqual(self._installed(0x610), ["DisplayProductID-a040", "DisplayProductID-a041"])
+        self.assertEqual(self._installed(0x611), ["DisplayProductID-a042"])
+        with open(state) as f:
+            applied = json.load(f)[self.dest]
+        self.assertEqual(len(applied), 3)
+        self.assertTrue(all(os.path.exists(x["path"]) for x in applied.values()))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,115 @@
+import os, sys, shutil, tempfile, plistlib, unittest
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from Scripts import patcher, plist
+
+XML = b"""<?xml version="1.0" encoding="UTF-8"?>
+<!DOCTYPE plist PUBLIC "-//Apple//DTD PLIST 1.0//EN" "http://www.apple.com/DTDs/PropertyList-1.0.dtd">
+<plist version="1.0">
+<dict>
+	<key>DisplayProductID</key>
+	<integer>41024</integer>
+	<!-- hand edited -->
+	<key>DisplayProductName</key>
+	<string>Monitor</string>
+	<key>DisplayVendorID</key>
+	<integer>1552</integer>
+</dict>
+</plist>
+"""
+
+class PatcherTests(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def _file(self, name, data):
+        path = os.path.join(self.folder, name)
+        with open(path, "wb") as f:
+            f.write(data)
+        return path
+
+    def _read(self, path):
+        with open(path, "rb") as f:
+            return f.read()
+
+    def test_parse_value(self):
+        self.assertIs(patcher.parse_value("false"), False)
+        self.assertIs(patcher.parse_value("bool:yes"), True)
+        self.assertEqual(patcher.parse_value("0x10"), 16)
+        self.assertEqual(patcher.parse_value("int:7"), 7)
+        self.assertEqual(patcher.parse_value("real:1.5"), 1.5)
+        self.assertEqual(patcher.parse_value("str:12"), "12")
+        self.assertEqual(patcher.parse_value("Monitor"), "Monitor")
+        self.assertIsInstance(patcher.parse_value("none"), patcher._Delete)
+        self.assertEqual(patcher.parse_value("data:00ff"), plist.wrap_data(b"\x00\xff"))
+        self.assertRaises(ValueError, patcher.parse_value, "bool:maybe")
+        self.assertRaises(ValueError, patcher.parse_spec, "DisplayIsTV")
+
+    def test_is_set(self):
+        self.assertTrue(patcher.is_set(XML, "DisplayProductName", "Monitor"))
+        self.assertFalse(patcher.is_set(XML, "DisplayProductName", "Other"))
+        # Same value, different type
+        self.assertFalse(patcher.is_set(XML, "DisplayVendorID", "1552"))
+        self.assertFalse(patcher.is_set(XML, "DisplayIsTV", False))
+        self.assertTrue(patcher.is_set(XML, "DisplayIsTV", patcher.DELETE))
+        self.assertFalse(patcher.is_set(XML, "DisplayVendorID", patcher.DELETE))
+
+    def test_xml(self):
+        path = self._file("DisplayProductID-a040", XML)
+        changes = [("DisplayIsTV", False), ("DisplayProductName", "RGB"), ("DisplayVendorID", patcher.DELETE)]
+        self.assertEqual(patcher.patch_file(path, changes, dry_run=True), (path, "patched"))
+        self.assertEqual(self._read(path), XML)
+        self.assertEqual(patcher.patch_file(path, changes), (path, "patched"))
+        raw = self._read(path)
+        self.assertEqual(plistlib.loads(raw), {"DisplayProductID": 41024, "DisplayProductName": "RGB", "DisplayIsTV": False})
+        # Untouched entries keep their bytes
+        self.assertIn(b"\t<!-- hand edited -->\n", raw)
+        self.assertEqual(patcher.patch_file(path, changes), (path, "unchanged"))
+
+    def test_binary(self):
+        value = plistlib.loads(XML)
+        path = self._file("DisplayProductID-a040", plistlib.dumps(value, fmt=plistlib.FMT_BINARY))
+        changes = [("DisplayIsTV", False), ("DisplayVendorID", patcher.DELETE)]
+        self.assertEqual(patcher.patch_file(path, changes), (path, "patched"))
+        raw = self._read(path)
+        self.assertTrue(raw.startswith(b"bplist00"))
+        value.pop("DisplayVendorID")
+        value["DisplayIsTV"] = False
+        self.assertEqual(plistlib.loads(raw), value)
+        self.assertEqual(patcher.patch_file(path, changes), (path, "unchanged"))
+
+    def test_already_set(self):
+        binary = plistlib.dumps(plistlib.loads(XML), fmt=plistlib.FMT_BINARY)
+        changes = [("DisplayProductName", "Monitor"), ("DisplayVendorID", 1552), ("DisplayIsTV", patcher.DELETE)]
+        for name, data in (("xml", XML), ("binary", binary)):
+            path = self._file(name, data)
+            mtime = os.stat(path).st_mtime
+            self.assertEqual(patcher.patch_file(path, changes), (path, "unchanged"))
+            self.assertEqual(self._read(path), data)
+            self.assertEqual(os.stat(path).st_mtime, mtime)
+
+    def test_errors(self):
+        path = self._file("broken", b"not a plist")
+        self.assertTrue(patcher.patch_file(path, [("DisplayIsTV", False)])[1].startswith("error"))
+        path = self._file("array", plistlib.dumps([1], fmt=plistlib.FMT_BINARY))
+        self.assertEqual(patcher.patch_file(path, [("DisplayIsTV", False)])[1], "error: root is not a dictionary")
+
+    def test_patch(self):
+        folder = os.path.join(self.folder, "DisplayVendorID-610")
+        os.makedirs(folder)
+        for i in range(4):
+            with open(os.path.join(folder, "DisplayProductID-a04{}".format(i)), "wb") as f:
+                f.write(XML)
+        pattern = os.path.join(self.folder, "**", "DisplayProductID-*")
+        for processes, chunksize in ((1, 32), (2, 1)):
+            results = sorted(patcher.patch(pattern, [("DisplayIsTV", processes == 1)], processes=processes, chunksize=chunksize))
+            self.assertEqual(len(results), 4)
+            self.assertEqual(set(status for _, status in results), set(["patched"]))
+        self.assertEqual(set(status for _, status in patcher.patch(pattern, [("DisplayIsTV", False)])), set(["unchanged"]))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,223 @@
+import os, sys, shutil, struct, plistlib, tempfile, subprocess, unittest
+from io import BytesIO
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from Scripts import plist
+
+class BinaryTests(unittest.TestCase):
+
+    def test_self_reference_rejected(self):
+        # An array holding itself, and a dict whose only value is itself
+        for data in (
+            b"bplist00\xa1\x00\x08" + struct.pack(">6xBBQQQ", 1, 1, 1, 0, 10),
+            b"bplist00\xd1\x01\x00\x51a\x08\x0b" + struct.pack(">6xBBQQQ", 1, 1, 2, 0, 13)
+        ):
+            for backend in plist.backends():
+                plist.set_backend(backend)
+                try:
+                    self.assertRaises(plist.InvalidFileException, plist.loads, data)
+                finally:
+                    plist.set_backend("auto")
+
+    def test_backends_conform(self):
+        for name in plist.backends():
+            self.assertEqual(plist.check_backend(name), [], name)
+
+    def test_shared_containers_load(self):
+        # Interned containers are shared by reference, not cycles
+        inner = {"a": [1, 2]}
+        f = BytesIO()
+        plist.dump({"x": inner, "y": inner, "z": [inner, inner]}, f, fmt=plist.FMT_BINARY, intern_containers=True)
+        for backend in plist.backends():
+            plist.set_backend(backend)
+            try:
+                self.assertEqual(plist.loads(f.getvalue()), {"x": inner, "y": inner, "z": [inner, inner]})
+            finally:
+                plist.set_backend("auto")
+
+class LoadTests(unittest.TestCase):
+
+    def test_load_strings(self):
+        # load() takes the plist itself as well as a stream
+        value = {"a": [1, "b"]}
+        xml = plist.dumps(value)
+        f = BytesIO()
+        plist.dump(value, f, fmt=plist.FMT_BINARY)
+        for data in (xml, xml.encode("utf-8"), bytearray(xml.encode("utf-8")), u"\ufeff  " + xml, f.getvalue()):
+            self.assertEqual(plist.load(data), value)
+
+    def test_standalone(self):
+        # plist.py can be copied out and used without the rest of Scripts
+        out = subprocess.check_output(
+            [sys.executable, "-c", "import plist; print(plist.loads(plist.dumps({'a': [1]})))"],
+            cwd=os.path.join(ROOT, "Scripts")
+        )
+        self.assertEqual(out.strip(), b"{'a': [1]}")
+
+def _xml(body):
+    return (
+        b'<?xml version="1.0" encoding="UTF-8"?>\n'
+        b'<!DOCTYPE plist PUBLIC "-//Apple//DTD PLIST 1.0//EN" "http://www.apple.com/DTDs/PropertyList-1.0.dtd">\n'
+        b'<plist version="1.0">\n' + body + b'\n</plist>\n'
+    )
+
+class EditTests(unittest.TestCase):
+
+    def test_nested_keys_ignored(self):
+        data = _xml(b"<dict>\n\t<key>outer</key>\n\t<dict>\n\t\t<key>target</key>\n\t\t<integer>1</integer>\n\t</dict>\n\t<key>target</key>\n\t<integer>2</integer>\n</dict>")
+        span = plist.locate(data, "target")
+        self.assertEqual(data[span["start"]:span["end"]], b"<integer>2</integer>")
+        self.assertEqual(plist.loads(plist.edit(data, "target", 3)), {"outer": {"target": 1}, "target": 3})
+        # Only nested - so it's missing from the root and gets added there
+        data = _xml(b"<dict>\n\t<key>outer</key>\n\t<dict>\n\t\t<key>target</key>\n\t\t<integer>1</integer>\n\t</dict>\n</dict>")
+        self.assertIsNone(plist.locate(data, "target")["key"])
+        self.assertEqual(plist.loads(plist.edit(data, "target", 3)), {"outer": {"target": 1}, "target": 3})
+
+    def test_self_closing(self):
+        data = _xml(b"<dict>\n\t<key>a</key>\n\t<string/>\n\t<key>b</key>\n\t<dict/>\n\t<key>c</key>\n\t<true/>\n</dict>")
+        self.assertEqual(plist.loads(plist.edit(data, "a", "x")), {"a": "x", "b": {}, "c": True})
+        self.assertEqual(plist.loads(plist.edit(data, "b", {"d": 1})), {"a": "", "b": {"d": 1}, "c": True})
+        self.assertEqual(plist.loads(plist.edit(data, "b", remove=True)), {"a": "", "c": True})
+        self.assertEqual(plist.loads(plist.edit(data, "c", False)), {"a": "", "b": {}, "c": False})
+
+    def test_escaped_text(self):
+        data = _xml(b"<dict>\n\t<key>a&amp;b</key>\n\t<string>&lt;x&gt;</string>\n</dict>")
+        self.assertIsNotNone(plist.locate(data, "a&b")["key"])
+        self.assertIsNone(plist.locate(data, "a&amp;b")["key"])
+        new = plist.edit(data, "a&b", "<y> & z")
+        self.assertIn(b"&lt;y&gt; &amp; z", new)
+        self.assertEqual(plist.loads(new), {"a&b": "<y> & z"})
+        self.assertEqual(plist.loads(plist.edit(data, "<k>", 1)), {"a&b": "<x>", "<k>": 1})
+
+    def test_arrays(self):
+        data = _xml(b"<dict>\n\t<key>list</key>\n\t<array>\n\t\t<dict>\n\t\t\t<key>last</key>\n\t\t\t<integer>1</integer>\n\t\t</dict>\n\t\t<array/>\n\t</array>\n\t<key>last</key>\n\t<integer>2</integer>\n</dict>")
+        self.assertEqual(plist.loads(plist.edit(data, "list", [1, [2]])), {"list": [1, [2]], "last": 2})
+        self.assertEqual(plist.loads(plist.edit(data, "last", 3)), {"list": [{"last": 1}, []], "last": 3})
+
+    def test_insert_into_empty_dict(self):
+        for body in (b"<dict>\n</dict>", b"<dict></dict>", b"<dict/>"):
+            self.assertEqual(plist.loads(plist.edit(_xml(body), "a", [1, "b"])), {"a": [1, "b"]})
+
+    def test_remove(self):
+        data = plistlib.dumps({"a": 1, "b": {"c": 2}, "d": "e"})
+        new = plist.edit(data, "b", remove=True)
+        self.assertEqual(new, plistlib.dumps({"a": 1, "d": "e"}))
+        # Removing what isn't there changes nothing
+        self.assertEqual(plist.edit(new, "b", remove=True), new)
+
+    def test_matches_plistlib(self):
+        value = {"a": 1, "data": b"\x00\xff" * 40, "list": [1.5, "x", {"k": True}], "z": "last"}
+        data = plistlib.dumps(value)
+        for key, new in (("a", 2), ("data", b"\x01" * 100), ("list", []), ("list", {"n": [1]}), ("z", "<&>")):
+            expected = dict(value)
+            expected[key] = new
+            self.assertEqual(plist.edit(data, key, new), plistlib.dumps(expected))
+        self.assertEqual(plistlib.loads(plist.edit(data, "new", 5)), dict(value, new=5))
+
+    def test_edit_file(self):
+        folder = tempfile.mkdtemp()
+        try:
+            path = os.path.join(folder, "test.plist")
+            with open(path, "wb") as f:
+                f.write(plistlib.dumps({"a": 1}))
+            self.assertTrue(plist.edit_file(path, "a", 2))
+            self.assertFalse(plist.edit_file(path, "a", 2))
+            with open(path, "rb") as f:
+                self.assertEqual(f.read(), plistlib.dumps({"a": 2}))
+            self.assertEqual(os.listdir(folder), ["test.plist"])
+        finally:
+            shutil.rmtree(folder)
+
+    def test_binary_refused(self):
+        self.assertRaises(ValueError, plist.edit, plistlib.dumps({"a": 1}, fmt=plistlib.FMT_BINARY), "a", 2)
+
+class DataTests(unittest.TestCase):
+
+    def _blob(self, size):
+        return bytes(bytearray(i * 7 % 256 for i in range(size)))
+
+    def _sizes(self):
+        # Around a line's worth of bytes at each nesting level (57, 51 and
+        # 45), and past the decoder's batch size
+        sizes = set([0, 1, 2, 3, 4, 5, 6, 100, 1000, 200000])
+        for line in (57, 51, 45):
+            for lines in (1, 2, 3):
+                sizes.update((line * lines - 1, line * lines, line * lines + 1))
+        return sorted(sizes)
+
+    def test_xml_matches_plistlib(self):
+        for size in self._sizes():
+            data = self._blob(size)
+            for value in (data, {"data": data}, {"a": [data, {"b": data}]}):
+                self.assertEqual(plist.dumps(value).encode("utf-8"), plistlib.dumps(value), size)
+                f = BytesIO()
+                plist.dump(value, f, sort_keys=False)
+                self.assertEqual(plist.loads(f.getvalue()), value, size)
+
+    def test_batched_decode(self):
+        # Text split mid-quantum across batches still decodes
+        data = self._blob(1000)
+        decoder = plist._Base64Decoder()
+        decoder.batch_size = 7
+        text = plistlib.dumps(data).split(b"<data>")[1].split(b"</data>")[0].decode("ascii")
+        for i in range(0, len(text), 5):
+            decoder.feed(text[i:i + 5])
+        self.assertEqual(decoder.finish(), data)
+
+    def test_spill(self):
+        small, large = self._blob(100), self._blob(200000)
+        xml = plistlib.dumps({"small": small, "large": large})
+        value = plist.loads(xml, data_spill_size=1000)
+        self.assertIsInstance(value["small"], bytes)
+        self.assertNotIsInstance(value["large"], bytes)
+        self.assertEqual(value["small"], small)
+        self.assertEqual(value["large"][:], large)
+        # Spilled values write back out like any other data
+        self.assertEqual(plist.dumps(value).encode("utf-8"), xml)
+        self.assertEqual(plist.loads(xml), {"small": small, "large": large})
+        value["large"].close()
+
+class PlistCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.folder, "test.plist")
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def _write(self, path, value):
+        with open(path, "wb") as f:
+            plist.dump(value, f)
+
+    def test_replaced_file_is_reloaded(self):
+        cache = plist.PlistCache()
+        self._write(self.path, {"a": 1})
+        self.assertEqual(cache.load(self.path), {"a": 1})
+        self.assertEqual(cache.load(self.path), {"a": 1})
+        # Swapped in with a rename - a new inode, whatever the mtime says
+        temp = self.path + ".tmp"
+        self._write(temp, {"a": 2})
+        os.rename(temp, self.path)
+        self.assertEqual(cache.load(self.path), {"a": 2})
+        self.assertEqual(cache.stats()["hits"], 1)
+
+    def test_values_are_read_only(self):
+        for key in ("stat", "hash"):
+            cache = plist.PlistCache(key=key)
+            self._write(self.path, {"a": {"b": [1, 2]}})
+            value = cache.load(self.path)
+            for change in (
+                lambda: value.__setitem__("a", 1),
+                lambda: value.update(a=1),
+                lambda: value.__ior__({"a": 1}),
+                lambda: value["a"].pop("b")
+            ):
+                self.assertRaises(TypeError, change)
+            self.assertEqual(value, {"a": {"b": (1, 2)}})
+            copy = cache.load(self.path, copy=True)
+            copy["a"]["b"].append(3)
+            self.assertEqual(cache.load(self.path)["a"]["b"], (1, 2))
+
+if __name__ == "__main__":
+    unittest.main()
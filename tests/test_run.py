@@ -0,0 +1,144 @@
+import os, sys, json, time, shutil, signal, tempfile, threading, unittest
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from Scripts import run
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError:
+        return False
+    try:
+        with open("/proc/{}/stat".format(pid)) as f:
+            return f.read().rsplit(")", 1)[1].split()[0] != "Z"
+    except (IOError, OSError):
+        return True
+
+@unittest.skipIf(os.name == "nt", "needs sleep, yes and process groups")
+class RunTests(unittest.TestCase):
+
+    def setUp(self):
+        self.r = run.Run()
+
+    def test_timeout_kills(self):
+        start = time.time()
+        out = self.r.run({"args": ["sleep", "10"], "timeout": 0.5})
+        self.assertTrue(out.timed_out)
+        self.assertLess(time.time() - start, 3)
+
+    def test_timeout_kills_process_group(self):
+        # The backgrounded sleep is in the shell's group and goes with it
+        out = self.r.run({"args": "sleep 30 & echo $!; wait", "shell": True, "timeout": 0.5})
+        self.assertTrue(out.timed_out)
+        pid = int(out.output.split()[0])
+        end = time.time() + 2
+        while _alive(pid) and time.time() < end:
+            time.sleep(0.05)
+        self.assertFalse(_alive(pid))
+
+    def test_term_escalates_to_kill(self):
+        # TERM is ignored by the shell and (inherited) by yes
+        start = time.time()
+        out = self.r.run({"args": "trap '' TERM; yes > /dev/null", "shell": True, "timeout": 0.5})
+        self.assertTrue(out.timed_out)
+        self.assertEqual(out.returncode, -signal.SIGKILL)
+        self.assertLess(time.time() - start, 5)
+
+    def test_cancel_while_running(self):
+        threading.Timer(0.3, self.r.cancel).start()
+        start = time.time()
+        out = self.r.run([{"args": ["sleep", "10"]}, {"args": ["echo", "skipped"]}])
+        # Only the first ran, so it comes back on its own
+        self.assertTrue(out.cancelled)
+        self.assertLess(time.time() - start, 3)
+
+    def test_cancel_before_run(self):
+        self.r.cancel()
+        out = self.r.run({"args": ["sleep", "10"]})
+        self.assertTrue(out.cancelled)
+        # Only that run - the next one goes ahead
+        self.assertEqual(self.r.run({"args": ["echo", "hi"]}).output, "hi\n")
+
+@unittest.skipIf(os.name == "nt", "needs a POSIX shell")
+class CaptureTests(unittest.TestCase):
+
+    def setUp(self):
+        self.r = run.Run()
+
+    def test_large_output(self):
+        # Fills stdout's pipe, then stderr's - reading one at a time would hang
+        size = 4 * 1024 * 1024
+        command = "head -c {0} /dev/zero | tr '\\0' a; head -c {0} /dev/zero | tr '\\0' b >&2".format(size)
+        out = self.r.run({"args": command, "shell": True, "timeout": 30})
+        self.assertFalse(out.timed_out)
+        self.assertEqual((len(out.output), len(out.error)), (size, size))
+        self.assertEqual((set(out.output), set(out.error)), (set("a"), set("b")))
+
+    def test_capture_options(self):
+        command = "seq 1 10000"
+        expected = "".join("{}\n".format(i) for i in range(1, 10001))
+        out = self.r.run({"args": command, "shell": True, "max_output": 100})
+        self.assertEqual(out.output, expected[-100:])
+        out = self.r.run({"args": command, "shell": True, "spill": True})
+        self.assertEqual(out.output.read(), expected)
+        seen = []
+        out = self.r.run({"args": command, "shell": True, "keep": False, "callback": lambda name, text: seen.append(text)})
+        self.assertEqual((out.output, "".join(seen)), ("", expected))
+
+    def test_result_is_a_tuple(self):
+        out = self.r.run({"args": ["sh", "-c", "echo out; echo err >&2; exit 3"]})
+        output, error, code = out
+        self.assertEqual((output, error, code), ("out\n", "err\n", 3))
+        self.assertEqual(out, ("out\n", "err\n", 3))
+        self.assertIsInstance(out, tuple)
+        self.assertEqual((out[0], out[-1], out[:2]), ("out\n", 3, ("out\n", "err\n")))
+        self.assertEqual((out.output, out.error, out.returncode), out)
+        self.assertFalse(out.timed_out or out.cancelled)
+        self.assertEqual(self.r.run({"args": ["this-command-does-not-exist"]})[2], 1)
+
+class RecordTests(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.fixture = os.path.join(self.folder, "fixture.json")
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    @unittest.skipIf(os.name == "nt", "needs echo and ls")
+    def test_record_then_replay(self):
+        r = run.Run()
+        r.record(self.fixture)
+        r.run({"args": ["echo", "first"]})
+        r.run({"args": ["ls", self.folder]})
+        r.run({"args": ["sh", "-c", "echo oops >&2; exit 2"]})
+        r.run({"args": ["echo", "first"], "spill": True})
+        with open(self.fixture) as f:
+            commands = json.load(f)["commands"]
+        self.assertEqual(len(commands), 4)
+        self.assertEqual(commands[1]["output"], "fixture.json\n")
+        # Replayed with a different temp folder - it's matched by <tmp>
+        other = tempfile.mkdtemp()
+        try:
+            r = run.Run()
+            r.replay(self.fixture)
+            self.assertEqual(r.run({"args": ["echo", "first"]}), ("first\n", "", 0))
+            self.assertEqual(r.run({"args": ["ls", other]}), ("fixture.json\n", "", 0))
+            self.assertEqual(r.run({"args": ["sh", "-c", "echo oops >&2; exit 2"]}), ("", "oops\n", 2))
+            # The second recording, then the last one repeats
+            self.assertEqual(r.run({"args": ["echo", "first"]}), ("first\n", "", 0))
+            self.assertEqual(r.run({"args": ["echo", "first"], "max_output": 3}), ("st\n", "", 0))
+            self.assertEqual(r.run({"args": ["echo", "other"]})[2], 127)
+        finally:
+            shutil.rmtree(other)
+
+    def test_temp_placeholder(self):
+        r = run.Run()
+        temp = tempfile.gettempdir()
+        key = r._fixture_key(["cp", os.path.join(temp, "abc123", "x"), "/Library/y"], False)
+        self.assertEqual(json.loads(key), [False, ["cp", "<tmp>" + os.sep + "x", "/Library/y"]])
+        key = r._fixture_key("rm -rf {}".format(os.path.join(temp, "ForceRGB-1")), True)
+        self.assertEqual(json.loads(key), [True, "rm -rf <tmp>"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+import os, sys, unittest
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from Scripts import sources, downloader, testserver
+
+class _CountingDownloader(downloader.Downloader):
+    def __init__(self, **kwargs):
+        downloader.Downloader.__init__(self, **kwargs)
+        self.opened = []
+
+    def open_url(self, url, headers = None):
+        self.opened.append(url)
+        return downloader.Downloader.open_url(self, url, headers)
+
+class _Response(object):
+    def __init__(self, etag):
+        self.headers = {"ETag": etag}
+
+    def getcode(self):
+        return 200
+
+    def close(self):
+        pass
+
+class _ETagDownloader(object):
+    def __init__(self, etag):
+        self.etag = etag
+
+    def open_url(self, url, headers = None):
+        return _Response(self.etag)
+
+class SourcesTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = testserver.TestServer().start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def test_resolver_shares_downloader(self):
+        d = _CountingDownloader()
+        urls = [self.server.url("/plain/10"), self.server.url("/plain/20")]
+        r = sources.Resolver(urls + ["gist", sources.HTTPSource(self.server.url("/plain/30"))], ttl=0, d=d)
+        self.assertTrue(all(x.d is d for x in r.sources if hasattr(x, "d")))
+        self.assertEqual(r.resolve()["url"], urls[0])
+        self.assertIn(urls[0], d.opened)
+
+    def test_resolver_default_downloader(self):
+        r = sources.Resolver(["gist", self.server.url("/plain/10")], timeout=2, ttl=0)
+        self.assertEqual(r.d.timeout, 2)
+        self.assertTrue(all(x.d is r.d for x in r.sources))
+
+    def test_etag_revision(self):
+        for etag, revision in (
+            ('"abc"', "abc"),
+            ('W/"abc"', "abc"),
+            ('W/"W/abc"', "W/abc"),
+            ('"WWabc/"', "WWabc/"),
+            ('W/""', None)
+        ):
+            source = sources.HTTPSource("http://mirror/patch-edid.rb", _ETagDownloader(etag))
+            self.assertEqual(source.probe(1)["revision"], revision)
+
+if __name__ == "__main__":
+    unittest.main()
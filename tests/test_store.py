@@ -0,0 +1,135 @@
+import os, sys, shutil, tempfile, unittest
+from io import StringIO
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import ForceRGB
+from Scripts import store
+
+class ArtifactStoreTests(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.store = store.ArtifactStore(os.path.join(self.folder, "Store"))
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def _file(self, name, data):
+        path = os.path.join(self.folder, name)
+        with open(path, "wb") as f:
+            f.write(data)
+        return path
+
+    def _read(self, path):
+        with open(path, "rb") as f:
+            return f.read()
+
+    def test_add_and_path(self):
+        first = self.store.add("patch-edid.rb", self._file("one.rb", b"one"), source="first")
+        self.assertEqual(len(first), 12)
+        self.assertEqual(self.store.current("patch-edid.rb"), first)
+        self.assertEqual(self._read(self.store.path("patch-edid.rb")), b"one")
+        second = self.store.add("patch-edid.rb", self._file("two.rb", b"two"), version="abc")
+        self.assertEqual(second, "abc")
+        self.assertEqual(self._read(self.store.path("patch-edid.rb")), b"two")
+        # Older versions stay reachable through the manifest
+        self.assertEqual(self._read(self.store.path("patch-edid.rb", first)), b"one")
+        self.assertEqual(self.store.manifest()["patch-edid.rb"][first]["source"], "first")
+        self.assertIsNone(self.store.path("patch-edid.rb", "missing"))
+        self.assertIsNone(self.store.path("missing"))
+
+    def test_add_only_current(self):
+        self.store.add("patch-edid.rb", self._file("one.rb", b"one"), version="1")
+        self.store.add("patch-edid.rb", self._file("two.rb", b"two"), version="2", make_current=False)
+        self.assertEqual(self.store.current("patch-edid.rb"), "1")
+        # A fresh instance reads the same index back
+        other = store.ArtifactStore(self.store.root)
+        self.assertEqual(other.current("patch-edid.rb"), "1")
+        self.assertEqual(self._read(other.path("patch-edid.rb", "2")), b"two")
+
+    def test_same_content_shares_object(self):
+        self.store.add("a", self._file("one.rb", b"same"))
+        self.store.add("b", self._file("two.rb", b"same"))
+        self.assertEqual(len(os.listdir(self.store.objects)), 1)
+
+    def test_corrupted_object_rejected(self):
+        self.store.add("patch-edid.rb", self._file("one.rb", b"one"))
+        path = self.store.path("patch-edid.rb")
+        with open(path, "wb") as f:
+            f.write(b"tampered")
+        self.assertIsNone(self.store.path("patch-edid.rb"))
+        os.remove(path)
+        self.assertIsNone(self.store.path("patch-edid.rb"))
+
+    def test_corrupted_index(self):
+        self.store.add("patch-edid.rb", self._file("one.rb", b"one"))
+        with open(self.store.index_path, "w") as f:
+            f.write("{not json")
+        self.assertIsNone(store.ArtifactStore(self.store.root).path("patch-edid.rb"))
+
+    def test_seed(self):
+        other = store.ArtifactStore(os.path.join(self.folder, "Fleet"))
+        other.add("patch-edid.rb", self._file("one.rb", b"one"), version="1")
+        other.add("patch-edid.rb", self._file("two.rb", b"two"), version="2")
+        self.store.add("override-template.plist", self._file("t.plist", b"template"), version="t")
+        self.assertEqual(self.store.seed(other.root), 2)
+        self.assertEqual(self.store.current("patch-edid.rb"), "2")
+        self.assertEqual(self.store.current("override-template.plist"), "t")
+        self.assertEqual(self._read(self.store.path("patch-edid.rb", "1")), b"one")
+
+class OfflineTests(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.rgb = ForceRGB.RGB()
+        self.rgb._store = store.ArtifactStore(os.path.join(self.folder, "Store"))
+        self.rgb.scripts = os.path.join(self.folder, "Scripts")
+        self.rgb.offline = True
+        os.makedirs(self.rgb.scripts)
+        self.name = os.path.basename(self.rgb.url)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def _quiet(self, func, *args):
+        stdout, sys.stdout = sys.stdout, StringIO()
+        try:
+            try:
+                return func(*args)
+            except SystemExit as e:
+                return e.code
+        finally:
+            sys.stdout = stdout
+
+    def test_script_from_store(self):
+        source = os.path.join(self.folder, "patch.rb")
+        with open(source, "wb") as f:
+            f.write(b"# patch")
+        self._quiet(self.rgb.seed_store, source)
+        path = self._quiet(self.rgb._check_script)
+        self.assertEqual(path, os.path.join(self.rgb.scripts, self.name))
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(), b"# patch")
+
+    def test_missing_script(self):
+        self.assertIsNone(self._quiet(self.rgb._check_script))
+        self.assertEqual(os.listdir(self.rgb.scripts), [])
+
+    def test_corrupted_script(self):
+        source = os.path.join(self.folder, "patch.rb")
+        with open(source, "wb") as f:
+            f.write(b"# patch")
+        self._quiet(self.rgb.seed_store, source)
+        with open(self.rgb.store.path(self.name), "wb") as f:
+            f.write(b"# tampered")
+        self.assertIsNone(self._quiet(self.rgb._check_script))
+
+    def test_seed_template_must_be_dict(self):
+        path = os.path.join(self.folder, "template.plist")
+        with open(path, "wb") as f:
+            f.write(b'<?xml version="1.0" encoding="UTF-8"?>\n<plist version="1.0">\n<array/>\n</plist>\n')
+        self.assertEqual(self._quiet(self.rgb.seed_store, path), 1)
+        self.assertIsNone(self.rgb.store.current("override-template.plist"))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+import os, sys, shutil, tempfile, unittest
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from Scripts import validate, plist, edid
+
+def _override(vendor, product, data=None, name="Test"):
+    value = {"DisplayVendorID": vendor, "DisplayProductID": product, "DisplayProductName": name}
+    value["IODisplayEDID"] = edid.build(vendor, product, name) if data is None else data
+    return value
+
+class ValidateTests(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def _write(self, rel, value=None, raw=None):
+        path = os.path.join(self.root, *rel.split("/"))
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, "wb") as f:
+            if raw is not None:
+                f.write(raw)
+            else:
+                plist.dump(value, f, fmt=plist.FMT_BINARY)
+        return path
+
+    def _codes(self, report):
+        return sorted((os.path.relpath(x["path"], self.root).replace(os.sep, "/"), x["code"]) for x in report["issues"])
+
+    def test_clean(self):
+        self._write("DisplayVendorID-610/DisplayProductID-a040", _override(0x610, 0xa040))
+        self._write("DisplayVendorID-610/DisplayProductID-a041.plist", _override(0x610, 0xa041))
+        os.makedirs(os.path.join(self.root, "Other"))
+        report = validate.validate(self.root)
+        self.assertEqual((report["files"], report["errors"], report["warnings"]), (2, 0, 0))
+        self.assertTrue(all(d["edid_valid"] for d in report["displays"]))
+
+    def _broken_tree(self):
+        bad_checksum = bytearray(edid.build(0x611, 0x3))
+        bad_checksum[127] ^= 0xFF
+        self._write("DisplayVendorID-611/DisplayProductID-1", raw=b"not a plist")
+        self._write("DisplayVendorID-611/DisplayProductID-2", ["not", "a", "dict"])
+        self._write("DisplayVendorID-611/DisplayProductID-3", _override(0x611, 0x3, bytes(bad_checksum)))
+        self._write("DisplayVendorID-611/DisplayProductID-4", {"DisplayVendorID": 0x611, "IODisplayEDID": edid.build(0x611, 0x4)})
+        self._write("DisplayVendorID-611/DisplayProductID-5", _override(0x612, 0x5))
+        self._write("DisplayVendorID-611/DisplayProductID-6", _override(0x611, 0x7))
+        self._write("DisplayVendorID-611/DisplayProductID-8", _override(0x611, 0x8, edid.build(0x611, 0x9)))
+        self._write("DisplayVendorID-611/DisplayProductID-a", {"DisplayVendorID": 0x611, "DisplayProductID": 0xa})
+        self._write("DisplayVendorID-611/DisplayProductID-b-2024-01-02 03.04.05", _override(0x611, 0xb))
+        self._write("DisplayVendorID-611/DisplayProductID-c.tmp", raw=b"")
+        self._write("DisplayVendorID-611/DisplayProductID-zz", _override(0x611, 0xd))
+        self._write("DisplayVendorID-613-2024-01-02 03.04.05/DisplayProductID-1", _override(0x613, 0x1))
+        self._write("DisplayVendorID-xyz/DisplayProductID-1", _override(0x614, 0x1))
+        self._write("DisplayVendorID-615.converting", raw=b"")
+        os.makedirs(os.path.join(self.root, "DisplayVendorID-616"))
+
+    def test_issues(self):
+        self._broken_tree()
+        expected = [
+            ("DisplayVendorID-611/DisplayProductID-1", "parse_error"),
+            ("DisplayVendorID-611/DisplayProductID-2", "not_a_dict"),
+            ("DisplayVendorID-611/DisplayProductID-3", "edid_invalid"),
+            ("DisplayVendorID-611/DisplayProductID-4", "edid_id_mismatch"),
+            ("DisplayVendorID-611/DisplayProductID-4", "missing_key"),
+            ("DisplayVendorID-611/DisplayProductID-5", "vendor_mismatch"),
+            ("DisplayVendorID-611/DisplayProductID-6", "product_mismatch"),
+            ("DisplayVendorID-611/DisplayProductID-8", "edid_id_mismatch"),
+            ("DisplayVendorID-611/DisplayProductID-a", "missing_edid"),
+            ("DisplayVendorID-611/DisplayProductID-b-2024-01-02 03.04.05", "stale_backup"),
+            ("DisplayVendorID-611/DisplayProductID-c.tmp", "leftover"),
+            ("DisplayVendorID-611/DisplayProductID-zz", "bad_name"),
+            ("DisplayVendorID-613-2024-01-02 03.04.05", "stale_backup"),
+            ("DisplayVendorID-615.converting", "leftover"),
+            ("DisplayVendorID-616", "empty_folder"),
+            ("DisplayVendorID-xyz", "bad_name")
+        ]
+        report = validate.validate(self.root)
+        self.assertEqual(self._codes(report), sorted(expected))
+        # Every code is covered
+        self.assertEqual(set(code for _, code in expected), set(validate.ISSUES))
+        self.assertEqual(report["errors"], sum(1 for _, code in expected if validate.ISSUES[code] == "error"))
+        # The process pool gives the same report
+        pooled = validate.validate(self.root, processes=2, chunksize=1, min_parallel=1)
+        self.assertEqual(self._codes(pooled), self._codes(report))
+        self.assertEqual(pooled["displays"], report["displays"])
+
+if __name__ == "__main__":
+    unittest.main()